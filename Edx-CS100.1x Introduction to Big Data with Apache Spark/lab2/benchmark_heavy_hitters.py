@@ -0,0 +1,98 @@
+""" Accuracy and throughput of SpaceSaving top-K against lab2's exact top-K.
+
+Parses the log once (locally, with ``log_parser``), then for ``topEndpoints``, ``topTenErrURLs``,
+``badEndpointsTop20`` and ``errHostsTop25`` compares the exact path (count every key, sort) with
+SpaceSaving summaries of each capacity. The keys are split into ``--partitions`` parts as Spark
+would; each part is summarized, and the summaries are merged. Reported per question and method:
+
+* keys/sec of counting;
+* records shuffled: distinct keys per part for ``reduceByKey`` (after its map-side combine), and
+  at most ``capacity`` counters per part for the summaries;
+* recall: the fraction of the exact top K found;
+* the largest overestimate among the reported counts;
+* the number of keys guaranteed to be in the true top K;
+* whether every true count lies within the reported bounds.
+
+    python benchmark_heavy_hitters.py --log data/cs100/lab2/apache.access.log.PROJECT
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import time
+from collections import Counter
+
+from heavy_hitters import SpaceSaving
+from log_parser import parseLogPartition
+
+QUESTIONS = [('topEndpoints', 10, lambda log: log.endpoint, lambda log: True),
+             ('topTenErrURLs', 10, lambda log: log.endpoint, lambda log: log.response_code != 200),
+             ('badEndpointsTop20', 20, lambda log: log.endpoint,
+              lambda log: log.response_code == 404),
+             ('errHostsTop25', 25, lambda log: log.host, lambda log: log.response_code == 404)]
+
+
+def exactTopK(parts, k):
+    """ Exact counts and top k, like reduceByKey and takeOrdered
+    Returns:
+        tuple: (Counter of all keys, top k (key, count) pairs, records shuffled, seconds)
+    """
+    start = time.time()
+    partCounts = [Counter(part) for part in parts]
+    counts = Counter()
+    for partCount in partCounts:
+        counts.update(partCount)
+    top = sorted(counts.items(), key=lambda s: -s[1])[:k]
+    return counts, top, sum(len(partCount) for partCount in partCounts), time.time() - start
+
+
+def approximateTopK(parts, k, capacity):
+    """ SpaceSaving top k over summaries of the parts, merged
+    Returns:
+        tuple: (list of HeavyHitter, records shuffled, seconds)
+    """
+    start = time.time()
+    summaries = [SpaceSaving(capacity).update(part) for part in parts]
+    shuffled = sum(len(summary.counts) for summary in summaries)
+    merged = SpaceSaving(capacity)
+    for summary in summaries:
+        merged.merge(summary)
+    return merged.topK(k), shuffled, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--log', default=os.path.join('data', 'cs100', 'lab2',
+                                                      'apache.access.log.PROJECT'))
+    parser.add_argument('--partitions', type=int, default=8)
+    parser.add_argument('--capacities', type=int, nargs='+', default=[100, 500, 2000])
+    args = parser.parse_args()
+
+    with io.open(args.log, encoding='utf-8', errors='replace') as f:
+        lines = [line.rstrip('\r\n') for line in f]
+    logs = [log for log, parsed in parseLogPartition(lines) if parsed]
+    print('%d parsed log lines' % len(logs))
+    print('%-18s %-14s %12s %10s %7s %10s %11s %7s' % ('question', 'method', 'keys/sec',
+                                                       'shuffled', 'recall', 'max over',
+                                                       'guaranteed', 'bounds'))
+    for name, k, key, where in QUESTIONS:
+        keys = [key(log) for log in logs if where(log)]
+        parts = [keys[i::args.partitions] for i in range(args.partitions)]
+        counts, exact, shuffled, seconds = exactTopK(parts, k)
+        print('%-18s %-14s %12.0f %10d %7.2f %10d %11d %7s' % (
+            name, 'exact', len(keys) / max(seconds, 1e-9), shuffled, 1.0, 0, len(exact), 'yes'))
+        exactKeys = set(topKey for topKey, _ in exact)
+        for capacity in args.capacities:
+            top, shuffled, seconds = approximateTopK(parts, k, capacity)
+            recall = len(exactKeys & set(hitter.key for hitter in top)) / float(len(exactKeys))
+            over = max([hitter.count - counts[hitter.key] for hitter in top] or [0])
+            bounded = all(hitter.count - hitter.error <= counts[hitter.key] <= hitter.count
+                          for hitter in top)
+            print('%-18s %-14s %12.0f %10d %7.2f %10d %11d %7s' % (
+                name, 'capacity=%d' % capacity, len(keys) / max(seconds, 1e-9), shuffled, recall,
+                over, sum(hitter.guaranteed for hitter in top), 'yes' if bounded else 'NO'))
+
+
+if __name__ == '__main__':
+    main()
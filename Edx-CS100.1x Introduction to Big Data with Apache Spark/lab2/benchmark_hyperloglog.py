@@ -0,0 +1,79 @@
+""" Time and accuracy of HyperLogLog distinct counts against lab2's exact ones.
+
+Parses the log once, then for unique hosts, daily unique hosts and hosts per endpoint times the
+lab's exact computation (``distinct().count()``, ``groupByKey()`` with ``len(set(...))``) and
+the sketches at each precision, and reports the relative error of the estimates (the error report
+of ``hyperloglog.distinctErrorReport``) next to the expected standard error.
+
+    python benchmark_hyperloglog.py --log data/cs100/lab2/apache.access.log.PROJECT \\
+                                    --precisions 10 12 14
+"""
+from __future__ import print_function
+
+import argparse
+import math
+import os
+import time
+
+from hyperloglog import approxDistinct, approxDistinctByKey, distinctErrorReport
+from log_parser import parseLogPartition
+
+
+def timed(function, *args):
+    """ (result, seconds) of a call """
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def exactDistinctByKey(pairRDD):
+    """ The lab's per-key distinct count: groupByKey, then the size of a set per key """
+    return pairRDD.groupByKey().map(lambda x: (x[0], len(set(x[1])))).collect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--log', default=os.path.join('data', 'cs100', 'lab2',
+                                                      'apache.access.log.PROJECT'))
+    parser.add_argument('--master', default='local[*]')
+    parser.add_argument('--precisions', type=int, nargs='+', default=[10, 12, 14])
+    args = parser.parse_args()
+
+    from pyspark import SparkContext
+
+    sc = SparkContext(args.master, 'benchmark_hyperloglog')
+    try:
+        access_logs = (sc.textFile(args.log)
+                       .mapPartitions(parseLogPartition)
+                       .filter(lambda s: s[1] == 1)
+                       .map(lambda s: s[0])
+                       .cache())
+        print('%d parsed log lines' % access_logs.count())
+        hosts = access_logs.map(lambda log: (None, log.host))
+        dayHosts = access_logs.map(lambda log: (log.date_time.day, log.host))
+        endpointHosts = access_logs.map(lambda log: (log.endpoint, log.host))
+
+        print('%-22s %-9s %9s %13s %13s %9s' % ('count', 'method', 'seconds', 'mean |error|',
+                                               'max |error|', 'std error'))
+        for name, pairRDD in (('unique hosts', hosts), ('daily unique hosts', dayHosts),
+                              ('hosts per endpoint', endpointHosts)):
+            if name == 'unique hosts':
+                _, seconds = timed(lambda: pairRDD.values().distinct().count())
+            else:
+                _, seconds = timed(exactDistinctByKey, pairRDD)
+            print('%-22s %-9s %9.2f' % (name, 'exact', seconds))
+            for precision in args.precisions:
+                if name == 'unique hosts':
+                    _, seconds = timed(approxDistinct, pairRDD.values(), precision)
+                else:
+                    _, seconds = timed(lambda: approxDistinctByKey(pairRDD, precision).collect())
+                errors = [abs(error) for _, _, _, error in distinctErrorReport(pairRDD, precision)]
+                print('%-22s %-9s %9.2f %12.2f%% %12.2f%% %8.2f%%' % (
+                    name, 'p=%d' % precision, seconds, 100.0 * sum(errors) / len(errors),
+                    100.0 * max(errors), 100.0 * 1.04 / math.sqrt(1 << precision)))
+    finally:
+        sc.stop()
+
+
+if __name__ == '__main__':
+    main()
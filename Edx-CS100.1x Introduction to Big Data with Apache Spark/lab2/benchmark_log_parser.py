@@ -0,0 +1,123 @@
+""" Lines per second of lab2's regex + Row parser and of log_parser's fast parser.
+
+Parses the same lines with ``parseApacheLogLine`` as written in the lab and with
+``log_parser.parseLogPartition``, checks that every result is identical (same valid/invalid flag,
+equal tuples and equal fields), and prints the throughput of each. Runs locally, without Spark,
+since per-line parsing is what limits ``parseLogs``.
+
+    python benchmark_log_parser.py --log data/cs100/lab2/apache.access.log.PROJECT
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import re
+import time
+
+from pyspark.sql import Row
+
+from log_parser import APACHE_ACCESS_LOG_PATTERN, AccessLog, parse_apache_time, parseLogPartition
+
+try:
+    long
+except NameError:  # Python 3
+    long = int
+
+
+def parseApacheLogLine(logline):
+    """ Parse a line in the Apache Common Log format (lab2's version)
+    Args:
+        logline (str): a line of text in the Apache Common Log format
+    Returns:
+        tuple: either a dictionary containing the parts of the Apache Access Log and 1,
+               or the original invalid log line and 0
+    """
+    match = re.search(APACHE_ACCESS_LOG_PATTERN, logline)
+    if match is None:
+        return (logline, 0)
+    size_field = match.group(9)
+    if size_field == '-':
+        size = long(0)
+    else:
+        size = long(match.group(9))
+    return (Row(host=match.group(1),
+                client_identd=match.group(2),
+                user_id=match.group(3),
+                date_time=parse_apache_time(match.group(4)),
+                method=match.group(5),
+                endpoint=match.group(6),
+                protocol=match.group(7),
+                response_code=int(match.group(8)),
+                content_size=size), 1)
+
+
+def readLines(filename, maxLines=None):
+    """ Lines of a log file without their line endings, like sc.textFile """
+    lines = []
+    with io.open(filename, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            lines.append(line.rstrip('\r\n'))
+            if maxLines is not None and len(lines) >= maxLines:
+                break
+    return lines
+
+
+def timeParser(parsePartition, lines, repeat):
+    """ Best of repeat runs of a parser over the lines
+    Returns:
+        tuple: (results of the last run, best time in seconds)
+    """
+    best = None
+    for attempt in range(repeat):
+        start = time.time()
+        results = list(parsePartition(lines))
+        seconds = time.time() - start
+        best = seconds if best is None else min(best, seconds)
+    return results, best
+
+
+def differences(expected, actual):
+    """ Indices of the lines whose results differ
+
+    Parsed records are compared field by field: Row only sorts its fields on Spark < 3.0, so
+    comparing the records themselves depends on the Spark version.
+    """
+    different = []
+    for index, ((left, leftFlag), (right, rightFlag)) in enumerate(zip(expected, actual)):
+        if leftFlag != rightFlag:
+            different.append(index)
+        elif leftFlag == 1:
+            if any(getattr(left, field) != getattr(right, field) for field in AccessLog._fields):
+                different.append(index)
+        elif left != right:
+            # Both failed: the results are the raw lines
+            different.append(index)
+    return different
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--log', default=os.path.join('data', 'cs100', 'lab2',
+                                                      'apache.access.log.PROJECT'))
+    parser.add_argument('--lines', type=int, default=None, help='parse only the first lines')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    lines = readLines(args.log, args.lines)
+    expected, regexSeconds = timeParser(lambda part: (parseApacheLogLine(line) for line in part),
+                                        lines, args.repeat)
+    actual, fastSeconds = timeParser(parseLogPartition, lines, args.repeat)
+    different = differences(expected, actual)
+
+    print('%d lines, %d failed to parse' % (len(lines), sum(1 for _, ok in expected if not ok)))
+    print('%-14s %14s %8s' % ('parser', 'lines/sec', 'speedup'))
+    print('%-14s %14.0f %7.1fx' % ('regex + Row', len(lines) / regexSeconds, 1.0))
+    print('%-14s %14.0f %7.1fx' % ('fast', len(lines) / fastSeconds, regexSeconds / fastSeconds))
+    print('Identical results: %s' % (not different))
+    for index in different[:10]:
+        print('Differs: %r' % lines[index])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+""" Approximate top-K (heavy hitters) with fixed-size, mergeable SpaceSaving summaries.
+
+``topEndpoints``, ``topTenErrURLs``, ``badEndpointsTop20`` and ``errHostsTop25`` each count every
+distinct key with ``reduceByKey`` (shuffling one count per key and partition) to keep the top
+10-25. A ``SpaceSaving`` summary monitors at most ``capacity`` keys. When a new key arrives and the
+summary is full, the key with the smallest count is replaced and the new key inherits that count
+as its possible overestimation. Each reported count is therefore an upper bound, and count - error
+is a lower bound. Summaries of different partitions (or of successive streaming batches) merge
+into a summary with the same guarantees, so only ``capacity`` counters per partition travel:
+
+    topK(access_logs.map(lambda log: log.endpoint), 10)                              # topEndpoints
+    topK(badRecords.map(lambda log: log.host), 25)                                   # errHostsTop25
+    summary = trackStream(logsDStream.map(lambda log: log.endpoint), capacity=1000)  # streaming
+"""
+import heapq
+import itertools
+from collections import Counter, namedtuple
+
+DEFAULT_CAPACITY = 1000
+
+# count is an upper bound of the true count and count - error a lower bound; guaranteed is True
+# when the key is certainly among the true top K
+HeavyHitter = namedtuple('HeavyHitter', ['key', 'count', 'error', 'guaranteed'])
+
+
+class SpaceSaving(object):
+    """ SpaceSaving summary of a stream of keys, monitoring at most capacity keys """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """ Empty summary
+        Args:
+            capacity (int): number of monitored keys; keys whose true count exceeds
+                            (number of keys seen) / capacity are always monitored
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be positive, not %r' % (capacity,))
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # Upper bound of the true count of any key that is not monitored
+        self.floor = 0
+        self._rebuildHeap()
+
+    def _rebuildHeap(self):
+        """ Min-heap of (count, sequence number, key); counts in it may lag behind self.counts """
+        self._sequence = itertools.count()
+        self._heap = [(count, next(self._sequence), key) for key, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, key, weight=1):
+        """ Count weight occurrences of a key """
+        count = self.counts.get(key)
+        if count is not None:
+            self.counts[key] = count + weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (weight, next(self._sequence), key))
+            return
+        # Find the true minimum, refreshing the stale heap entries on the way
+        heap = self._heap
+        while self.counts[heap[0][2]] != heap[0][0]:
+            stale = heap[0][2]
+            heapq.heapreplace(heap, (self.counts[stale], next(self._sequence), stale))
+        minimum, _, evicted = heap[0]
+        del self.counts[evicted]
+        del self.errors[evicted]
+        self.floor = max(self.floor, minimum)
+        self.counts[key] = minimum + weight
+        self.errors[key] = minimum
+        heapq.heapreplace(heap, (minimum + weight, next(self._sequence), key))
+
+    def update(self, keys, chunkSize=10000):
+        """ Count a stream of keys, pre-aggregating chunks of it exactly
+        Args:
+            keys: iterable of keys
+            chunkSize (int): number of keys counted with a Counter before updating the summary
+        Returns:
+            SpaceSaving: this summary
+        """
+        keys = iter(keys)
+        while True:
+            chunk = Counter(itertools.islice(keys, chunkSize))
+            if not chunk:
+                return self
+            for key, weight in chunk.most_common():
+                self.add(key, weight)
+
+    def merge(self, other):
+        """ Merge another summary into this one (in place)
+        Args:
+            other (SpaceSaving): summary of another part of the stream
+        Returns:
+            SpaceSaving: this summary
+        """
+        counts = {}
+        errors = {}
+        for key in set(self.counts) | set(other.counts):
+            # A key missing from a summary occurred at most floor times in its part of the stream
+            counts[key] = self.counts.get(key, self.floor) + other.counts.get(key, other.floor)
+            errors[key] = self.errors.get(key, self.floor) + other.errors.get(key, other.floor)
+        self.floor += other.floor
+        kept = heapq.nlargest(self.capacity, counts, key=counts.get)
+        if len(kept) < len(counts):
+            self.floor = max(self.floor, counts[kept[-1]])
+        self.counts = dict((key, counts[key]) for key in kept)
+        self.errors = dict((key, errors[key]) for key in kept)
+        self._rebuildHeap()
+        return self
+
+    def topK(self, k):
+        """ The k keys with the highest counts
+        Args:
+            k (int): number of keys
+        Returns:
+            list: HeavyHitter tuples, highest count first
+        """
+        ranked = sorted(self.counts.items(), key=lambda s: -s[1])
+        # Upper bound of the count of any key outside the first k
+        threshold = max(self.floor, ranked[k][1] if len(ranked) > k else 0)
+        return [HeavyHitter(key, count, self.errors[key], count - self.errors[key] >= threshold)
+                for key, count in ranked[:k]]
+
+    def __getstate__(self):
+        return (self.capacity, self.counts, self.errors, self.floor)
+
+    def __setstate__(self, state):
+        self.capacity, self.counts, self.errors, self.floor = state
+        self._rebuildHeap()
+
+
+def _summarizePartition(capacity):
+    """ Build a mapPartitions function summarizing the keys of a partition """
+    def summarize(keys):
+        return [SpaceSaving(capacity).update(keys)]
+    return summarize
+
+
+def heavyHitters(keysRDD, capacity=DEFAULT_CAPACITY, depth=2):
+    """ SpaceSaving summary of an RDD, built per partition and merged with treeAggregate
+    Args:
+        keysRDD: RDD of keys, e.g. endpoints
+        capacity (int): number of monitored keys per summary
+        depth (int): depth of the merge tree
+    Returns:
+        SpaceSaving: the summary (empty for an empty RDD)
+    """
+    def merge(summary, other):
+        return summary.merge(other)
+
+    return (keysRDD
+            .mapPartitions(_summarizePartition(capacity))
+            .treeAggregate(SpaceSaving(capacity), merge, merge, depth))
+
+
+def topK(keysRDD, k, capacity=None):
+    """ Approximate ``map(lambda key: (key, 1)).reduceByKey(add).takeOrdered(k, lambda s: -s[1])``
+    Args:
+        keysRDD: RDD of keys
+        k (int): number of keys
+        capacity (int): number of monitored keys, 10 * k (at least 100) if None
+    Returns:
+        list: HeavyHitter tuples, highest count first
+    """
+    capacity = capacity or max(100, 10 * k)
+    return heavyHitters(keysRDD, capacity).topK(k)
+
+
+def trackStream(keysDStream, capacity=DEFAULT_CAPACITY):
+    """ Keep a running summary of a DStream of keys on the driver
+    Args:
+        keysDStream: DStream of keys
+        capacity (int): number of monitored keys
+    Returns:
+        SpaceSaving: summary merged with every batch as it completes; call topK() on it at any time
+    """
+    summary = SpaceSaving(capacity)
+    keysDStream.foreachRDD(lambda rdd: summary.merge(heavyHitters(rdd, capacity)))
+    return summary
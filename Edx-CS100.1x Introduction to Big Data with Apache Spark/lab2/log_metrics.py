@@ -0,0 +1,343 @@
+""" All the lab2 access log statistics computed in a single pass.
+
+The lab2 report is about fifteen separate jobs over ``access_logs``. Each one is a
+``map(...).reduceByKey(...)`` (or ``distinct``, ``groupByKey``, ``takeOrdered``) that scans every
+record again: response code counts, host and endpoint counts, failed endpoints, unique hosts,
+daily unique hosts, average daily requests per host, and the 404 breakdowns. Here each statistic is
+a ``Metric`` with a small mergeable state. ``computeMetrics`` updates the states of all the metrics
+while iterating over each partition once, merges the per-partition states with ``treeReduce``, and
+returns every result at once:
+
+    results = computeMetrics(access_logs, lab2Metrics())
+    results['responseCodeToCount']      # [(200, 940847), (302, 16244), ...]
+    results['dailyHosts']               # [(1, 2582), (3, 3222), ...]
+"""
+from collections import Counter
+
+from heavy_hitters import SpaceSaving
+from hyperloglog import HyperLogLog
+
+# Metrics of lab2Metrics() holding an exact count of every host or endpoint, left out when the top
+# keys are found with a bounded capacity
+EXACT_KEY_COUNTS = ('hostSum', 'endpointCounts', 'endpointSum')
+
+
+class Metric(object):
+    """ A statistic over log records with a state that can be updated and merged
+
+    Subclasses implement zero(), add(), merge() and result(); states are plain mutable Python
+    objects (counters, dicts, lists) so that they pickle from the executors to the driver.
+    """
+
+    def __init__(self, name, where=None):
+        """ Name the metric
+        Args:
+            name (str): key of the result in the dict returned by computeMetrics()
+            where (function): log -> bool, only records for which it is true are counted
+        """
+        self.name = name
+        self.where = where
+
+    def zero(self):
+        """ Empty state """
+        raise NotImplementedError
+
+    def add(self, state, log):
+        """ Update a state with one record (in place) """
+        raise NotImplementedError
+
+    def merge(self, state, other):
+        """ Merge other into state (in place) and return state """
+        raise NotImplementedError
+
+    def result(self, state):
+        """ Final value of a state """
+        raise NotImplementedError
+
+    def update(self, state, log):
+        """ add() for records passing the where filter """
+        if self.where is None or self.where(log):
+            self.add(state, log)
+
+
+class CountBy(Metric):
+    """ Number of records per key, ``map(lambda log: (key(log), 1)).reduceByKey(add)`` """
+
+    def __init__(self, name, key=None, where=None):
+        """ Count records
+        Args:
+            name (str): name of the result
+            key (function): log -> key; None counts all the records
+            where (function): log -> bool filter
+        """
+        Metric.__init__(self, name, where)
+        self.key = key
+
+    def zero(self):
+        return Counter()
+
+    def add(self, state, log):
+        state[self.key(log) if self.key is not None else None] += 1
+
+    def merge(self, state, other):
+        state.update(other)
+        return state
+
+    def result(self, state):
+        """ The count if there is no key, otherwise (key, count) pairs sorted by key """
+        if self.key is None:
+            return state[None]
+        return sorted(state.items())
+
+
+class TopBy(CountBy):
+    """ The keys with the most records, ``reduceByKey(add).takeOrdered(n, lambda s: -s[1])``
+
+    Every key is counted, or with a capacity only that many keys are monitored by a SpaceSaving
+    summary, which bounds the memory but makes the counts upper bounds: the result then holds
+    HeavyHitter tuples, whose error and guaranteed fields say how far each count can be off.
+    """
+
+    def __init__(self, name, key, n, where=None, capacity=None):
+        """ Count records per key and keep the n largest counts
+        Args:
+            name (str): name of the result
+            key (function): log -> key
+            n (int): number of keys in the result
+            where (function): log -> bool filter
+            capacity (int): number of keys monitored by a SpaceSaving summary; None counts all
+                            keys exactly
+        """
+        CountBy.__init__(self, name, key, where)
+        self.n = n
+        self.capacity = capacity
+
+    def zero(self):
+        return Counter() if self.capacity is None else SpaceSaving(self.capacity)
+
+    def add(self, state, log):
+        if self.capacity is None:
+            state[self.key(log)] += 1
+        else:
+            state.add(self.key(log))
+
+    def merge(self, state, other):
+        if self.capacity is None:
+            state.update(other)
+            return state
+        return state.merge(other)
+
+    def result(self, state):
+        """ (key, count) pairs, largest count first (ties by key), or with a capacity
+        HeavyHitter(key, count, error, guaranteed) tuples, whose count is an upper bound """
+        if self.capacity is None:
+            return sorted(state.items(), key=lambda s: (-s[1], s[0]))[:self.n]
+        return state.topK(self.n)
+
+
+class Summary(Metric):
+    """ Count, sum, minimum, maximum and mean of a numeric field """
+
+    def __init__(self, name, value, where=None):
+        """ Summarize a field
+        Args:
+            name (str): name of the result
+            value (function): log -> number
+            where (function): log -> bool filter
+        """
+        Metric.__init__(self, name, where)
+        self.value = value
+
+    def zero(self):
+        return [0, 0, None, None]
+
+    def add(self, state, log):
+        value = self.value(log)
+        state[0] += 1
+        state[1] += value
+        state[2] = value if state[2] is None else min(state[2], value)
+        state[3] = value if state[3] is None else max(state[3], value)
+
+    def merge(self, state, other):
+        state[0] += other[0]
+        state[1] += other[1]
+        for index, choose in ((2, min), (3, max)):
+            values = [value for value in (state[index], other[index]) if value is not None]
+            state[index] = choose(values) if values else None
+        return state
+
+    def result(self, state):
+        """ dict with count, sum, min, max and mean (None without records) """
+        count, total, low, high = state
+        return {'count': count, 'sum': total, 'min': low, 'max': high,
+                'mean': float(total) / count if count else None}
+
+
+class DistinctBy(Metric):
+    """ Number of distinct values, overall like ``distinct().count()`` or per key like
+    ``groupByKey().map(lambda x: (x[0], len(set(x[1]))))``
+
+    The values of each key are kept in a set, or with a precision in a HyperLogLog sketch of
+    2^precision bytes, which makes the counts approximate but bounds the memory per key.
+    """
+
+    def __init__(self, name, value, key=None, where=None, precision=None):
+        """ Count distinct values
+        Args:
+            name (str): name of the result
+            value (function): log -> value whose distinct occurrences are counted
+            key (function): log -> key; None counts over all the records
+            where (function): log -> bool filter
+            precision (int): count approximately with HyperLogLog sketches of this precision;
+                             None counts exactly
+        """
+        Metric.__init__(self, name, where)
+        self.value = value
+        self.key = key
+        self.precision = precision
+
+    def _newValues(self):
+        """ Empty set, or empty sketch with a precision """
+        return set() if self.precision is None else HyperLogLog(self.precision)
+
+    def zero(self):
+        return {}
+
+    def add(self, state, log):
+        key = self.key(log) if self.key is not None else None
+        values = state.get(key)
+        if values is None:
+            values = state[key] = self._newValues()
+        values.add(self.value(log))
+
+    def merge(self, state, other):
+        for key, values in other.items():
+            if key in state:
+                state[key].update(values)
+            else:
+                state[key] = values
+        return state
+
+    def result(self, state):
+        """ The number of distinct values if there is no key, otherwise (key, number) pairs
+        sorted by key """
+        if self.key is None:
+            return len(state.get(None, ()))
+        return sorted((key, len(values)) for key, values in state.items())
+
+
+class RequestsPerDistinct(DistinctBy):
+    """ Records per distinct value and key, e.g. the average daily requests per host """
+
+    def zero(self):
+        return [Counter(), {}]
+
+    def add(self, state, log):
+        state[0][self.key(log) if self.key is not None else None] += 1
+        DistinctBy.add(self, state[1], log)
+
+    def merge(self, state, other):
+        state[0].update(other[0])
+        DistinctBy.merge(self, state[1], other[1])
+        return state
+
+    def result(self, state):
+        """ (key, records // distinct values) pairs sorted by key, or the ratio without key """
+        counts, distinct = state
+        ratios = sorted((key, counts[key] // len(values)) for key, values in distinct.items())
+        if self.key is None:
+            return ratios[0][1] if ratios else None
+        return ratios
+
+
+def _updatePartition(metrics):
+    """ Build a mapPartitions function computing the states of all metrics over a partition
+    Args:
+        metrics (list): Metric objects
+    Returns:
+        function: iterator of logs -> [list of states, one per metric]
+    """
+    def update(logs):
+        states = [metric.zero() for metric in metrics]
+        pairs = list(zip(metrics, states))
+        for log in logs:
+            for metric, state in pairs:
+                metric.update(state, log)
+        return [states]
+    return update
+
+
+def _mergeStates(metrics):
+    """ Build a function merging two lists of states, one per metric """
+    def merge(states, others):
+        return [metric.merge(state, other)
+                for metric, state, other in zip(metrics, states, others)]
+    return merge
+
+
+def aggregateLogs(logs, metrics):
+    """ Compute metrics over local records, e.g. a sample or one streaming batch
+    Args:
+        logs: iterable of log records
+        metrics (list): Metric objects with distinct names
+    Returns:
+        dict: metric name -> result
+    """
+    states = _updatePartition(metrics)(logs)[0]
+    return dict((metric.name, metric.result(state)) for metric, state in zip(metrics, states))
+
+
+def computeMetrics(logsRDD, metrics, depth=2):
+    """ Compute metrics over an RDD in a single pass
+    Args:
+        logsRDD: RDD of log records, e.g. lab2's ``access_logs``
+        metrics (list): Metric objects with distinct names
+        depth (int): depth of the treeReduce merging the per-partition states
+    Returns:
+        dict: metric name -> result
+    """
+    states = (logsRDD
+              .mapPartitions(_updatePartition(metrics))
+              .treeReduce(_mergeStates(metrics), depth))
+    return dict((metric.name, metric.result(state)) for metric, state in zip(metrics, states))
+
+
+def lab2Metrics(precision=None, capacity=None):
+    """ The statistics of the lab2 report, named after the notebook's variables
+    Args:
+        precision (int): count distinct hosts and endpoints approximately with HyperLogLog
+                         sketches of this precision; None counts them exactly
+        capacity (int): find the top endpoints and hosts with SpaceSaving summaries monitoring
+                        this many keys, and leave out the EXACT_KEY_COUNTS metrics, which would
+                        still ship every key; None counts every key exactly
+    Returns:
+        list: Metric objects for the records of ``access_logs``
+    """
+    def is404(log):
+        return log.response_code == 404
+
+    metrics = [Summary('contentSizes', lambda log: log.content_size),
+               CountBy('responseCodeToCount', lambda log: log.response_code),
+               CountBy('hostSum', lambda log: log.host),
+               CountBy('endpointCounts', lambda log: log.endpoint),
+               TopBy('topEndpoints', lambda log: log.endpoint, 10, capacity=capacity),
+               CountBy('endpointSum', lambda log: log.endpoint,
+                       where=lambda log: log.response_code != 200),
+               TopBy('topTenErrURLs', lambda log: log.endpoint, 10,
+                     where=lambda log: log.response_code != 200, capacity=capacity),
+               DistinctBy('uniqueHostCount', lambda log: log.host, precision=precision),
+               DistinctBy('dailyHosts', lambda log: log.host, key=lambda log: log.date_time.day,
+                          precision=precision),
+               RequestsPerDistinct('avgDailyReqPerHost', lambda log: log.host,
+                                   key=lambda log: log.date_time.day, precision=precision),
+               CountBy('badRecords', where=is404),
+               DistinctBy('badUniqueEndpoints', lambda log: log.endpoint, where=is404,
+                          precision=precision),
+               TopBy('badEndpointsTop20', lambda log: log.endpoint, 20, where=is404,
+                     capacity=capacity),
+               TopBy('errHostsTop25', lambda log: log.host, 25, where=is404, capacity=capacity),
+               CountBy('errByDate', lambda log: log.date_time.day, where=is404),
+               CountBy('errHourList', lambda log: log.date_time.hour, where=is404)]
+    if capacity is not None:
+        metrics = [metric for metric in metrics if metric.name not in EXACT_KEY_COUNTS]
+    return metrics
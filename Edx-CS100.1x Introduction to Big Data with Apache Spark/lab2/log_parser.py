@@ -0,0 +1,131 @@
+""" Fast parsing of Apache Common Log Format lines into compact records.
+
+lab2's ``parseApacheLogLine`` runs ``APACHE_ACCESS_LOG_PATTERN`` on every line, builds a
+``pyspark.sql.Row`` from nine keyword arguments, and converts the timestamp with six slices and
+``int`` calls. ``makeLogParser`` returns an equivalent parser with three changes:
+
+* well-formed lines are split on their single spaces and checked field by field, and any line
+  the fast path does not fully recognize is handed to the regex, so odd lines parse exactly as
+  before;
+* records are ``AccessLog`` namedtuples rather than ``Row`` objects. The fields have the same
+  names and are in the same (sorted) order as the lab's ``Row``, so ``log.host``, ``log[4]`` and
+  tuple comparisons behave identically;
+* the last timestamp is cached (and validated only when it changes), since consecutive lines
+  mostly share the same second.
+
+    parsed_logs = sc.textFile(logFile).mapPartitions(parseLogPartition).cache()
+"""
+import datetime
+import re
+from collections import namedtuple
+
+try:
+    long
+except NameError:  # Python 3
+    long = int
+
+# The lab's pattern, with the fix for requests without a protocol from exercise (1c)
+APACHE_ACCESS_LOG_PATTERN = (r'^(\S+) (\S+) (\S+) \[([\w:/]+\s[+\-]\d{4})\] '
+                             r'"(\S+) (\S+)\s*(\S*)\s*" (\d{3}) (\S+)')
+_PATTERN = re.compile(APACHE_ACCESS_LOG_PATTERN)
+
+month_map = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6, 'Jul': 7,
+             'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+# Fields of the lab's Row, which sorts keyword arguments by name
+AccessLog = namedtuple('AccessLog', ['client_identd', 'content_size', 'date_time', 'endpoint',
+                                     'host', 'method', 'protocol', 'response_code', 'user_id'])
+
+
+def parse_apache_time(s):
+    """ Convert Apache time format into a Python datetime object
+    Args:
+        s (str): date and time in Apache time format
+    Returns:
+        datetime: datetime object (ignore timezone for now)
+    """
+    return datetime.datetime(int(s[7:11]),
+                             month_map[s[3:6]],
+                             int(s[0:2]),
+                             int(s[12:14]),
+                             int(s[15:17]),
+                             int(s[18:20]))
+
+
+def parseApacheLogLineRegex(logline):
+    """ lab2's parseApacheLogLine, returning an AccessLog
+    Args:
+        logline (str): a line of text in the Apache Common Log format
+    Returns:
+        tuple: either (AccessLog, 1) or (the original invalid log line, 0)
+    """
+    match = _PATTERN.search(logline)
+    if match is None:
+        return (logline, 0)
+    size_field = match.group(9)
+    size = long(0) if size_field == '-' else long(size_field)
+    return (AccessLog(match.group(2), size, parse_apache_time(match.group(4)), match.group(6),
+                      match.group(1), match.group(5), match.group(7), int(match.group(8)),
+                      match.group(3)), 1)
+
+
+def _isTimestamp(s):
+    """ Whether s is exactly of the form 01/Aug/1995:00:00:01 -0400 """
+    return (len(s) == 26 and s[2] == '/' and s[6] == '/' and s[11] == ':' and s[14] == ':' and
+            s[17] == ':' and s[20] == ' ' and s[21] in '+-' and s[3:6] in month_map and
+            (s[0:2] + s[7:11] + s[12:14] + s[15:17] + s[18:20] + s[22:26]).isdigit())
+
+
+def makeLogParser():
+    """ Build a parser with its own timestamp cache
+    Returns:
+        function: log line -> (AccessLog, 1) or (the original invalid log line, 0), the same
+                  results as lab2's parseApacheLogLine
+    """
+    # Last validated timestamp tokens, e.g. '[01/Aug/1995:00:00:01' and '-0400]', and their time
+    cache = [None, None, None]
+
+    def parse(logline):
+        # host identd userid [timestamp zone] "method endpoint[ protocol]" code size
+        parts = logline.split(' ')
+        n = len(parts)
+        # No empty parts and no whitespace other than single spaces, and just the two quotes
+        if ((n != 10 and n != 9) or '' in parts or len(logline.split()) != n or
+                logline.count('"') != 2):
+            return parseApacheLogLineRegex(logline)
+        day, zone, method, endpoint = parts[3], parts[4], parts[5], parts[6]
+        last = parts[7] if n == 10 else endpoint
+        code, size = parts[n - 2], parts[n - 1]
+        if (method[0] != '"' or last[-1] != '"' or len(code) != 3 or not code.isdigit() or
+                not (size == '-' or size.isdigit())):
+            return parseApacheLogLineRegex(logline)
+        if day != cache[0] or zone != cache[1]:
+            timestamp = day[1:] + ' ' + zone[:-1]
+            if day[0] != '[' or zone[-1] != ']' or not _isTimestamp(timestamp):
+                return parseApacheLogLineRegex(logline)
+            cache[0], cache[1], cache[2] = day, zone, parse_apache_time(timestamp)
+        method = method[1:]
+        if n == 10:
+            protocol = last[:-1]
+        else:
+            endpoint, protocol = endpoint[:-1], ''
+        if not method or not endpoint:
+            return parseApacheLogLineRegex(logline)
+        return (AccessLog(parts[1], long(0) if size == '-' else long(size), cache[2], endpoint,
+                          parts[0], method, protocol, int(code), parts[2]), 1)
+    return parse
+
+
+parseApacheLogLine = makeLogParser()
+
+
+def parseLogPartition(lines):
+    """ Parse the lines of a partition with one parser (and timestamp cache) per partition
+    Args:
+        lines: iterator of log lines
+    Returns:
+        iterator: (AccessLog, 1) or (invalid line, 0) tuples
+    """
+    parse = makeLogParser()
+    for line in lines:
+        yield parse(line)
@@ -0,0 +1,155 @@
+""" Parsed access logs stored once as Parquet, partitioned by day, and queried by column and day.
+
+lab2's ``parseLogs()`` reads ``apache.access.log.PROJECT`` as text and parses it again in every
+session, then keeps ``parsed_logs`` and ``access_logs`` cached as Python objects, which costs
+memory and is lost with the session. ``writeLogStore`` parses the log once (with
+``log_parser``) and writes the fields to Parquet files in one directory per day. ``readLogs``
+reads only the requested columns of the requested days: Parquet skips the other columns and the
+day filter prunes whole directories. The helpers below answer the lab2 questions without parsing
+anything:
+
+    writeLogStore(session, logFile, 'lab2-logs')
+    notFoundByHour(session, 'lab2-logs')                    # errHourList
+    dailyUniqueHosts(session, 'lab2-logs', days=['1995-08-01', '1995-08-03'])
+"""
+import datetime
+
+from pyspark.sql import functions as F
+from pyspark.sql.types import (IntegerType, LongType, StringType, StructField, StructType,
+                               TimestampType)
+
+from log_parser import parseLogPartition
+
+LOG_SCHEMA = StructType([StructField('host', StringType(), False),
+                         StructField('timestamp', TimestampType(), False),
+                         StructField('method', StringType(), False),
+                         StructField('endpoint', StringType(), False),
+                         StructField('protocol', StringType(), False),
+                         StructField('response_code', IntegerType(), False),
+                         StructField('content_size', LongType(), False),
+                         StructField('day', StringType(), False)])
+
+
+def _storedFields(lines):
+    """ Turn the log lines of a partition into rows of LOG_SCHEMA, for use with ``mapPartitions``
+    Args:
+        lines: iterator of log lines
+    Returns:
+        generator: tuples of the lines that parse
+    """
+    for log, parsed in parseLogPartition(lines):
+        if parsed:
+            yield (log.host, log.date_time, log.method, log.endpoint, log.protocol,
+                   log.response_code, log.content_size, log.date_time.strftime('%Y-%m-%d'))
+
+
+def writeLogStore(session, logFile, outputDir, numPartitions=None):
+    """ Parse a log file once and write it as Parquet, one directory per day
+    Args:
+        session: SparkSession (or SQLContext)
+        logFile (str): path of the log, e.g. lab2's logFile
+        outputDir (str): directory of the store, replaced if it exists
+        numPartitions (int): partitions to read the log with, Spark's default if None
+    Returns:
+        int: number of lines that failed to parse and were left out
+    """
+    sc = session.sparkContext if hasattr(session, 'sparkContext') else session._sc
+    linesRDD = sc.textFile(logFile, numPartitions) if numPartitions else sc.textFile(logFile)
+    (session.createDataFrame(linesRDD.mapPartitions(_storedFields), LOG_SCHEMA)
+     .write.partitionBy('day').mode('overwrite').parquet(outputDir))
+    # Counted with actions of their own, not with an accumulator updated in the parsing
+    # transformation, which a retried task would update twice. Neither count parses anything:
+    # the text is only split into lines and Parquet keeps the row counts in its footers.
+    return linesRDD.count() - readLogs(session, outputDir).count()
+
+
+def _dayString(day):
+    """ 'YYYY-MM-DD' for a date, a datetime or a string """
+    if isinstance(day, (datetime.date, datetime.datetime)):
+        return day.strftime('%Y-%m-%d')
+    return day
+
+
+def readLogs(session, storeDir, columns=None, days=None):
+    """ Read some columns and days of the store
+    Args:
+        session: SparkSession (or SQLContext)
+        storeDir (str): directory written by writeLogStore()
+        columns (list): names of the columns to read, all of them if None
+        days (list): days to read as dates or 'YYYY-MM-DD' strings, all of them if None
+    Returns:
+        DataFrame: the requested columns of the requested days
+    """
+    logsDF = session.read.schema(LOG_SCHEMA).parquet(storeDir)
+    if days is not None:
+        logsDF = logsDF.filter(F.col('day').isin([_dayString(day) for day in days]))
+    if columns is not None:
+        logsDF = logsDF.select(*columns)
+    return logsDF
+
+
+def _collectPairs(frame):
+    """ Rows of a two-column DataFrame as sorted (key, value) tuples """
+    return sorted((row[0], row[1]) for row in frame.collect())
+
+
+def responseCodeCounts(session, storeDir, days=None):
+    """ ``responseCodeToCount``: (response code, number of requests) pairs """
+    logsDF = readLogs(session, storeDir, ['response_code'], days)
+    return _collectPairs(logsDF.groupBy('response_code').count())
+
+
+def topEndpoints(session, storeDir, n=10, where=None, days=None):
+    """ ``topEndpoints`` and its variants, e.g. ``topTenErrURLs`` with
+    where=F.col('response_code') != 200
+    Args:
+        session: SparkSession (or SQLContext)
+        storeDir (str): directory written by writeLogStore()
+        n (int): number of endpoints
+        where (Column): condition on the response_code and endpoint columns
+        days (list): days to read, all of them if None
+    Returns:
+        list: (endpoint, number of requests) pairs, most requested first
+    """
+    logsDF = readLogs(session, storeDir, ['response_code', 'endpoint'], days)
+    if where is not None:
+        logsDF = logsDF.filter(where)
+    counts = logsDF.groupBy('endpoint').count().orderBy(F.col('count').desc(), 'endpoint')
+    return [(row.endpoint, row['count']) for row in counts.take(n)]
+
+
+def dailyUniqueHosts(session, storeDir, days=None):
+    """ ``dailyHostsList``: (day of the month, number of distinct hosts) pairs """
+    logsDF = readLogs(session, storeDir, ['host', 'timestamp'], days)
+    return _collectPairs(logsDF.groupBy(F.dayofmonth('timestamp').alias('day'))
+                         .agg(F.countDistinct('host')))
+
+
+def avgDailyRequestsPerHost(session, storeDir, days=None):
+    """ ``avgDailyReqPerHostList``: (day of the month, requests // distinct hosts) pairs """
+    logsDF = readLogs(session, storeDir, ['host', 'timestamp'], days)
+    perDay = (logsDF.groupBy(F.dayofmonth('timestamp').alias('day'))
+              .agg(F.count('host').alias('requests'), F.countDistinct('host').alias('hosts')))
+    return sorted((row.day, row.requests // row.hosts) for row in perDay.collect())
+
+
+def notFoundByDay(session, storeDir, days=None):
+    """ ``errByDate``: (day of the month, number of 404 responses) pairs """
+    logsDF = readLogs(session, storeDir, ['response_code', 'timestamp'], days)
+    return _collectPairs(logsDF.filter(F.col('response_code') == 404)
+                         .groupBy(F.dayofmonth('timestamp')).count())
+
+
+def notFoundByHour(session, storeDir, days=None):
+    """ ``errHourList``: (hour, number of 404 responses) pairs """
+    logsDF = readLogs(session, storeDir, ['response_code', 'timestamp'], days)
+    return _collectPairs(logsDF.filter(F.col('response_code') == 404)
+                         .groupBy(F.hour('timestamp')).count())
+
+
+def notFoundTopHosts(session, storeDir, n=25, days=None):
+    """ ``errHostsTop25``: the hosts with the most 404 responses, most first """
+    logsDF = readLogs(session, storeDir, ['response_code', 'host'], days)
+    counts = (logsDF.filter(F.col('response_code') == 404)
+              .groupBy('host').count().orderBy(F.col('count').desc(), 'host'))
+    return [(row.host, row['count']) for row in counts.take(n)]
@@ -0,0 +1,148 @@
+""" Concurrent hyperparameter search for ``pyspark.mllib.recommendation.ALS``.
+
+The lab4 model-selection cell trains one rank at a time, and each ``ALS.train`` / ``predictAll`` /
+``computeError`` round is a chain of small jobs that leaves most executor cores idle. A
+SparkContext accepts jobs from several driver threads at once, so ``searchALS`` submits several
+configurations in parallel from a thread pool against one cached training RDD and scores them with
+a shared ``RatingsEvaluator``. With ``halvingIterations`` it runs successive halving instead: every
+configuration is trained with few iterations first and only the best fraction is retrained with
+more. Setting ``spark.scheduler.mode=FAIR`` lets the concurrent jobs share executors evenly.
+"""
+import itertools
+import random
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from pyspark.mllib.recommendation import ALS
+
+from evaluation import RatingsEvaluator
+
+ALSConfig = namedtuple('ALSConfig', ['rank', 'lambda_', 'iterations'])
+
+SearchResult = namedtuple('SearchResult', ['rank', 'lambda_', 'iterations', 'rmse', 'mae',
+                                           'seconds'])
+
+
+def parameterGrid(ranks, lambdas, iterations):
+    """ Every combination of rank, regularization and iteration count
+    Args:
+        ranks (list): ALS ranks
+        lambdas (list): regularization parameters
+        iterations (list): iteration counts
+    Returns:
+        list: ALSConfig tuples
+    """
+    return [ALSConfig(rank, lambda_, numIterations)
+            for rank, lambda_, numIterations in itertools.product(ranks, lambdas, iterations)]
+
+
+def randomParameters(ranks, lambdas, iterations, numConfigs, seed=0):
+    """ A random sample of the parameter grid
+    Args:
+        ranks (list): ALS ranks
+        lambdas (list): regularization parameters
+        iterations (list): iteration counts
+        numConfigs (int): number of configurations to draw
+        seed (int): random seed
+    Returns:
+        list: at most numConfigs distinct ALSConfig tuples
+    """
+    grid = parameterGrid(ranks, lambdas, iterations)
+    return random.Random(seed).sample(grid, min(numConfigs, len(grid)))
+
+
+def _trainAndEvaluate(trainingRDD, validationForPredictRDD, evaluator, config, seed, als):
+    """ Train one ALS model and score it on the validation set
+    Args:
+        trainingRDD: RDD of (UserID, MovieID, Rating) tuples
+        validationForPredictRDD: RDD of (UserID, MovieID) pairs to predict
+        evaluator (RatingsEvaluator): evaluator over the validation ratings
+        config (ALSConfig): parameters to train with
+        seed (int): ALS random seed
+        als: ALS backend, ``pyspark.mllib.recommendation.ALS`` or ``local_als.LocalALS``
+    Returns:
+        SearchResult: the configuration with its validation error and wall time
+    """
+    start = time.time()
+    model = als.train(trainingRDD, config.rank, seed=seed, iterations=config.iterations,
+                      lambda_=config.lambda_)
+    metrics = evaluator.evaluate(model.predictAll(validationForPredictRDD))
+    return SearchResult(config.rank, config.lambda_, config.iterations, metrics.rmse, metrics.mae,
+                        time.time() - start)
+
+
+def _runConcurrently(trainingRDD, validationForPredictRDD, evaluator, configs, seed, als,
+                     parallelism):
+    """ Train and score a list of configurations from a pool of driver threads
+    Returns:
+        list: SearchResult tuples in the order of configs
+    """
+    pool = ThreadPool(max(1, min(parallelism, len(configs))))
+    try:
+        return pool.map(lambda config: _trainAndEvaluate(trainingRDD, validationForPredictRDD,
+                                                         evaluator, config, seed, als),
+                        configs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def searchALS(trainingRDD, validationRDD, configs, seed=5, parallelism=4,
+              halvingIterations=None, eta=2, als=ALS):
+    """ Search ALS hyperparameters, training several configurations at once
+    Args:
+        trainingRDD: RDD of (UserID, MovieID, Rating) tuples; cached if it is not already
+        validationRDD: RDD of (UserID, MovieID, Rating) tuples used to score the models
+        configs (list): ALSConfig tuples, e.g. from parameterGrid() or randomParameters()
+        seed (int): ALS random seed
+        parallelism (int): number of configurations trained concurrently
+        halvingIterations (list): if given, run successive halving: train every (rank, lambda_)
+                                  with the first iteration count, keep the best 1/eta, retrain
+                                  those with the next count, and so on. The iterations field of
+                                  configs is then ignored.
+        eta (int): each halving round keeps the best 1/eta of its configurations
+        als: ALS backend with MLlib's ``train`` signature, e.g. ``local_als.LocalALS`` (which
+             already uses every core, so pair it with parallelism=1)
+    Returns:
+        list: SearchResult tuples of every trained model, best validation RMSE first
+    """
+    if not trainingRDD.is_cached:
+        trainingRDD.cache()
+    validationForPredictRDD = validationRDD.map(lambda x: (x[0], x[1])).cache()
+    evaluator = RatingsEvaluator(validationRDD)
+    try:
+        if not halvingIterations:
+            results = _runConcurrently(trainingRDD, validationForPredictRDD, evaluator, configs,
+                                       seed, als, parallelism)
+        else:
+            results = []
+            survivors = sorted(set((config.rank, config.lambda_) for config in configs))
+            for numIterations in halvingIterations:
+                roundConfigs = [ALSConfig(rank, lambda_, numIterations)
+                                for rank, lambda_ in survivors]
+                roundResults = sorted(_runConcurrently(trainingRDD, validationForPredictRDD,
+                                                       evaluator, roundConfigs, seed, als,
+                                                       parallelism),
+                                      key=lambda result: result.rmse)
+                results.extend(roundResults)
+                keep = max(1, len(roundResults) // eta)
+                survivors = [(result.rank, result.lambda_) for result in roundResults[:keep]]
+    finally:
+        evaluator.unpersist()
+        validationForPredictRDD.unpersist()
+    return sorted(results, key=lambda result: result.rmse)
+
+
+def formatResults(results):
+    """ Format search results as a text table
+    Args:
+        results (list): SearchResult tuples
+    Returns:
+        str: one line per result, with a header
+    """
+    lines = ['%6s %8s %10s %10s %10s %9s' % ('rank', 'lambda', 'iterations', 'RMSE', 'MAE',
+                                             'seconds')]
+    for result in results:
+        lines.append('%6d %8g %10d %10.6f %10.6f %9.1f' % result)
+    return '\n'.join(lines)
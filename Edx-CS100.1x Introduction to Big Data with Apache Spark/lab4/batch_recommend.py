@@ -0,0 +1,132 @@
+""" Top-N recommendations for every user at once, e.g. for a nightly batch job.
+
+With lab4's approach, recommending to all users means ``predictAll`` over the whole users x movies
+cross product, followed by a shuffle to group the predictions by user. ``recommendAllUsers``
+instead broadcasts the product factors (sorted by MovieID) and scores the users partition by
+partition with NumPy. Users are taken ``userBlockSize`` at a time and multiplied against one block
+of ``productBlockSize`` movies at a time. Already rated and ineligible movies are set to -inf, and
+each user keeps only a running top n. No more than userBlockSize x (productBlockSize + n) scores
+exist at once, and the full score matrix is never built.
+
+    recommendationsRDD = recommendAllUsers(model, trainingRDD, n=20)
+    recommendationsRDD.take(1)          # [(UserID, [(MovieID, score), ...])]
+"""
+import numpy as np
+
+from ratings_matrix import denseIndex
+from recommender import TopNRecommender, _topColumns
+
+
+def scoreUserBlock(userMatrix, ratedRows, productMatrix, eligible, n, productBlockSize=8192):
+    """ Top-n movies of a block of users, scoring one block of movies at a time
+    Args:
+        userMatrix (ndarray): factors of the users, one row per user
+        ratedRows (list): for each user, the rows of productMatrix to leave out
+        productMatrix (ndarray): product factors, one row per movie
+        eligible (ndarray): boolean mask of the rows of productMatrix that may be recommended
+        n (int): number of movies per user
+        productBlockSize (int): number of movies scored per matrix multiply
+    Returns:
+        tuple: (rows, scores) arrays of shape (users, at most n), best first; scores of -inf
+               mark padding for users with fewer than n eligible movies
+    """
+    numUsers = userMatrix.shape[0]
+    users = np.arange(numUsers)[:, None]
+    ratedUsers = np.repeat(np.arange(numUsers), [len(rows) for rows in ratedRows])
+    ratedRows = (np.concatenate([np.asarray(rows, dtype=np.int64) for rows in ratedRows])
+                 if numUsers else np.zeros(0, dtype=np.int64))
+    bestRows = np.zeros((numUsers, 0), dtype=np.int64)
+    bestScores = np.zeros((numUsers, 0))
+    for start in range(0, productMatrix.shape[0], productBlockSize):
+        stop = min(start + productBlockSize, productMatrix.shape[0])
+        scores = userMatrix.dot(productMatrix[start:stop].T)
+        scores[:, ~eligible[start:stop]] = -np.inf
+        inBlock = (ratedRows >= start) & (ratedRows < stop)
+        scores[ratedUsers[inBlock], ratedRows[inBlock] - start] = -np.inf
+        # Merge the block into the running top n of every user
+        candidateScores = np.hstack([bestScores, scores])
+        candidateRows = np.hstack([bestRows,
+                                   np.broadcast_to(np.arange(start, stop), scores.shape)])
+        top = _topColumns(candidateScores, n)
+        bestRows = candidateRows[users, top]
+        bestScores = candidateScores[users, top]
+    return bestRows, bestScores
+
+
+def _recommendPartition(broadcastProducts, n, userBlockSize, productBlockSize):
+    """ Build a mapPartitions function recommending movies to the users of a partition
+    Args:
+        broadcastProducts: broadcast (sorted MovieIDs, product matrix, eligibility mask)
+        n (int): number of movies per user
+        userBlockSize (int): number of users scored together
+        productBlockSize (int): number of movies scored per matrix multiply
+    Returns:
+        function: iterator of (UserID, (factors, rated MovieIDs)) -> iterator of
+                  (UserID, [(MovieID, score), ...])
+    """
+    def recommendBlock(block):
+        productIDs, productMatrix, eligible = broadcastProducts.value
+        userMatrix = np.array([factors for _, factors, _ in block], dtype=np.float64)
+        ratedRows = []
+        for _, _, rated in block:
+            rows = denseIndex(productIDs, np.asarray(rated, dtype=np.int64))
+            ratedRows.append(rows[rows >= 0])
+        bestRows, bestScores = scoreUserBlock(userMatrix, ratedRows, productMatrix, eligible, n,
+                                              productBlockSize)
+        for offset, (user, _, _) in enumerate(block):
+            yield user, [(productIDs[row].item(), float(score))
+                         for row, score in zip(bestRows[offset], bestScores[offset])
+                         if score > -np.inf]
+
+    def recommendUsers(records):
+        block = []
+        for user, (factors, rated) in records:
+            factors = list(factors)
+            if not factors:
+                # Users with ratings but no factors cannot be scored
+                continue
+            block.append((user, factors[0], list(rated)))
+            if len(block) == userBlockSize:
+                for recommendation in recommendBlock(block):
+                    yield recommendation
+                block = []
+        if block:
+            for recommendation in recommendBlock(block):
+                yield recommendation
+    return recommendUsers
+
+
+def recommendAllUsers(model, ratingsRDD=None, n=10, movieCountsRDD=None, minCount=0,
+                      userBlockSize=1024, productBlockSize=8192, numPartitions=None, sc=None):
+    """ Recommend the n movies with the highest predicted rating to every user of a model
+    Args:
+        model: MatrixFactorizationModel, FoldInModel or LocalMatrixFactorizationModel
+        ratingsRDD: RDD of (UserID, MovieID, Rating) tuples the users already rated, left out of
+                    their recommendations; None recommends among all movies
+        n (int): number of movies per user
+        movieCountsRDD: RDD of (MovieID, number of ratings) pairs
+        minCount (int): only recommend movies with more than minCount ratings
+        userBlockSize (int): number of users scored together, bounding memory to
+                             userBlockSize x (productBlockSize + n) scores per task
+        productBlockSize (int): number of movies scored per matrix multiply
+        numPartitions (int): partitions of the cogroup with ratingsRDD, its default if None
+        sc (SparkContext): distributes the user factors of a LocalMatrixFactorizationModel, which
+                           lists them on the driver; ratingsRDD's context if None
+    Returns:
+        RDD: (UserID, [(MovieID, predicted rating), ...]) pairs, highest rating first
+    """
+    recommender = TopNRecommender.fromModel(model, movieCountsRDD, minCount)
+    order = np.argsort(recommender.productIDs, kind='mergesort')
+    userFeaturesRDD = model.userFeatures()
+    if not hasattr(userFeaturesRDD, 'context'):
+        userFeaturesRDD = model.userFeatures(sc or ratingsRDD.context)
+    broadcastProducts = userFeaturesRDD.context.broadcast(
+        (recommender.productIDs[order].astype(np.int64), recommender.productMatrix[order],
+         recommender.eligible[order]))
+    if ratingsRDD is None:
+        usersRDD = userFeaturesRDD.map(lambda x: (x[0], ([x[1]], [])))
+    else:
+        usersRDD = userFeaturesRDD.cogroup(ratingsRDD.map(lambda x: (x[0], x[1])),
+                                           numPartitions)
+    return usersRDD.mapPartitions(_recommendPartition(broadcastProducts, n, userBlockSize,
+                                                      productBlockSize))
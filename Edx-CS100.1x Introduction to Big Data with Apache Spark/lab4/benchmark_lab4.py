@@ -0,0 +1,497 @@
+""" End-to-end benchmark of the lab4 pipeline at chosen scales, with comparable JSON reports.
+
+Runs the stages of lab4 on a ratings file -- parse, per-movie statistics, join with the movies,
+train/validation/test split, ALS training and ``computeError`` for every rank, and top-N
+recommendation -- and writes one JSON report with, for each stage, the wall time and the
+throughput, plus the Spark jobs, tasks, task time, shuffle bytes and cached size recorded by
+``spark_metrics.PipelineMetrics``. The stages run twice: first as written in the lab (``lab_``
+stages: ``map(get_ratings_tuple)``, ``groupByKey``, joins, ``randomSplit``, the lab's
+``computeError`` and ``predictAll`` for one user), as the baseline, then with the optimized
+modules. The driver's peak resident memory is a high-water mark of the whole process, so it is
+reported once per run; ``--trace-memory`` adds the peak of each stage's Python allocations on the
+driver, from tracemalloc. Synthetic MovieLens files with Zipfian movie popularity are generated
+for the requested scale when ``--scale`` is given.
+
+    python benchmark_lab4.py run --scale 10M --ranks 4 8 12 --report 10M-abc1234.json
+    python benchmark_lab4.py compare 10M-abc1234.json 10M-def5678.json
+
+``compare`` prints the change of every stage and exits with status 1 when a stage got slower (or
+shuffled more) than the tolerance allows, so it can guard a branch against regressions.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2: no per-stage memory
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from spark_metrics import PipelineMetrics  # noqa: E402
+
+SCALE_SUFFIXES = {'k': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9}
+
+# Prefix of the stages of the lab's own code path
+BASELINE_PREFIX = 'lab_'
+
+
+def parseScale(text):
+    """ Parse a number of ratings such as '487650', '500k' or '25M'
+    Args:
+        text (str): the number, optionally with a k, M or G suffix
+    Returns:
+        int: the number of ratings
+    """
+    if text and text[-1] in SCALE_SUFFIXES:
+        return int(float(text[:-1]) * SCALE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def peakRssBytes():
+    """ Peak resident set size of this (driver) process since it started, in bytes; a high-water
+    mark, so it says nothing about the stages that ran after it was reached """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def gitCommit():
+    """ Commit of the working tree of this file, with a '-dirty' suffix if it has changes
+    Returns:
+        str: the abbreviated commit, or None outside of a git checkout
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=here)
+        status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                         cwd=here)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode('ascii').strip() + ('-dirty' if status.strip() else '')
+
+
+@contextmanager
+def recordStage(metrics, name, records=None):
+    """ Record a pipeline stage with PipelineMetrics, adding the peak of the driver's Python
+    allocations during the stage when tracemalloc is tracing
+    Args:
+        metrics (PipelineMetrics): where the stages are recorded
+        name (str): name of the stage, unique within a report
+        records (int): number of records processed, if already known
+    """
+    tracing = tracemalloc is not None and tracemalloc.is_tracing()
+    if tracing:
+        # Restart, so that the peak only covers this stage
+        tracemalloc.stop()
+        tracemalloc.start()
+    with metrics.step(name, records) as result:
+        yield result
+        if tracing:
+            result['driverPeakBytes'] = tracemalloc.get_traced_memory()[1]
+    stage = metrics.steps[-1]
+    print('%-24s %10.2f s %14s records/s' % (
+        name, stage['seconds'], '%.0f' % stage['throughput'] if stage['throughput'] else '-'))
+
+
+def ensureDataset(dataDir, numRatings, seed):
+    """ Generate (once) synthetic ratings and movies files with numRatings ratings
+    Args:
+        dataDir (str): directory of the generated files
+        numRatings (int): number of ratings
+        seed (int): random seed of the generator
+    Returns:
+        tuple: (ratings filename, movies filename)
+    """
+    from synthetic_movielens import writeDataset
+
+    ratingsFilename = os.path.join(dataDir, 'ratings-%d-%d.dat.gz' % (numRatings, seed))
+    moviesFilename = os.path.join(dataDir, 'movies-%d-%d.dat' % (numRatings, seed))
+    if not (os.path.exists(ratingsFilename) and os.path.exists(moviesFilename)):
+        if not os.path.isdir(dataDir):
+            os.makedirs(dataDir)
+        print('Writing %d synthetic ratings to %s' % (numRatings, ratingsFilename))
+        # Keep the .gz suffix, so the partial file is compressed like the final one
+        partial = os.path.join(dataDir, '.partial-' + os.path.basename(ratingsFilename))
+        writeDataset(partial, moviesFilename, numRatings, seed=seed)
+        os.rename(partial, ratingsFilename)
+    return ratingsFilename, moviesFilename
+
+
+def get_ratings_tuple(entry):
+    """ Parse a line in the ratings dataset
+    Args:
+        entry (str): a line in the ratings dataset in the form of UserID::MovieID::Rating::Timestamp
+    Returns:
+        tuple: (UserID, MovieID, Rating)
+    """
+    items = entry.split('::')
+    return int(items[0]), int(items[1]), float(items[2])
+
+
+def get_movie_tuple(entry):
+    """ Parse a line in the movies dataset
+    Args:
+        entry (str): a line in the movies dataset in the form of MovieID::Title::Genres
+    Returns:
+        tuple: (MovieID, Title)
+    """
+    items = entry.split('::')
+    return int(items[0]), items[1]
+
+
+def getCountsAndAverages(IDandRatingsTuple):
+    """ Calculate average rating
+    Args:
+        IDandRatingsTuple: a single tuple of (MovieID, (Rating1, Rating2, Rating3, ...))
+    Returns:
+        tuple: a tuple of (MovieID, (number of ratings, averageRating))
+    """
+    ratings = list(IDandRatingsTuple[1])
+    return IDandRatingsTuple[0], (len(ratings), float(sum(ratings)) / len(ratings))
+
+
+def computeError(predictedRDD, actualRDD):
+    """ Compute the root mean squared error between predicted and actual, as written in the lab
+    Args:
+        predictedRDD: (UserID, MovieID, Rating) predictions
+        actualRDD: (UserID, MovieID, Rating) actual ratings
+    Returns:
+        float: the RMSE
+    """
+    predictedReformattedRDD = predictedRDD.map(lambda x: ((x[0], x[1]), x[2]))
+    actualReformattedRDD = actualRDD.map(lambda x: ((x[0], x[1]), x[2]))
+    squaredErrorsRDD = (predictedReformattedRDD
+                        .join(actualReformattedRDD)
+                        .map(lambda x: (x[1][0] - x[1][1]) ** 2))
+    totalError = squaredErrorsRDD.reduce(lambda x, y: x + y)
+    numRatings = squaredErrorsRDD.count()
+    return math.sqrt(totalError / float(numRatings))
+
+
+def runLabPipeline(sc, metrics, ratingsFilename, moviesFilename, ranks, iterations=5,
+                   lambda_=0.1, numPartitions=None, minCount=20):
+    """ Run and record the stages of the lab4 pipeline as the lab writes them, as a baseline for
+    runPipeline(); every stage name starts with BASELINE_PREFIX
+    Args:
+        sc (SparkContext): the Spark context
+        metrics (PipelineMetrics): where the stages are recorded
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        ranks (list): ALS ranks to train and evaluate
+        iterations (int): ALS iterations
+        lambda_ (float): ALS regularization
+        numPartitions (int): partitions of the ratings, the lab's 2 if None
+        minCount (int): only recommend movies with more than minCount ratings
+    """
+    from pyspark.mllib.recommendation import ALS
+
+    with recordStage(metrics, BASELINE_PREFIX + 'parse') as result:
+        ratingsRDD = (sc.textFile(ratingsFilename)
+                      .repartition(numPartitions or 2)
+                      .map(get_ratings_tuple)
+                      .cache())
+        moviesRDD = sc.textFile(moviesFilename).map(get_movie_tuple).cache()
+        result['records'] = ratingsRDD.count()
+        result['movies'] = moviesRDD.count()
+        result['partitions'] = ratingsRDD.getNumPartitions()
+    numRatings = result['records']
+
+    with recordStage(metrics, BASELINE_PREFIX + 'movie_stats', numRatings) as result:
+        movieIDsWithAvgRatingsRDD = (ratingsRDD
+                                     .map(lambda x: (x[1], x[2]))
+                                     .groupByKey()
+                                     .map(getCountsAndAverages)
+                                     .cache())
+        result['movies'] = movieIDsWithAvgRatingsRDD.count()
+
+    with recordStage(metrics, BASELINE_PREFIX + 'join_movies') as result:
+        result['records'] = (moviesRDD
+                             .join(movieIDsWithAvgRatingsRDD)
+                             .map(lambda x: (x[1][1][1], x[1][0], x[1][1][0]))
+                             .count())
+
+    with recordStage(metrics, BASELINE_PREFIX + 'split', numRatings) as result:
+        trainingRDD, validationRDD, testRDD = ratingsRDD.randomSplit([6, 2, 2], seed=0)
+        result['sizes'] = [trainingRDD.count(), validationRDD.count(), testRDD.count()]
+    sizes = result['sizes']
+    validationForPredictRDD = validationRDD.map(lambda x: (x[0], x[1]))
+
+    models, errors = {}, {}
+    for rank in ranks:
+        with recordStage(metrics, BASELINE_PREFIX + 'als_rank_%d' % rank,
+                         sizes[0] * iterations) as result:
+            models[rank] = ALS.train(trainingRDD, rank, seed=5, iterations=iterations,
+                                     lambda_=lambda_)
+            models[rank].userFeatures().count()
+        with recordStage(metrics, BASELINE_PREFIX + 'compute_error_rank_%d' % rank,
+                         sizes[1]) as result:
+            predictedRatingsRDD = models[rank].predictAll(validationForPredictRDD)
+            errors[rank] = computeError(predictedRatingsRDD, validationRDD)
+            result['rmse'] = errors[rank]
+
+    bestRank = min(ranks, key=errors.get)
+    with recordStage(metrics, BASELINE_PREFIX + 'recommend') as result:
+        # The lab recommends to a single user: predict every movie, join counts and titles
+        user = models[bestRank].userFeatures().first()[0]
+        movieCountsRDD = movieIDsWithAvgRatingsRDD.map(lambda x: (x[0], x[1][0]))
+        predictedRDD = (models[bestRank]
+                        .predictAll(moviesRDD.map(lambda x: (user, x[0])))
+                        .map(lambda x: (x[1], x[2])))
+        ratingsWithNamesRDD = (predictedRDD
+                               .join(movieCountsRDD)
+                               .join(moviesRDD)
+                               .map(lambda x: (x[1][0][0], x[1][1], x[1][0][1]))
+                               .filter(lambda x: x[2] > minCount))
+        ratingsWithNamesRDD.takeOrdered(20, key=lambda x: -x[0])
+        result['records'] = 1
+        result['rank'] = bestRank
+
+    for rdd in (ratingsRDD, moviesRDD, movieIDsWithAvgRatingsRDD):
+        rdd.unpersist()
+
+
+def baselineComparison(stages):
+    """ Pair every stage with its lab baseline
+
+    The speedup is the ratio of the throughputs, not of the seconds: the stages do not always
+    process as many records (``lab_recommend`` recommends to one user, ``recommend`` to many).
+    Args:
+        stages (list): stage records of one report
+    Returns:
+        list: (stage name, baseline seconds, seconds, baseline throughput, throughput, speedup)
+              tuples for the stages that have a baseline; speedup is None without throughputs
+    """
+    byName = dict((stage['name'], stage) for stage in stages)
+    rows = []
+    for stage in stages:
+        baseline = byName.get(BASELINE_PREFIX + stage['name'])
+        if baseline is not None:
+            speedup = None
+            if baseline['throughput'] and stage['throughput']:
+                speedup = stage['throughput'] / baseline['throughput']
+            rows.append((stage['name'], baseline['seconds'], stage['seconds'],
+                         baseline['throughput'], stage['throughput'], speedup))
+    return rows
+
+
+def runPipeline(sc, metrics, ratingsFilename, moviesFilename, ranks, iterations=5, lambda_=0.1,
+                numPartitions=None, minCount=20, numUsers=1000):
+    """ Run and record every stage of the lab4 pipeline
+    Args:
+        sc (SparkContext): the Spark context
+        metrics (PipelineMetrics): where the stages are recorded
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        ranks (list): ALS ranks to train and evaluate
+        iterations (int): ALS iterations
+        lambda_ (float): ALS regularization
+        numPartitions (int): partitions of the ratings, planned by partition_planner if None
+        minCount (int): only recommend movies with more than minCount ratings
+        numUsers (int): number of users to recommend movies to
+    """
+    from pyspark.mllib.recommendation import ALS
+
+    from broadcast_join import broadcastJoin
+    from evaluation import RatingsEvaluator
+    from movie_stats import countsAndAverages, movieStatistics
+    from rating_splits import hashSplit
+    from ratings_parser import loadRatingsAndMovies
+    from recommender import TopNRecommender
+
+    with recordStage(metrics, 'parse') as result:
+        ratingsRDD, moviesRDD = loadRatingsAndMovies(sc, ratingsFilename, moviesFilename,
+                                                     numPartitions)
+        ratingsRDD.cache()
+        moviesRDD.cache()
+        result['records'] = ratingsRDD.count()
+        result['movies'] = moviesRDD.count()
+        result['partitions'] = ratingsRDD.getNumPartitions()
+    numRatings = result['records']
+
+    with recordStage(metrics, 'movie_stats', numRatings) as result:
+        statsRDD = movieStatistics(ratingsRDD).cache()
+        result['movies'] = statsRDD.count()
+
+    with recordStage(metrics, 'join_movies') as result:
+        countsRDD = countsAndAverages(statsRDD)
+        result['records'] = broadcastJoin(countsRDD, moviesRDD, smallSide='right').count()
+
+    with recordStage(metrics, 'split', numRatings) as result:
+        (trainingRDD, validationRDD, testRDD), sizes = hashSplit(ratingsRDD, (6, 2, 2), seed=0)
+        result['sizes'] = sizes
+    validationForPredictRDD = validationRDD.map(lambda x: (x[0], x[1])).cache()
+
+    evaluator = RatingsEvaluator(validationRDD)
+    models, errors = {}, {}
+    for rank in ranks:
+        with recordStage(metrics, 'als_rank_%d' % rank, sizes[0] * iterations) as result:
+            models[rank] = ALS.train(trainingRDD, rank, seed=5, iterations=iterations,
+                                     lambda_=lambda_)
+            # Training is lazy in part: force the factors so the stage holds all the work
+            models[rank].userFeatures().count()
+        with recordStage(metrics, 'compute_error_rank_%d' % rank, sizes[1]) as result:
+            predictedRDD = models[rank].predictAll(validationForPredictRDD)
+            errors[rank] = evaluator.computeError(predictedRDD)
+            result['rmse'] = errors[rank]
+
+    bestRank = min(ranks, key=errors.get)
+    with recordStage(metrics, 'recommend') as result:
+        movieCountsRDD = countsRDD.mapValues(lambda x: x[0])
+        recommender = TopNRecommender.fromModel(models[bestRank], movieCountsRDD, minCount)
+        userFeatures = models[bestRank].userFeatures().take(numUsers)
+        recommender.recommendBatch([features for _, features in userFeatures], 20)
+        result['records'] = len(userFeatures)
+        result['rank'] = bestRank
+
+    evaluator.unpersist()
+
+
+def compareReports(baseline, current, tolerance=0.1):
+    """ Compare two reports stage by stage
+    Args:
+        baseline (dict): the reference report
+        current (dict): the report to check
+        tolerance (float): relative increase of seconds or shuffle bytes tolerated
+    Returns:
+        list: (stage name, baseline seconds, current seconds, time ratio, shuffle ratio,
+               regressed) tuples for the stages present in both reports
+    """
+    baselineStages = dict((stage['name'], stage) for stage in baseline['stages'])
+    rows = []
+    for stage in current['stages']:
+        reference = baselineStages.get(stage['name'])
+        if reference is None:
+            continue
+        timeRatio = stage['seconds'] / reference['seconds'] if reference['seconds'] else None
+        shuffleRatio = None
+        if reference.get('shuffleWriteBytes') and stage.get('shuffleWriteBytes') is not None:
+            shuffleRatio = stage['shuffleWriteBytes'] / float(reference['shuffleWriteBytes'])
+        regressed = any(ratio is not None and ratio > 1 + tolerance
+                        for ratio in (timeRatio, shuffleRatio))
+        rows.append((stage['name'], reference['seconds'], stage['seconds'], timeRatio,
+                     shuffleRatio, regressed))
+    return rows
+
+
+def _run(args):
+    from pyspark import SparkContext
+
+    if args.scale:
+        ratingsFilename, moviesFilename = ensureDataset(args.data_dir, parseScale(args.scale),
+                                                        args.seed)
+    else:
+        ratingsFilename, moviesFilename = args.ratings, args.movies
+
+    if args.trace_memory:
+        if tracemalloc is None:
+            print('--trace-memory needs tracemalloc (Python 3)')
+            return 2
+        tracemalloc.start()
+    sc = SparkContext(args.master, 'benchmark_lab4')
+    metrics = PipelineMetrics(sc)
+    start = time.time()
+    try:
+        if args.baseline:
+            runLabPipeline(sc, metrics, ratingsFilename, moviesFilename, args.ranks,
+                           args.iterations, args.lambda_, args.partitions, args.min_count)
+        runPipeline(sc, metrics, ratingsFilename, moviesFilename, args.ranks, args.iterations,
+                    args.lambda_, args.partitions, args.min_count, args.users)
+    finally:
+        report = {'commit': gitCommit(),
+                  'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'sparkVersion': sc.version,
+                  'master': sc.master,
+                  'dataset': {'ratings': ratingsFilename, 'movies': moviesFilename,
+                              'scale': args.scale, 'seed': args.seed},
+                  'parameters': {'ranks': args.ranks, 'iterations': args.iterations,
+                                 'lambda': args.lambda_, 'partitions': args.partitions},
+                  'totalSeconds': time.time() - start,
+                  'peakRssBytes': peakRssBytes(),
+                  'stages': metrics.steps}
+        sc.stop()
+    metrics.printTable()
+    rows = baselineComparison(metrics.steps)
+    if rows:
+        print('%-24s %10s %10s %14s %14s %8s' % ('stage', 'lab s', 'seconds', 'lab records/s',
+                                                  'records/s', 'speedup'))
+        for name, baseSeconds, seconds, baseThroughput, throughput, speedup in rows:
+            print('%-24s %10.2f %10.2f %14s %14s %8s' % (
+                name, baseSeconds, seconds, '%.0f' % baseThroughput if baseThroughput else '-',
+                '%.0f' % throughput if throughput else '-',
+                '%.2fx' % speedup if speedup else '-'))
+    print('Driver peak RSS %.1f MB' % (report['peakRssBytes'] / 2.0 ** 20))
+    with open(args.report, 'w') as reportFile:
+        json.dump(report, reportFile, indent=2, sort_keys=True)
+    print('Report written to %s' % args.report)
+    return 0
+
+
+def _compare(args):
+    with open(args.baseline) as baselineFile:
+        baseline = json.load(baselineFile)
+    with open(args.current) as currentFile:
+        current = json.load(currentFile)
+    print('baseline %s, current %s' % (baseline.get('commit'), current.get('commit')))
+    print('%-24s %10s %10s %8s %10s' % ('stage', 'base s', 'current s', 'time', 'shuffle'))
+    rows = compareReports(baseline, current, args.tolerance)
+    for name, baseSeconds, seconds, timeRatio, shuffleRatio, regressed in rows:
+        print('%-24s %10.2f %10.2f %8s %10s%s' % (
+            name, baseSeconds, seconds, '%.2fx' % timeRatio if timeRatio else '-',
+            '%.2fx' % shuffleRatio if shuffleRatio else '-', '  REGRESSION' if regressed else ''))
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='run the pipeline and write a report')
+    run.add_argument('--ratings', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                       'ratings.dat.gz'))
+    run.add_argument('--movies', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                      'movies.dat'))
+    run.add_argument('--scale', default=None,
+                     help='generate a synthetic dataset with this many ratings, e.g. 10M')
+    run.add_argument('--data-dir', default='synthetic')
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--master', default='local[*]')
+    run.add_argument('--partitions', type=int, default=None,
+                     help='partitions of the ratings, planned from the input and cores by default')
+    run.add_argument('--ranks', type=int, nargs='+', default=[4, 8, 12])
+    run.add_argument('--iterations', type=int, default=5)
+    run.add_argument('--lambda', dest='lambda_', type=float, default=0.1)
+    run.add_argument('--min-count', type=int, default=20)
+    run.add_argument('--users', type=int, default=1000,
+                     help='number of users to recommend movies to')
+    run.add_argument('--no-baseline', dest='baseline', action='store_false',
+                     help='skip the stages of the lab\'s own code path')
+    run.add_argument('--trace-memory', action='store_true',
+                     help='record the peak Python allocations of every stage with tracemalloc')
+    run.add_argument('--report', default='benchmark_lab4.json')
+
+    compare = commands.add_parser('compare', help='compare two reports')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--tolerance', type=float, default=0.1,
+                         help='relative slowdown (or shuffle growth) reported as a regression')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        return _run(args)
+    if args.command == 'compare':
+        return _compare(args)
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
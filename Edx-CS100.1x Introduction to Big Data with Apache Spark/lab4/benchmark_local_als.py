@@ -0,0 +1,107 @@
+""" Compare LocalALS with pyspark.mllib ALS on the same ratings.
+
+Splits a ratings file 80/20 with a fixed seed, trains both backends for each rank and reports the
+wall time of training plus predicting the held-out pairs, and the held-out RMSE. MLlib is skipped
+if pyspark cannot be imported.
+
+    python benchmark_local_als.py --ratings data/cs100/lab4/small/ratings.dat.gz --ranks 4 8 12
+"""
+from __future__ import print_function
+
+import argparse
+import gzip
+import io
+import os
+import time
+
+import numpy as np
+
+from local_als import LocalALS
+from ratings_parser import parseRatingsBlocks
+
+
+def readRatings(filename):
+    """ Read a ratings file into NumPy columns
+    Args:
+        filename (str): path to ratings.dat(.gz)
+    Returns:
+        tuple: (user ids, movie ids, ratings) arrays
+    """
+    raw = gzip.open(filename, 'rb') if filename.endswith('.gz') else io.open(filename, 'rb')
+    with io.TextIOWrapper(raw, encoding='utf-8', errors='replace') as lines:
+        blocks = list(parseRatingsBlocks(line.rstrip(u'\n') for line in lines))
+    return tuple(np.concatenate([block[i] for block in blocks]) for i in range(3))
+
+
+def rmse(predicted, actual):
+    """ Root mean squared error between two aligned arrays """
+    return float(np.sqrt(np.mean((np.asarray(predicted) - np.asarray(actual)) ** 2)))
+
+
+def benchmarkLocal(train, test, rank, iterations, lambda_, seed):
+    """ Train and evaluate LocalALS
+    Returns:
+        tuple: (seconds, held-out RMSE)
+    """
+    start = time.time()
+    model = LocalALS.train(list(zip(*[column.tolist() for column in train])), rank,
+                           iterations=iterations, lambda_=lambda_, seed=seed)
+    known, scores = model.predictPairs(test[0], test[1])
+    return time.time() - start, rmse(scores, test[2][known])
+
+
+def benchmarkMLlib(sc, trainingRDD, test, rank, iterations, lambda_, seed):
+    """ Train and evaluate pyspark.mllib ALS
+    Returns:
+        tuple: (seconds, held-out RMSE)
+    """
+    from pyspark.mllib.recommendation import ALS
+    from evaluation import computeErrors
+
+    testRDD = sc.parallelize(list(zip(*[column.tolist() for column in test])))
+    start = time.time()
+    model = ALS.train(trainingRDD, rank, seed=seed, iterations=iterations, lambda_=lambda_)
+    metrics = computeErrors(model.predictAll(testRDD.map(lambda x: (x[0], x[1]))), testRDD)
+    return time.time() - start, metrics.rmse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ratings', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                          'ratings.dat.gz'))
+    parser.add_argument('--ranks', type=int, nargs='+', default=[4, 8, 12])
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--lambda', dest='lambda_', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    users, movies, ratings = readRatings(args.ratings)
+    inTraining = np.random.RandomState(args.seed).rand(len(ratings)) < 0.8
+    train = (users[inTraining], movies[inTraining], ratings[inTraining])
+    test = (users[~inTraining], movies[~inTraining], ratings[~inTraining])
+
+    try:
+        from pyspark import SparkContext
+        sc = SparkContext('local[*]', 'benchmark_local_als')
+        trainingRDD = sc.parallelize(list(zip(*[column.tolist() for column in train]))).cache()
+    except ImportError:
+        sc = None
+
+    print('%6s %14s %14s %14s %14s' % ('rank', 'LocalALS s', 'LocalALS RMSE', 'MLlib s',
+                                       'MLlib RMSE'))
+    for rank in args.ranks:
+        localSeconds, localError = benchmarkLocal(train, test, rank, args.iterations,
+                                                  args.lambda_, args.seed)
+        if sc is not None:
+            mllibSeconds, mllibError = benchmarkMLlib(sc, trainingRDD, test, rank,
+                                                      args.iterations, args.lambda_, args.seed)
+            print('%6d %14.2f %14.6f %14.2f %14.6f' % (rank, localSeconds, localError,
+                                                       mllibSeconds, mllibError))
+        else:
+            print('%6d %14.2f %14.6f %14s %14s' % (rank, localSeconds, localError, '-', '-'))
+    if sc is not None:
+        sc.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+""" Side-by-side timing of lab4 part 1 with pair RDDs and with DataFrames over Parquet.
+
+Runs the part 1 chain of the lab (``groupByKey``, ``getCountsAndAverages``, join with
+``moviesRDD``, filter, ``sortBy(sortFunction)``, ``take(20)``) and the DataFrame and SQL versions
+of ``movie_sql`` on the same data, checks that they return the same top movies, and prints the
+time, shuffle bytes and tasks of each (from ``spark_metrics.PipelineMetrics``). The Parquet copy is
+written once, and not timed. The RDDs and the DataFrames are cached and materialized before the
+timed runs, so every run starts from data in memory and compares the plans, not gzip and text
+parsing against Parquet.
+
+    python benchmark_movie_sql.py --ratings data/cs100/lab4/small/ratings.dat.gz \\
+                                  --movies data/cs100/lab4/small/movies.dat --parquet lab4-parquet
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+from movie_sql import asTuples, loadParquet, topRatedMovies, topRatedMoviesSQL, writeParquet
+from ratings_parser import loadRatingsAndMovies
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from spark_metrics import PipelineMetrics  # noqa: E402
+
+
+def getCountsAndAverages(IDandRatingsTuple):
+    """ Calculate average rating
+    Args:
+        IDandRatingsTuple: a single tuple of (MovieID, (Rating1, Rating2, Rating3, ...))
+    Returns:
+        tuple: a tuple of (MovieID, (number of ratings, averageRating))
+    """
+    ratings = list(IDandRatingsTuple[1])
+    return IDandRatingsTuple[0], (len(ratings), float(sum(ratings)) / len(ratings))
+
+
+def sortFunction(tuple):
+    """ Construct the sort string (does not perform actual sorting)
+    Args:
+        tuple: (rating, MovieName)
+    Returns:
+        sortString: the value to sort with, 'rating MovieName'
+    """
+    key = u'%.3f' % tuple[0]
+    value = tuple[1]
+    return (key + u' ' + value)
+
+
+def topRatedMoviesRDD(ratingsRDD, moviesRDD, minCount=500):
+    """ ``movieLimitedAndSortedByRatingRDD`` as written in the lab """
+    movieIDsWithAvgRatingsRDD = (ratingsRDD
+                                 .map(lambda x: (x[1], x[2]))
+                                 .groupByKey()
+                                 .map(getCountsAndAverages))
+    return (moviesRDD
+            .join(movieIDsWithAvgRatingsRDD)
+            .map(lambda x: (x[1][1][1], x[1][0], x[1][1][0]))
+            .filter(lambda x: x[2] > minCount)
+            .sortBy(sortFunction, False))
+
+
+def _session(sc):
+    """ A SparkSession, or an SQLContext on Spark 1.x """
+    try:
+        from pyspark.sql import SparkSession
+        return SparkSession(sc)
+    except ImportError:
+        from pyspark.sql import SQLContext
+        return SQLContext(sc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ratings', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                          'ratings.dat.gz'))
+    parser.add_argument('--movies', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                         'movies.dat'))
+    parser.add_argument('--parquet', default='lab4-parquet')
+    parser.add_argument('--master', default='local[*]')
+    parser.add_argument('--min-count', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    from pyspark import SparkContext
+
+    sc = SparkContext(args.master, 'benchmark_movie_sql')
+    session = _session(sc)
+    try:
+        if not os.path.isdir(os.path.join(args.parquet, 'movies.parquet')):
+            print('Writing Parquet copies to %s' % args.parquet)
+            writeParquet(session, args.ratings, args.movies, args.parquet)
+        ratingsRDD, moviesRDD = loadRatingsAndMovies(sc, args.ratings, args.movies)
+        ratingsDF, moviesDF = loadParquet(session, args.parquet)
+        for data in (ratingsRDD, moviesRDD, ratingsDF, moviesDF):
+            data.cache().count()
+
+        metrics = PipelineMetrics(sc)
+        results = {}
+        for attempt in range(args.repeat):
+            with metrics.step('rdd'):
+                results['rdd'] = topRatedMoviesRDD(ratingsRDD, moviesRDD, args.min_count).take(20)
+            with metrics.step('dataframe'):
+                results['dataframe'] = asTuples(topRatedMovies(ratingsDF, moviesDF,
+                                                               args.min_count), 20)
+            with metrics.step('sql'):
+                results['sql'] = asTuples(topRatedMoviesSQL(session, ratingsDF, moviesDF,
+                                                            args.min_count), 20)
+        metrics.printTable()
+
+        expected = [(title, count) for _, title, count in results['rdd']]
+        for name in ('dataframe', 'sql'):
+            same = [(title, count) for _, title, count in results[name]] == expected
+            print('%s returns the same top 20 as the RDD chain: %s' % (name, same))
+    finally:
+        sc.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+""" Compare the per-line lab4 parsers with the block parsers in ratings_parser.
+
+Measures lines/sec for ``get_ratings_tuple`` (as written in the lab), ``parseRatingsPartition``
+(same tuples) and ``parseRatingsBlocks`` (NumPy columns) on the bundled ratings file and on a
+synthetic file, which is written once and reused. Only parsing is timed, not reading the file.
+
+    python benchmark_parsers.py --ratings data/cs100/lab4/small/ratings.dat.gz \\
+                                --synthetic /tmp/ratings-20M.dat --synthetic-lines 20000000
+"""
+from __future__ import print_function
+
+import argparse
+import gzip
+import io
+import os
+import random
+import time
+from itertools import islice
+
+from ratings_parser import parseRatingsBlocks, parseRatingsPartition
+
+CHUNK_LINES = 1000000
+
+
+def get_ratings_tuple(entry):
+    """ Parse a line in the ratings dataset
+    Args:
+        entry (str): a line in the ratings dataset in the form of UserID::MovieID::Rating::Timestamp
+    Returns:
+        tuple: (UserID, MovieID, Rating)
+    """
+    items = entry.split('::')
+    return int(items[0]), int(items[1]), float(items[2])
+
+
+def writeSyntheticRatings(filename, numLines, numUsers=138000, numMovies=27000, seed=0):
+    """ Write a synthetic ratings file in the MovieLens format
+    Args:
+        filename (str): output path
+        numLines (int): number of ratings to write
+        numUsers (int): number of distinct users
+        numMovies (int): number of distinct movies
+        seed (int): random seed
+    """
+    rand = random.Random(seed)
+    stars = ['0.5', '1', '1.5', '2', '2.5', '3', '3.5', '4', '4.5', '5']
+    with io.open(filename, 'w', encoding='ascii') as output:
+        for start in range(0, numLines, CHUNK_LINES):
+            lines = [u'%d::%d::%s::%d\n' % (rand.randint(1, numUsers), rand.randint(1, numMovies),
+                                             rand.choice(stars), rand.randint(789652009, 1427784002))
+                     for _ in range(min(CHUNK_LINES, numLines - start))]
+            output.write(u''.join(lines))
+
+
+def _readChunks(filename):
+    """ Read a ratings file in chunks of lines without trailing newlines
+    Args:
+        filename (str): path to a ratings file, optionally gzipped
+    Returns:
+        generator: lists of at most CHUNK_LINES lines
+    """
+    raw = gzip.open(filename, 'rb') if filename.endswith('.gz') else io.open(filename, 'rb')
+    with io.TextIOWrapper(raw, encoding='utf-8', errors='replace') as lines:
+        stripped = (line.rstrip(u'\n') for line in lines)
+        while True:
+            chunk = list(islice(stripped, CHUNK_LINES))
+            if not chunk:
+                return
+            yield chunk
+
+
+def benchmarkFile(filename):
+    """ Time every parser over all lines of a file and check that the tuples agree
+    Args:
+        filename (str): path to a ratings file
+    Returns:
+        dict: number of lines and lines/sec for each parser
+    """
+    numLines, perLineSeconds, tupleSeconds, blockSeconds = 0, 0.0, 0.0, 0.0
+    for chunk in _readChunks(filename):
+        start = time.time()
+        expected = [get_ratings_tuple(line) for line in chunk]
+        perLineSeconds += time.time() - start
+
+        start = time.time()
+        actual = list(parseRatingsPartition(chunk))
+        tupleSeconds += time.time() - start
+
+        start = time.time()
+        list(parseRatingsBlocks(chunk))
+        blockSeconds += time.time() - start
+
+        assert actual == expected, 'block parser disagrees with get_ratings_tuple'
+        numLines += len(chunk)
+    return {'lines': numLines,
+            'get_ratings_tuple': numLines / perLineSeconds,
+            'parseRatingsPartition': numLines / tupleSeconds,
+            'parseRatingsBlocks': numLines / blockSeconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ratings', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                          'ratings.dat.gz'))
+    parser.add_argument('--synthetic', default=None,
+                        help='synthetic ratings file, generated if it does not exist')
+    parser.add_argument('--synthetic-lines', type=int, default=20000000)
+    args = parser.parse_args()
+
+    files = []
+    if os.path.exists(args.ratings):
+        files.append(args.ratings)
+    if args.synthetic:
+        if not os.path.exists(args.synthetic):
+            print('Writing %d synthetic ratings to %s' % (args.synthetic_lines, args.synthetic))
+            writeSyntheticRatings(args.synthetic, args.synthetic_lines)
+        files.append(args.synthetic)
+
+    print('%-24s %10s %20s %24s %20s' % ('file', 'lines', 'get_ratings_tuple/s',
+                                         'parseRatingsPartition/s', 'parseRatingsBlocks/s'))
+    for filename in files:
+        result = benchmarkFile(filename)
+        baseline = result['get_ratings_tuple']
+        print('%-24s %10d %20.0f %17.0f (%3.1fx) %13.0f (%3.1fx)' % (
+            os.path.basename(filename), result['lines'], baseline,
+            result['parseRatingsPartition'], result['parseRatingsPartition'] / baseline,
+            result['parseRatingsBlocks'], result['parseRatingsBlocks'] / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+""" Time lab4 ingest with the hard-coded two partitions against planned partition counts.
+
+For every master (e.g. local[8] and local[32]) reads the ratings file three ways -- the lab's
+``textFile(...).repartition(2)``, ``loadRatingsAndMovies`` with planned partitions, and the same
+with ``coalesce=True`` -- and times parsing plus the per-movie counts and averages, which is what
+part 1 of the lab computes from ``ratingsRDD``.
+
+    python benchmark_partitioning.py --ratings data/cs100/lab4/small/ratings.dat.gz \\
+                                     --masters 'local[8]' 'local[32]'
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import time
+
+from movie_stats import movieCountsAndAverages
+from partition_planner import inputSize, planPartitions
+from ratings_parser import loadRatingsAndMovies, parseRatingsPartition
+
+
+def timeIngest(ratingsRDD):
+    """ Seconds to parse the ratings and compute the per-movie counts and averages """
+    start = time.time()
+    movieCountsAndAverages(ratingsRDD).count()
+    return time.time() - start
+
+
+def benchmarkMaster(master, ratingsFilename, moviesFilename):
+    """ Time the three ways of reading the ratings on one master
+    Returns:
+        list: (variant, number of partitions, seconds) tuples
+    """
+    from pyspark import SparkContext
+
+    sc = SparkContext(master, 'benchmark_partitioning')
+    try:
+        variants = [('repartition(2)', sc.textFile(ratingsFilename).repartition(2)
+                     .mapPartitions(parseRatingsPartition)),
+                    ('planned', loadRatingsAndMovies(sc, ratingsFilename, moviesFilename)[0]),
+                    ('planned, coalesce', loadRatingsAndMovies(sc, ratingsFilename, moviesFilename,
+                                                               coalesce=True)[0])]
+        print('%s: %d cores, plan of %d partitions' % (
+            master, sc.defaultParallelism, planPartitions(sc, inputSize(ratingsFilename))))
+        return [(name, ratingsRDD.getNumPartitions(), timeIngest(ratingsRDD))
+                for name, ratingsRDD in variants]
+    finally:
+        sc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ratings', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                          'ratings.dat.gz'))
+    parser.add_argument('--movies', default=os.path.join('data', 'cs100', 'lab4', 'small',
+                                                         'movies.dat'))
+    parser.add_argument('--masters', nargs='+', default=['local[8]', 'local[32]'])
+    args = parser.parse_args()
+
+    print('%-12s %-20s %11s %10s %8s' % ('master', 'variant', 'partitions', 'seconds',
+                                         'speedup'))
+    for master in args.masters:
+        results = benchmarkMaster(master, args.ratings, args.movies)
+        baseline = results[0][2]
+        for name, numPartitions, seconds in results:
+            print('%-12s %-20s %11d %10.2f %7.1fx' % (master, name, numPartitions, seconds,
+                                                      baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+""" Compare lab4's string sort key with the numeric key and heap top-k of ranking.py.
+
+Generates (average rating, title, number of ratings) tuples like ``movieNameWithAvgRatingsRDD``,
+checks that all paths return the same top k, and times them: in plain Python always, and through
+``sortBy(...).take(k)`` versus ``topByRating`` on a local SparkContext when pyspark is available.
+
+    python benchmark_ranking.py --movies 1000000 --k 20
+"""
+from __future__ import print_function
+
+import argparse
+import heapq
+import random
+import time
+
+from ranking import ratingTitleKey, topByRating
+
+try:
+    unicode
+except NameError:
+    unicode = str
+
+
+def sortFunction(tuple):
+    """ Construct the sort string (does not perform actual sorting)
+    Args:
+        tuple: (rating, MovieName)
+    Returns:
+        sortString: the value to sort with, 'rating MovieName'
+    """
+    key = unicode('%.3f' % tuple[0])
+    value = tuple[1]
+    return (key + ' ' + value)
+
+
+def syntheticAverages(numMovies, seed=0):
+    """ Random (average rating, title, count) tuples with many rating ties
+    Args:
+        numMovies (int): number of tuples
+        seed (int): random seed
+    Returns:
+        list: the tuples
+    """
+    rand = random.Random(seed)
+    averages = []
+    for movieID in range(numMovies):
+        count = rand.randint(1, 2000)
+        average = rand.randint(count, 5 * count) / float(count)
+        averages.append((average, u'Movie %d (%d)' % (movieID, rand.randint(1920, 2015)), count))
+    return averages
+
+
+def timed(function, *args):
+    """ Run function(*args) and return (result, seconds) """
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--movies', type=int, default=1000000)
+    parser.add_argument('--k', type=int, default=20)
+    parser.add_argument('--partitions', type=int, default=8)
+    args = parser.parse_args()
+    averages = syntheticAverages(args.movies)
+
+    expected, stringSeconds = timed(
+        lambda: sorted(averages, key=sortFunction, reverse=True)[:args.k])
+    numeric, numericSeconds = timed(
+        lambda: sorted(averages, key=ratingTitleKey, reverse=True)[:args.k])
+    heap, heapSeconds = timed(lambda: heapq.nlargest(args.k, averages, key=ratingTitleKey))
+    assert [ratingTitleKey(x) for x in numeric] == [ratingTitleKey(x) for x in expected]
+    assert [ratingTitleKey(x) for x in heap] == [ratingTitleKey(x) for x in expected]
+    print('Python, %d tuples, top %d' % (args.movies, args.k))
+    print('  sorted(key=sortFunction)     %8.3f s' % stringSeconds)
+    print('  sorted(key=ratingTitleKey)   %8.3f s' % numericSeconds)
+    print('  heapq.nlargest               %8.3f s' % heapSeconds)
+
+    try:
+        from pyspark import SparkContext
+    except ImportError:
+        return
+    sc = SparkContext('local[%d]' % args.partitions, 'benchmark_ranking')
+    rdd = sc.parallelize(averages, args.partitions).cache()
+    rdd.count()
+    sortedTop, sortSeconds = timed(lambda: rdd.sortBy(sortFunction, False).take(args.k))
+    heapTop, topSeconds = timed(topByRating, rdd, args.k)
+    assert [ratingTitleKey(x) for x in heapTop] == [ratingTitleKey(x) for x in sortedTop]
+    print('Spark, %d partitions' % args.partitions)
+    print('  sortBy(sortFunction).take    %8.3f s' % sortSeconds)
+    print('  topByRating                  %8.3f s' % topSeconds)
+    sc.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+""" Latency and recall of MovieIndex against brute-force "movies like this" queries.
+
+Trains LocalALS on a ratings file (or draws random factors for ``--movies`` movies when no ratings
+file is given), builds the index, saves and memory-maps it, then reports the mean query time and
+recall@k against brute force for several values of nprobe. Indexes over fewer than
+``MIN_INDEXED_MOVIES`` movies always scan every movie.
+
+    python benchmark_similar_movies.py --ratings data/cs100/lab4/small/ratings.dat.gz --rank 12
+    python benchmark_similar_movies.py --movies 50000 --rank 32 --nprobe 1 4 16
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from similar_movies import MIN_INDEXED_MOVIES, MovieIndex
+
+
+def trainFactors(ratingsFilename, rank, iterations, lambda_):
+    """ Product factors of LocalALS trained on a ratings file
+    Returns:
+        tuple: (list of MovieIDs, product factor matrix)
+    """
+    from benchmark_local_als import readRatings
+    from local_als import LocalALS
+
+    users, movies, ratings = readRatings(ratingsFilename)
+    model = LocalALS.train(list(zip(users.tolist(), movies.tolist(), ratings.tolist())), rank,
+                           iterations=iterations, lambda_=lambda_, seed=5)
+    return list(model.productIDs), model.productMatrix
+
+
+def timeQueries(function, movieIDs):
+    """ Mean seconds per call of function(movieID) """
+    start = time.time()
+    for movieID in movieIDs:
+        function(movieID)
+    return (time.time() - start) / len(movieIDs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ratings', default=None)
+    parser.add_argument('--movies', type=int, default=27000,
+                        help='number of random movies when no ratings file is given')
+    parser.add_argument('--rank', type=int, default=12)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--lambda', dest='lambda_', type=float, default=0.1)
+    parser.add_argument('--metric', choices=['cosine', 'dot'], default='cosine')
+    parser.add_argument('--lists', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.ratings:
+        productIDs, productMatrix = trainFactors(args.ratings, args.rank, args.iterations,
+                                                 args.lambda_)
+    else:
+        productIDs = list(range(1, args.movies + 1))
+        productMatrix = np.random.RandomState(0).normal(size=(args.movies, args.rank))
+
+    start = time.time()
+    index = MovieIndex.build(productIDs, productMatrix, args.lists, args.metric)
+    print('Built %d lists over %d movies in %.2f s' % (index.centroids.shape[0], len(productIDs),
+                                                        time.time() - start))
+    directory = os.path.join(tempfile.mkdtemp(), 'index')
+    index.save(directory)
+    index = MovieIndex.load(directory)
+
+    if len(productIDs) < MIN_INDEXED_MOVIES:
+        print('Fewer than %d movies: every query is answered by brute force' % MIN_INDEXED_MOVIES)
+    queries = np.random.RandomState(1).choice(productIDs, min(args.queries, len(productIDs)),
+                                              replace=False).tolist()
+    exactSeconds = timeQueries(lambda m: index.similarMovies(m, args.k, exact=True), queries)
+    print('%8s %12s %10s' % ('nprobe', 'ms/query', 'recall@%d' % args.k))
+    print('%8s %12.3f %10.3f' % ('exact', exactSeconds * 1000, 1.0))
+    for nprobe in args.nprobe:
+        seconds = timeQueries(lambda m: index.similarMovies(m, args.k, nprobe), queries)
+        print('%8d %12.3f %10.3f' % (nprobe, seconds * 1000, index.recall(queries, args.k, nprobe)))
+
+
+if __name__ == '__main__':
+    main()
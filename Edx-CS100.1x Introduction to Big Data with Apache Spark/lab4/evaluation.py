@@ -0,0 +1,104 @@
+""" Single-pass rating error metrics for the lab4 models.
+
+``computeError`` joins the predicted and actual ratings and then runs two actions (``reduce`` and
+``count``) on the uncached join, so the join runs twice per call. ``computeErrors`` does one join
+and one ``aggregate`` and returns RMSE, MAE and the number of matched ratings together.
+``RatingsEvaluator`` additionally keeps the actual ratings hash-partitioned by (UserID, MovieID)
+and cached, so evaluating many models against the same validation set only shuffles the
+predictions.
+"""
+import math
+from collections import namedtuple
+
+ErrorMetrics = namedtuple('ErrorMetrics', ['rmse', 'mae', 'count'])
+
+
+def keyByUserMovie(ratingsRDD):
+    """ Key a ratings RDD by (UserID, MovieID)
+    Args:
+        ratingsRDD: RDD of (UserID, MovieID, Rating) tuples
+    Returns:
+        RDD: ((UserID, MovieID), Rating) pairs
+    """
+    return ratingsRDD.map(lambda x: ((x[0], x[1]), x[2]))
+
+
+def _addError(totals, ratings):
+    """ Fold one (predicted, actual) pair into (squared error, absolute error, count) totals """
+    error = ratings[0] - ratings[1]
+    return totals[0] + error * error, totals[1] + abs(error), totals[2] + 1
+
+
+def _mergeTotals(left, right):
+    """ Merge two (squared error, absolute error, count) totals """
+    return left[0] + right[0], left[1] + right[1], left[2] + right[2]
+
+
+def _errorMetrics(joinedRDD):
+    """ Compute the error metrics of a joined RDD with a single action
+    Args:
+        joinedRDD: RDD of ((UserID, MovieID), (predicted rating, actual rating)) pairs
+    Returns:
+        ErrorMetrics: RMSE, MAE and count; RMSE and MAE are NaN when nothing matched
+    """
+    squaredError, absoluteError, count = (joinedRDD
+                                          .values()
+                                          .aggregate((0.0, 0.0, 0), _addError, _mergeTotals))
+    if count == 0:
+        return ErrorMetrics(float('nan'), float('nan'), 0)
+    return ErrorMetrics(math.sqrt(squaredError / count), absoluteError / count, count)
+
+
+def computeErrors(predictedRDD, actualRDD):
+    """ Compute RMSE, MAE and count between predicted and actual ratings with one join
+    Args:
+        predictedRDD: predicted ratings, entries of the form (UserID, MovieID, Rating)
+        actualRDD: actual ratings, entries of the form (UserID, MovieID, Rating)
+    Returns:
+        ErrorMetrics: RMSE, MAE and number of (UserID, MovieID) pairs present in both RDDs
+    """
+    return _errorMetrics(keyByUserMovie(predictedRDD).join(keyByUserMovie(actualRDD)))
+
+
+class RatingsEvaluator(object):
+    """ Evaluate many sets of predictions against the same actual ratings
+
+    The actual ratings are keyed and hash-partitioned by (UserID, MovieID) once. Each set of
+    predictions is partitioned with the same partitioner, so the join needs no further shuffle of
+    the actual side.
+    """
+
+    def __init__(self, actualRDD, numPartitions=None, cache=True):
+        """ Key and partition the actual ratings
+        Args:
+            actualRDD: actual ratings, entries of the form (UserID, MovieID, Rating)
+            numPartitions (int): partitions used for the join, defaults to those of actualRDD
+            cache (bool): keep the partitioned actual ratings in memory between calls
+        """
+        self.numPartitions = numPartitions or actualRDD.getNumPartitions()
+        self.actualByKeyRDD = keyByUserMovie(actualRDD).partitionBy(self.numPartitions)
+        if cache:
+            self.actualByKeyRDD.cache()
+
+    def evaluate(self, predictedRDD):
+        """ Compare predictions with the actual ratings
+        Args:
+            predictedRDD: predicted ratings, entries of the form (UserID, MovieID, Rating)
+        Returns:
+            ErrorMetrics: RMSE, MAE and number of matched ratings
+        """
+        predictedByKeyRDD = keyByUserMovie(predictedRDD).partitionBy(self.numPartitions)
+        return _errorMetrics(predictedByKeyRDD.join(self.actualByKeyRDD, self.numPartitions))
+
+    def computeError(self, predictedRDD):
+        """ Root mean squared error of the predictions, as returned by lab4's ``computeError``
+        Args:
+            predictedRDD: predicted ratings, entries of the form (UserID, MovieID, Rating)
+        Returns:
+            float: RMSE
+        """
+        return self.evaluate(predictedRDD).rmse
+
+    def unpersist(self):
+        """ Release the cached actual ratings """
+        self.actualByKeyRDD.unpersist()
@@ -0,0 +1,218 @@
+""" Export a trained ALS model to memory-mapped files and serve predictions from them.
+
+Every prediction in lab4 goes through ``predictAll`` on an RDD, a Spark job per request.
+``exportFactors`` writes the user and product factors, each movie's number of ratings and title,
+and (optionally) the movies each user already rated as ``.npy`` files. ``FactorStore`` memory-maps
+them without copying and answers ``predict`` and ``recommend`` calls in-process, with the same
+arithmetic as ``LocalMatrixFactorizationModel`` and ``TopNRecommender``; it does not need Spark.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from local_als import LocalMatrixFactorizationModel
+from recommender import TopNRecommender
+
+STORE_VERSION = 1
+MANIFEST_NAME = 'factors.json'
+
+
+def _collectFeatures(features):
+    """ (ids, matrix) from (id, factors) pairs, sorted by id
+    Args:
+        features: (id, factors) pairs as a list or an RDD
+    Returns:
+        tuple: (int64 ids, float64 matrix with one row per id)
+    """
+    features = features.collect() if hasattr(features, 'collect') else list(features)
+    features.sort(key=lambda x: x[0])
+    ids = np.array([featureID for featureID, _ in features], dtype=np.int64)
+    return ids, np.array([factors for _, factors in features], dtype=np.float64)
+
+
+def _ratedMovies(ratings, userIDs):
+    """ The movies each user rated, as compressed rows aligned with userIDs
+    Args:
+        ratings: (UserID, MovieID, Rating) tuples as a list or an RDD
+        userIDs (ndarray): sorted UserIDs of the model
+    Returns:
+        tuple: (int64 offsets, int64 MovieIDs); the movies of userIDs[i] are
+               movies[offsets[i]:offsets[i + 1]]
+    """
+    if hasattr(ratings, 'mapPartitions'):
+        # Stream the (user, movie) columns partition by partition instead of collecting tuples
+        pairs = ratings.map(lambda x: (x[0], x[1])).toLocalIterator()
+    else:
+        pairs = ((x[0], x[1]) for x in ratings)
+    users, movies = [], []
+    for user, movie in pairs:
+        users.append(user)
+        movies.append(movie)
+    users, movies = np.array(users, dtype=np.int64), np.array(movies, dtype=np.int64)
+    known = np.isin(users, userIDs)
+    users, movies = users[known], movies[known]
+    order = np.lexsort((movies, users))
+    offsets = np.append(np.searchsorted(users[order], userIDs), len(users))
+    return offsets.astype(np.int64), movies[order]
+
+
+def _asDict(pairs):
+    """ A dict from a dict, a list of pairs or a pair RDD (None gives an empty dict) """
+    if pairs is None:
+        return {}
+    if hasattr(pairs, 'collectAsMap'):
+        return pairs.collectAsMap()
+    return dict(pairs)
+
+
+def exportFactors(model, outputDir, movieCounts=None, titles=None, ratings=None):
+    """ Write the factors of a model and the movie side tables, replacing any previous export
+    Args:
+        model: MatrixFactorizationModel, FoldInModel or LocalMatrixFactorizationModel
+        outputDir (str): directory to (re)create
+        movieCounts: (MovieID, number of ratings) pairs as a dict, a list or an RDD
+        titles: (MovieID, title) pairs as a dict, a list or an RDD (e.g. moviesRDD)
+        ratings: (UserID, MovieID, Rating) tuples whose movies are never recommended back to
+                 their user, e.g. the training ratings
+    Returns:
+        dict: the manifest that was written
+    """
+    userIDs, userMatrix = _collectFeatures(model.userFeatures())
+    productIDs, productMatrix = _collectFeatures(model.productFeatures())
+    movieCounts = _asDict(movieCounts)
+    titles = _asDict(titles)
+
+    parentDir = os.path.dirname(os.path.abspath(outputDir))
+    if not os.path.isdir(parentDir):
+        os.makedirs(parentDir)
+    stagingDir = tempfile.mkdtemp(prefix='.factors-', dir=parentDir)
+    try:
+        arrays = {'user_ids': userIDs, 'user_factors': userMatrix,
+                  'product_ids': productIDs, 'product_factors': productMatrix,
+                  'movie_counts': np.array([movieCounts.get(movie, 0)
+                                            for movie in productIDs.tolist()], dtype=np.int64)}
+        encodedTitles = [(titles.get(movie) or u'').encode('utf-8')
+                         for movie in productIDs.tolist()]
+        arrays['title_offsets'] = np.concatenate(
+            [[0], np.cumsum([len(title) for title in encodedTitles])]).astype(np.int64)
+        if ratings is not None:
+            arrays['rated_offsets'], arrays['rated_movies'] = _ratedMovies(ratings, userIDs)
+        for name, values in arrays.items():
+            np.save(os.path.join(stagingDir, name + '.npy'), values)
+        with open(os.path.join(stagingDir, 'titles.bin'), 'wb') as titlesFile:
+            titlesFile.write(b''.join(encodedTitles))
+        manifest = {'version': STORE_VERSION, 'rank': int(userMatrix.shape[1]),
+                    'users': len(userIDs), 'movies': len(productIDs),
+                    'hasCounts': bool(movieCounts), 'hasRatedMovies': ratings is not None}
+        with open(os.path.join(stagingDir, MANIFEST_NAME), 'w') as manifestFile:
+            json.dump(manifest, manifestFile, indent=2, sort_keys=True)
+        if os.path.isdir(outputDir):
+            shutil.rmtree(outputDir)
+        os.rename(stagingDir, outputDir)
+    except Exception:
+        shutil.rmtree(stagingDir, ignore_errors=True)
+        raise
+    return manifest
+
+
+class FactorStore(object):
+    """ Read-only, memory-mapped view of exported factors """
+
+    def __init__(self, directory, minCount=0):
+        """ Memory-map an export written by exportFactors()
+        Args:
+            directory (str): export directory
+            minCount (int): only recommend movies with more than minCount ratings
+        """
+        with open(os.path.join(directory, MANIFEST_NAME)) as manifestFile:
+            self.manifest = json.load(manifestFile)
+
+        def load(name):
+            return np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+
+        self.userIDs = load('user_ids')
+        self.productIDs = load('product_ids')
+        self.counts = load('movie_counts')
+        self.model = LocalMatrixFactorizationModel(self.userIDs, load('user_factors'),
+                                                   self.productIDs, load('product_factors'))
+        titleOffsets = load('title_offsets').tolist()
+        with open(os.path.join(directory, 'titles.bin'), 'rb') as titlesFile:
+            blob = titlesFile.read()
+        productIDs = self.productIDs.tolist()
+        titles = dict((movie, blob[titleOffsets[i]:titleOffsets[i + 1]].decode('utf-8'))
+                      for i, movie in enumerate(productIDs))
+        movieCounts = dict(zip(productIDs, self.counts.tolist()))
+        self.recommender = TopNRecommender(productIDs, self.model.productMatrix,
+                                           movieCounts if self.manifest['hasCounts'] else None,
+                                           minCount, titles)
+        if self.manifest['hasRatedMovies']:
+            self.ratedOffsets, self.ratedMovies = load('rated_offsets'), load('rated_movies')
+        else:
+            self.ratedOffsets = self.ratedMovies = None
+
+    def userRow(self, user):
+        """ Row of a user in the user factors, or -1 if the user is unknown """
+        row = int(np.searchsorted(self.userIDs, user))
+        return row if row < len(self.userIDs) and self.userIDs[row] == user else -1
+
+    def predictPairs(self, users, movies):
+        """ Predict ratings for aligned sequences of users and movies
+        Args:
+            users: UserIDs
+            movies: MovieIDs
+        Returns:
+            tuple: (boolean mask of the pairs that could be scored, their predicted ratings)
+        """
+        return self.model.predictPairs(np.asarray(users, dtype=np.int64),
+                                       np.asarray(movies, dtype=np.int64))
+
+    def predict(self, user, movie):
+        """ Predict the rating of one user for one movie
+        Args:
+            user (int): UserID
+            movie (int): MovieID
+        Returns:
+            float: predicted rating, or None if the user or the movie is unknown
+        """
+        known, scores = self.predictPairs([user], [movie])
+        return float(scores[0]) if known[0] else None
+
+    def _rated(self, row):
+        """ MovieIDs already rated by the user in a row, empty if they were not exported """
+        if self.ratedOffsets is None:
+            return ()
+        return self.ratedMovies[self.ratedOffsets[row]:self.ratedOffsets[row + 1]].tolist()
+
+    def recommendBatch(self, users, n):
+        """ Recommend movies to several users with one blocked matrix multiply
+        Args:
+            users (list): UserIDs
+            n (int): number of movies per user
+        Returns:
+            list: for each user, (MovieID, predicted rating, title, number of ratings) tuples,
+                  highest rating first; None for unknown users
+        """
+        rows = [self.userRow(user) for user in users]
+        knownRows = [row for row in rows if row >= 0]
+        recommendations = self.recommender.recommendBatch(
+            self.model.userMatrix[knownRows], n, [self._rated(row) for row in knownRows])
+        recommender = self.recommender
+        results = iter([[(movie, score, recommender.titles.get(movie),
+                          int(recommender.counts[recommender.productIndex[movie]]))
+                         for movie, score in userRecommendations]
+                        for userRecommendations in recommendations])
+        return [next(results) if row >= 0 else None for row in rows]
+
+    def recommend(self, user, n):
+        """ Recommend the n movies with the highest predicted rating that the user has not rated
+        Args:
+            user (int): UserID
+            n (int): number of movies
+        Returns:
+            list: (MovieID, predicted rating, title, number of ratings) tuples, or None if the
+                  user is unknown
+        """
+        return self.recommendBatch([user], n)[0]
@@ -0,0 +1,197 @@
+""" Fold new users into a trained ALS model without retraining it.
+
+Adding ``myRatedMovies`` for user 0 in lab4 means unioning them into the training set and running
+``ALS.train`` again. With the product factors held fixed, a new user's factor vector is the
+solution of one small regularized least-squares problem, the same one ALS solves for every user in
+each iteration:
+
+    (Y_u^T Y_u + lambda_ * n_u * I) x_u = Y_u^T r_u
+
+where Y_u holds the factors of the n_u movies the user rated and r_u the ratings. MLlib scales the
+regularization by the number of ratings, and so does ``foldInUsers``.
+"""
+import numpy as np
+
+from pyspark.mllib.recommendation import Rating
+
+
+def productFactors(model):
+    """ Collect the product factors of a model into a dense matrix
+    Args:
+        model: MatrixFactorizationModel, FoldInModel or LocalMatrixFactorizationModel
+    Returns:
+        tuple: (list of MovieIDs, float64 matrix with one row of factors per movie)
+    """
+    if hasattr(model, 'productMatrix'):
+        # FoldInModel and LocalMatrixFactorizationModel already hold them locally
+        return list(model.productIDs), np.asarray(model.productMatrix, dtype=np.float64)
+    features = model.productFeatures().collect()
+    productIDs = [productID for productID, _ in features]
+    return productIDs, np.array([factors for _, factors in features], dtype=np.float64)
+
+
+def solveUserFactors(productIndex, productMatrix, ratings, lambda_):
+    """ Solve the factor vectors of users against fixed product factors
+    Args:
+        productIndex (dict): MovieID -> row of productMatrix
+        productMatrix (ndarray): product factors, one row per movie
+        ratings (list): (UserID, MovieID, Rating) tuples; movies unknown to the model are ignored
+        lambda_ (float): regularization parameter, scaled by each user's number of ratings
+    Returns:
+        dict: UserID -> float64 factor vector
+    """
+    byUser = {}
+    for user, movie, rating in ratings:
+        row = productIndex.get(movie)
+        if row is not None:
+            byUser.setdefault(user, ([], []))
+            byUser[user][0].append(row)
+            byUser[user][1].append(rating)
+    rank = productMatrix.shape[1]
+    userIDs = sorted(byUser)
+    if not userIDs:
+        return {}
+    grams = np.empty((len(userIDs), rank, rank))
+    rightHandSides = np.empty((len(userIDs), rank))
+    for i, user in enumerate(userIDs):
+        rows, userRatings = byUser[user]
+        factors = productMatrix[rows]
+        grams[i] = factors.T.dot(factors) + lambda_ * len(rows) * np.eye(rank)
+        rightHandSides[i] = factors.T.dot(userRatings)
+    # One batched solve for all the new users
+    solutions = np.linalg.solve(grams, rightHandSides[:, :, None])[:, :, 0]
+    return dict(zip(userIDs, solutions))
+
+
+def _scoreFoldedPairs(broadcastFactors):
+    """ Build a mapPartitions function that scores (UserID, MovieID) pairs of folded-in users
+    Args:
+        broadcastFactors: broadcast (user factors dict, product index dict, product matrix)
+    Returns:
+        function: iterator of pairs -> iterator of Rating
+    """
+    def scorePartition(pairs):
+        userFactors, productIndex, productMatrix = broadcastFactors.value
+        for user, product in pairs:
+            row = productIndex.get(product)
+            if row is not None:
+                yield Rating(user, product, float(productMatrix[row].dot(userFactors[user])))
+    return scorePartition
+
+
+class FoldInModel(object):
+    """ An ALS model extended with folded-in users
+
+    Predictions for folded-in users are computed from their solved factors and the base model's
+    product factors; every other user is delegated to the base model.
+    """
+
+    def __init__(self, baseModel, userFactors, productIDs, productMatrix):
+        """ Wrap a base model
+        Args:
+            baseModel: MatrixFactorizationModel the product factors come from
+            userFactors (dict): UserID -> factor vector of the folded-in users
+            productIDs (list): MovieIDs, in the row order of productMatrix
+            productMatrix (ndarray): product factors of the base model
+        """
+        self.baseModel = baseModel
+        self.userFactors = userFactors
+        self.productIDs = productIDs
+        self.productMatrix = productMatrix
+        self.productIndex = dict((productID, row) for row, productID in enumerate(productIDs))
+        self.rank = productMatrix.shape[1]
+
+    def predict(self, user, product):
+        """ Predict the rating of one user for one movie
+        Args:
+            user (int): UserID
+            product (int): MovieID
+        Returns:
+            float: predicted rating; a KeyError names the (user, product) pair when a folded-in
+                   user asks for a movie the model does not know, which predictAll() drops
+        """
+        if user in self.userFactors:
+            row = self.productIndex.get(product)
+            if row is None:
+                raise KeyError((user, product))
+            return float(self.productMatrix[row].dot(self.userFactors[user]))
+        return self.baseModel.predict(user, product)
+
+    def predictAll(self, userProductsRDD):
+        """ Predict ratings for an RDD of (UserID, MovieID) pairs, like ``model.predictAll``
+        Args:
+            userProductsRDD: RDD of (UserID, MovieID) pairs
+        Returns:
+            RDD: Rating(user, product, rating) tuples; pairs with unknown movies are dropped
+        """
+        foldedUsers = frozenset(self.userFactors)
+        broadcastFactors = userProductsRDD.context.broadcast(
+            (self.userFactors, self.productIndex, self.productMatrix))
+        foldedRDD = (userProductsRDD
+                     .filter(lambda pair: pair[0] in foldedUsers)
+                     .mapPartitions(_scoreFoldedPairs(broadcastFactors)))
+        basePairsRDD = userProductsRDD.filter(lambda pair: pair[0] not in foldedUsers)
+        # MLlib's predictAll() fails on an empty RDD, e.g. when every pair is for a folded-in
+        # user as with lab4's myUnratedMoviesRDD
+        if basePairsRDD.isEmpty():
+            return foldedRDD
+        return self.baseModel.predictAll(basePairsRDD).union(foldedRDD)
+
+    def recommendProducts(self, user, num):
+        """ Recommend the movies with the highest predicted rating for a user
+        Args:
+            user (int): UserID
+            num (int): number of movies
+        Returns:
+            list: Rating tuples, highest predicted rating first
+        """
+        if user not in self.userFactors:
+            return self.baseModel.recommendProducts(user, num)
+        scores = self.productMatrix.dot(self.userFactors[user])
+        num = min(num, len(scores))
+        top = np.argpartition(-scores, num - 1)[:num]
+        top = top[np.argsort(-scores[top])]
+        return [Rating(user, self.productIDs[row], float(scores[row])) for row in top]
+
+    def userFeatures(self):
+        """ User factors of the base model plus the folded-in users
+        Returns:
+            RDD: (UserID, factors) pairs
+        """
+        foldedUsers = frozenset(self.userFactors)
+        folded = self.baseModel.userFeatures().context.parallelize(
+            [(user, factors.tolist()) for user, factors in self.userFactors.items()])
+        return (self.baseModel.userFeatures()
+                .filter(lambda x: x[0] not in foldedUsers)
+                .union(folded))
+
+    def productFeatures(self):
+        """ Product factors, unchanged from the base model
+        Returns:
+            RDD: (MovieID, factors) pairs
+        """
+        return self.baseModel.productFeatures()
+
+
+def foldInUsers(model, ratings, lambda_):
+    """ Add new users (or replace the factors of existing ones) without retraining
+    Args:
+        model: trained MatrixFactorizationModel, or a FoldInModel to add more users to
+        ratings: (UserID, MovieID, Rating) tuples of the new users, as a list or a small RDD
+        lambda_ (float): regularization parameter; use the one the model was trained with
+    Returns:
+        FoldInModel: model that predicts for both the original and the new users
+    """
+    if hasattr(ratings, 'collect'):
+        ratings = ratings.collect()
+    if isinstance(model, FoldInModel):
+        baseModel = model.baseModel
+        productIDs, productMatrix = model.productIDs, model.productMatrix
+        userFactors = dict(model.userFactors)
+    else:
+        baseModel = model
+        productIDs, productMatrix = productFactors(model)
+        userFactors = {}
+    productIndex = dict((productID, row) for row, productID in enumerate(productIDs))
+    userFactors.update(solveUserFactors(productIndex, productMatrix, ratings, lambda_))
+    return FoldInModel(baseModel, userFactors, productIDs, productMatrix)
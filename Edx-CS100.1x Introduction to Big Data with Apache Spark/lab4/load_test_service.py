@@ -0,0 +1,106 @@
+""" Load test for prediction_service: QPS and latency percentiles on localhost (Python 3 only).
+
+Opens ``--connections`` keep-alive connections that each send requests back to back for
+``--seconds`` seconds. Users and movies are drawn from the exported factors, so requests hit
+known ids; ``--recommend-fraction`` of them are /recommend, the rest /predict.
+
+    python3 load_test_service.py --factors factors/ --port 8080 --connections 64 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import numpy as np
+
+
+def percentile(values, fraction):
+    """ Value below which the given fraction of the sorted values lies """
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def client(host, port, targets, deadline, latencies, errors):
+    """ Send requests on one connection until the deadline
+    Args:
+        host (str): service address
+        port (int): service port
+        targets (function): () -> (kind, request target)
+        deadline (float): time.perf_counter() value to stop at
+        latencies (dict): kind -> list receiving the latency of each request, in seconds
+        errors (list): receives the status line of every non-200 response
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            kind, target = targets()
+            start = time.perf_counter()
+            writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\n\r\n' % (target, host)).encode('ascii'))
+            statusLine = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies[kind].append(time.perf_counter() - start)
+            if b' 200 ' not in statusLine:
+                errors.append(statusLine.decode('latin-1').strip())
+    finally:
+        writer.close()
+
+
+async def run(args):
+    users = np.load(os.path.join(args.factors, 'user_ids.npy'), mmap_mode='r').tolist()
+    movies = np.load(os.path.join(args.factors, 'product_ids.npy'), mmap_mode='r').tolist()
+    rand = random.Random(args.seed)
+    # A small pool of hot users makes the cache hit rate depend on --hot-fraction
+    hotUsers = rand.sample(users, min(len(users), 100))
+
+    def targets():
+        user = rand.choice(hotUsers if rand.random() < args.hot_fraction else users)
+        if rand.random() < args.recommend_fraction:
+            return 'recommend', '/recommend?user=%d&n=%d' % (user, args.n)
+        return 'predict', '/predict?user=%d&movie=%d' % (user, rand.choice(movies))
+
+    latencies = {'predict': [], 'recommend': []}
+    errors = []
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    await asyncio.gather(*[client(args.host, args.port, targets, deadline, latencies, errors)
+                           for _ in range(args.connections)])
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    print('%d requests in %.1f s: %.0f QPS, %d errors' % (total, elapsed, total / elapsed,
+                                                          len(errors)))
+    print('%-10s %10s %10s %10s %10s' % ('endpoint', 'requests', 'p50 ms', 'p90 ms', 'p99 ms'))
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        print('%-10s %10d %10.3f %10.3f %10.3f' % (
+            kind, len(values), percentile(values, 0.5) * 1000, percentile(values, 0.9) * 1000,
+            percentile(values, 0.99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--factors', required=True, help='directory written by exportFactors')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--recommend-fraction', type=float, default=0.1)
+    parser.add_argument('--hot-fraction', type=float, default=0.5,
+                        help='fraction of requests for 100 hot users')
+    parser.add_argument('--n', type=int, default=10, help='movies per /recommend request')
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+""" In-process ALS for rating sets that fit in the memory of one machine.
+
+For the 500K and 10M MovieLens subsets, starting the JVM-backed ``pyspark.mllib`` ALS costs more
+than the linear algebra itself. ``LocalALS.train`` keeps the ratings as compressed sparse rows (by
+user) and columns (by movie) over densely remapped ids, and alternates between solving all user
+factors and all movie factors. Each half-iteration is cut into blocks of consecutive users (or
+movies); a block forms all its normal equations with ``np.add.reduceat`` and solves them with one
+batched ``np.linalg.solve``. Blocks are spread over a process pool whose workers read and write the
+factors in shared memory, so a task is only the range of rows to solve.
+
+The surface mirrors MLlib, ``LocalALS.train(ratings, rank, iterations, lambda_, seed)`` and
+``model.predictAll(pairs)``, so the lab4 grid search and ``computeError`` can use either backend.
+Regularization is scaled by the number of ratings of each user or movie, as in MLlib. Unlike
+MLlib's, the model's ``userFeatures()`` and ``productFeatures()`` return lists unless they are
+given a SparkContext.
+"""
+import multiprocessing
+
+import numpy as np
+
+from ratings_matrix import RatingsMatrix, denseIndex
+
+# Upper bound on the float64 entries of a block's ratings x rank x rank temporary (32 MB)
+BLOCK_ENTRIES = 1 << 22
+
+
+def _rowBlocks(indptr, blockRatings):
+    """ Cut the rows of a sparse matrix into runs holding about blockRatings entries each
+    Args:
+        indptr (ndarray): row pointers of the matrix
+        blockRatings (int): target number of entries per block
+    Returns:
+        list: (first row, stop row) pairs covering every row
+    """
+    numRows = len(indptr) - 1
+    blocks = []
+    start = 0
+    while start < numRows:
+        stop = int(np.searchsorted(indptr, indptr[start] + blockRatings, side='right')) - 1
+        stop = min(max(stop, start + 1), numRows)
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+def solveBlock(matrix, start, stop, fixedFactors, lambda_):
+    """ Solve the regularized least-squares factors of the rows start..stop-1
+    Args:
+        matrix (SparseRatings): ratings grouped by the side being solved
+        start (int): first row of the block
+        stop (int): row after the last row of the block
+        fixedFactors (ndarray): factors of the other side, one row per column of matrix
+        lambda_ (float): regularization, scaled by each row's number of ratings
+    Returns:
+        ndarray: factors of the block's rows, shape (stop - start, rank)
+    """
+    rank = fixedFactors.shape[1]
+    first, last = matrix.indptr[start], matrix.indptr[stop]
+    factors = fixedFactors[matrix.indices[first:last]]
+    counts = np.diff(matrix.indptr[start:stop + 1])
+    if stop - start == 1:
+        # A lone row may hold more ratings than a block allows: form its equation without the
+        # per-rating outer products
+        gram = factors.T.dot(factors) + lambda_ * counts[0] * np.eye(rank)
+        return np.linalg.solve(gram, factors.T.dot(matrix.values[first:last]))[None, :]
+    offsets = matrix.indptr[start:stop] - first
+    grams = np.add.reduceat(factors[:, :, None] * factors[:, None, :], offsets, axis=0)
+    grams += (lambda_ * counts)[:, None, None] * np.eye(rank)
+    rightHandSides = np.add.reduceat(factors * matrix.values[first:last, None], offsets, axis=0)
+    return np.linalg.solve(grams, rightHandSides[:, :, None])[:, :, 0]
+
+
+def _sharedMatrix(rows, columns):
+    """ Zeroed float64 matrix in shared memory
+    Returns:
+        tuple: (RawArray to hand to the pool's workers, ndarray view of it)
+    """
+    buffer = multiprocessing.RawArray('d', rows * columns)
+    return buffer, np.ctypeslib.as_array(buffer).reshape(rows, columns)
+
+
+# Sparse matrices and shared factors of the training run, set up once per worker process
+_workerState = {}
+
+_OTHER_SIDE = {'users': 'movies', 'movies': 'users'}
+
+
+def _initWorker(byUser, byMovie, userBuffer, movieBuffer, rank, lambda_):
+    """ Pool initializer: keep the sparse matrices and map the shared factors in the worker """
+    _workerState['users'] = (byUser, np.ctypeslib.as_array(userBuffer).reshape(-1, rank))
+    _workerState['movies'] = (byMovie, np.ctypeslib.as_array(movieBuffer).reshape(-1, rank))
+    _workerState['lambda'] = lambda_
+
+
+def _solveWorkerBlock(args):
+    """ Pool task: solve the rows start..stop-1 of one side into its shared factors """
+    side, start, stop = args
+    matrix, factors = _workerState[side]
+    fixedFactors = _workerState[_OTHER_SIDE[side]][1]
+    factors[start:stop] = solveBlock(matrix, start, stop, fixedFactors, _workerState['lambda'])
+
+
+def _solveSide(pool, side, matrix, blocks, fixedFactors, factors, lambda_):
+    """ Solve every row of one side into factors (in place), block by block, in the pool if there
+    is one; the pool's workers see fixedFactors and factors through shared memory
+    """
+    if pool is None:
+        for start, stop in blocks:
+            factors[start:stop] = solveBlock(matrix, start, stop, fixedFactors, lambda_)
+    else:
+        pool.map(_solveWorkerBlock, [(side, start, stop) for start, stop in blocks])
+
+
+class LocalMatrixFactorizationModel(object):
+    """ Factors learned by LocalALS, with the prediction methods of MLlib's model """
+
+    def __init__(self, userIDs, userMatrix, productIDs, productMatrix):
+        """ Index the factors
+        Args:
+            userIDs (ndarray): UserIDs, in the row order of userMatrix
+            userMatrix (ndarray): user factors
+            productIDs (ndarray): MovieIDs, in the row order of productMatrix
+            productMatrix (ndarray): movie factors
+        """
+        self.userIDs = userIDs
+        self.userMatrix = userMatrix
+        self.productIDs = productIDs
+        self.productMatrix = productMatrix
+        self.rank = userMatrix.shape[1]
+
+    def predictPairs(self, users, products):
+        """ Predict ratings for aligned arrays of users and movies
+        Args:
+            users (ndarray): UserIDs
+            products (ndarray): MovieIDs
+        Returns:
+            tuple: (boolean mask of the pairs that could be scored, their predicted ratings)
+        """
+        users, products = np.asarray(users), np.asarray(products)
+        userRows = denseIndex(self.userIDs, users)
+        productRows = denseIndex(self.productIDs, products)
+        known = (userRows >= 0) & (productRows >= 0)
+        scores = np.einsum('ij,ij->i', self.userMatrix[userRows[known]],
+                           self.productMatrix[productRows[known]])
+        return known, scores
+
+    def predict(self, user, product):
+        """ Predict the rating of one user for one movie
+        Args:
+            user (int): UserID
+            product (int): MovieID
+        Returns:
+            float: predicted rating
+        """
+        known, scores = self.predictPairs([user], [product])
+        if not known[0]:
+            raise KeyError((user, product))
+        return float(scores[0])
+
+    def _predictList(self, pairs):
+        """ Predict a list of (UserID, MovieID) pairs, dropping unknown users and movies """
+        pairs = list(pairs)
+        users = np.array([pair[0] for pair in pairs], dtype=np.int64)
+        products = np.array([pair[1] for pair in pairs], dtype=np.int64)
+        known, scores = self.predictPairs(users, products)
+        return list(zip(users[known].tolist(), products[known].tolist(), scores.tolist()))
+
+    def predictAll(self, userProducts):
+        """ Predict ratings for (UserID, MovieID) pairs, dropping unknown users and movies
+        Args:
+            userProducts: (UserID, MovieID) pairs as a list or an RDD
+        Returns:
+            list or RDD: (UserID, MovieID, predicted rating) tuples, an RDD if given one
+        """
+        if not hasattr(userProducts, 'mapPartitions'):
+            return self._predictList(userProducts)
+        broadcastModel = userProducts.context.broadcast(self)
+        return userProducts.mapPartitions(lambda pairs: broadcastModel.value._predictList(pairs))
+
+    def _features(self, ids, matrix, sc):
+        """ (id, factors) pairs as a list, or as an RDD with a SparkContext """
+        features = list(zip(ids.tolist(), matrix))
+        return sc.parallelize(features) if sc is not None else features
+
+    def userFeatures(self, sc=None):
+        """ User factors; a list, unlike MLlib's RDD, unless a SparkContext is given
+        Args:
+            sc (SparkContext): distribute the factors with it
+        Returns:
+            list or RDD: (UserID, factors) pairs
+        """
+        return self._features(self.userIDs, self.userMatrix, sc)
+
+    def productFeatures(self, sc=None):
+        """ Movie factors; a list, unlike MLlib's RDD, unless a SparkContext is given
+        Args:
+            sc (SparkContext): distribute the factors with it
+        Returns:
+            list or RDD: (MovieID, factors) pairs
+        """
+        return self._features(self.productIDs, self.productMatrix, sc)
+
+
+class LocalALS(object):
+    """ Drop-in replacement for ``pyspark.mllib.recommendation.ALS`` on a single machine """
+
+    @staticmethod
+    def train(ratings, rank, iterations=5, lambda_=0.01, seed=None, numWorkers=None,
+              blockRatings=None):
+        """ Factorize a ratings matrix with alternating least squares
+        Args:
+            ratings: (UserID, MovieID, Rating) tuples as a list, an iterator or an RDD, or a
+                     RatingsMatrix already built from them
+            rank (int): number of latent factors
+            iterations (int): number of (user, movie) alternations
+            lambda_ (float): regularization parameter
+            seed (int): seed of the initial movie factors
+            numWorkers (int): worker processes; defaults to the number of CPUs, 1 solves in-process
+            blockRatings (int): approximate number of ratings per solved block, BLOCK_ENTRIES //
+                                rank ** 2 if None; a row with more ratings is solved on its own
+        Returns:
+            LocalMatrixFactorizationModel: the trained model
+        """
+        if not isinstance(ratings, RatingsMatrix):
+            ratings = RatingsMatrix.fromRatings(ratings)
+        userIDs, productIDs = ratings.userIDs, ratings.movieIDs
+        byUser, byMovie = ratings.byUser, ratings.byMovie
+        blockRatings = blockRatings or max(1, BLOCK_ENTRIES // rank ** 2)
+        userBlocks = _rowBlocks(byUser.indptr, blockRatings)
+        movieBlocks = _rowBlocks(byMovie.indptr, blockRatings)
+
+        numWorkers = numWorkers or multiprocessing.cpu_count()
+        pool = None
+        if numWorkers > 1:
+            userBuffer, userMatrix = _sharedMatrix(len(userIDs), rank)
+            movieBuffer, productMatrix = _sharedMatrix(len(productIDs), rank)
+            pool = multiprocessing.Pool(numWorkers, _initWorker,
+                                        (byUser, byMovie, userBuffer, movieBuffer, rank, lambda_))
+        else:
+            userMatrix = np.zeros((len(userIDs), rank))
+            productMatrix = np.empty((len(productIDs), rank))
+
+        random = np.random.RandomState(seed)
+        productMatrix[:] = random.normal(size=(len(productIDs), rank))
+        productMatrix /= np.linalg.norm(productMatrix, axis=1)[:, None]
+        try:
+            for _ in range(iterations):
+                _solveSide(pool, 'users', byUser, userBlocks, productMatrix, userMatrix, lambda_)
+                _solveSide(pool, 'movies', byMovie, movieBlocks, userMatrix, productMatrix,
+                           lambda_)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        # Copies, so the model does not keep the shared buffers alive
+        return LocalMatrixFactorizationModel(userIDs, np.array(userMatrix), productIDs,
+                                             np.array(productMatrix))
@@ -0,0 +1,202 @@
+""" Incrementally maintained per-movie rating aggregates for streams of new ratings.
+
+The part 1 statistics of lab4 (``movieIDsWithAvgRatingsRDD``, ``movieNameWithAvgRatingsRDD`` and
+``movieLimitedAndSortedByRatingRDD``) are recomputed from the whole ``ratingsRDD`` whenever
+ratings arrive. ``MovieAggregateStore`` keeps (count, sum, sum of squares) per movie and a sorted
+ranking of the movies with more than ``minCount`` ratings. A micro-batch is first aggregated per
+movie, then only the touched movies are updated and re-ranked, so an update costs time
+proportional to the batch, not to the history.
+"""
+import io
+import os
+import time
+from bisect import bisect_left, insort
+from itertools import islice
+
+from ranking import ratingTitleKey
+from ratings_parser import parseRatingsPartition
+
+
+def aggregateBatch(ratings):
+    """ Aggregate a batch of ratings per movie
+    Args:
+        ratings: iterable of (UserID, MovieID, Rating) tuples
+    Returns:
+        dict: MovieID -> (count, sum, sum of squares)
+    """
+    aggregates = {}
+    for _, movie, rating in ratings:
+        count, total, squares = aggregates.get(movie, (0, 0.0, 0.0))
+        aggregates[movie] = (count + 1, total + rating, squares + rating * rating)
+    return aggregates
+
+
+def aggregateRDD(ratingsRDD):
+    """ Aggregate an RDD of ratings per movie on the cluster
+    Args:
+        ratingsRDD: RDD of (UserID, MovieID, Rating) tuples
+    Returns:
+        dict: MovieID -> (count, sum, sum of squares)
+    """
+    return (ratingsRDD
+            .map(lambda x: (x[1], (1, x[2], x[2] * x[2])))
+            .reduceByKey(lambda a, b: (a[0] + b[0], a[1] + b[1], a[2] + b[2]))
+            .collectAsMap())
+
+
+class MovieAggregateStore(object):
+    """ Per-movie (count, sum, sum of squares) state plus a live "top movies" ranking """
+
+    def __init__(self, titles=None, minCount=500):
+        """ Create an empty store
+        Args:
+            titles (dict): MovieID -> title; when given, movies without a title are not ranked,
+                           like the join with moviesRDD in lab4
+            minCount (int): only movies with more than minCount ratings are ranked
+        """
+        self.titles = titles
+        self.minCount = minCount
+        self.aggregates = {}
+        self._rankKeys = {}
+        self._ranking = []
+
+    @classmethod
+    def fromRatingsRDD(cls, ratingsRDD, titles=None, minCount=500):
+        """ Bootstrap a store from the full history once
+        Args:
+            ratingsRDD: RDD of (UserID, MovieID, Rating) tuples
+            titles (dict): MovieID -> title
+            minCount (int): only movies with more than minCount ratings are ranked
+        Returns:
+            MovieAggregateStore: the store
+        """
+        store = cls(titles, minCount)
+        store.applyAggregates(aggregateRDD(ratingsRDD))
+        return store
+
+    def _title(self, movie):
+        """ Title a movie is ranked under, None if it must not be ranked """
+        return movie if self.titles is None else self.titles.get(movie)
+
+    def _rerank(self, movie):
+        """ Move one movie to its current place in the ranking, or out of it """
+        oldKey = self._rankKeys.pop(movie, None)
+        if oldKey is not None:
+            del self._ranking[bisect_left(self._ranking, oldKey)]
+        count, total, _ = self.aggregates[movie]
+        title = self._title(movie)
+        if count > self.minCount and title is not None:
+            key = (ratingTitleKey((total / count, title)), movie)
+            insort(self._ranking, key)
+            self._rankKeys[movie] = key
+
+    def applyAggregates(self, aggregates):
+        """ Merge per-movie aggregates of new ratings into the store
+        Args:
+            aggregates (dict): MovieID -> (count, sum, sum of squares)
+        """
+        for movie, (count, total, squares) in aggregates.items():
+            oldCount, oldTotal, oldSquares = self.aggregates.get(movie, (0, 0.0, 0.0))
+            self.aggregates[movie] = (oldCount + count, oldTotal + total, oldSquares + squares)
+            self._rerank(movie)
+
+    def applyBatch(self, ratings):
+        """ Add a micro-batch of new ratings
+        Args:
+            ratings: iterable of (UserID, MovieID, Rating) tuples, or an RDD of them
+        """
+        if hasattr(ratings, 'reduceByKey'):
+            self.applyAggregates(aggregateRDD(ratings))
+        else:
+            self.applyAggregates(aggregateBatch(ratings))
+
+    def consume(self, batches, onBatch=None):
+        """ Apply every batch of a source, e.g. directoryBatches() or generatorBatches()
+        Args:
+            batches: iterable of batches of (UserID, MovieID, Rating) tuples
+            onBatch (function): called with the store after each batch
+        """
+        for batch in batches:
+            self.applyBatch(batch)
+            if onBatch is not None:
+                onBatch(self)
+
+    def countAndAverage(self, movie):
+        """ (number of ratings, average rating) of a movie, like ``movieIDsWithAvgRatingsRDD``
+        Args:
+            movie (int): MovieID
+        Returns:
+            tuple: (count, average), or None if the movie has no ratings
+        """
+        if movie not in self.aggregates:
+            return None
+        count, total, _ = self.aggregates[movie]
+        return count, total / float(count)
+
+    def variance(self, movie):
+        """ Population variance of the ratings of a movie
+        Args:
+            movie (int): MovieID
+        Returns:
+            float: variance, or None if the movie has no ratings
+        """
+        if movie not in self.aggregates:
+            return None
+        count, total, squares = self.aggregates[movie]
+        mean = total / float(count)
+        return max(squares / float(count) - mean * mean, 0.0)
+
+    def topMovies(self, n=20):
+        """ Highest rated movies with more than minCount ratings, like
+        ``movieLimitedAndSortedByRatingRDD.take(n)``
+        Args:
+            n (int): number of movies
+        Returns:
+            list: (average rating, title, number of ratings) tuples
+        """
+        top = []
+        for _, movie in reversed(self._ranking[-n:] if n else []):
+            count, total, _ = self.aggregates[movie]
+            top.append((total / float(count), self._title(movie), count))
+        return top
+
+
+def generatorBatches(ratings, batchSize):
+    """ Cut a stream of ratings into micro-batches
+    Args:
+        ratings: iterable of (UserID, MovieID, Rating) tuples
+        batchSize (int): ratings per batch
+    Returns:
+        generator: lists of at most batchSize ratings
+    """
+    ratings = iter(ratings)
+    while True:
+        batch = list(islice(ratings, batchSize))
+        if not batch:
+            return
+        yield batch
+
+
+def directoryBatches(directory, pollSeconds=None):
+    """ Treat every new UserID::MovieID::Rating::Timestamp file in a directory as a micro-batch
+    Args:
+        directory (str): directory to watch; files are taken in name order and each file once
+        pollSeconds (float): if given, keep polling for new files with this interval; otherwise
+                             stop once no unseen file is left
+    Returns:
+        generator: one list of (UserID, MovieID, Rating) tuples per file
+    """
+    seen = set()
+    while True:
+        newFiles = sorted(name for name in os.listdir(directory)
+                          if name not in seen and not name.startswith('.'))
+        for name in newFiles:
+            seen.add(name)
+            with io.open(os.path.join(directory, name), encoding='utf-8',
+                         errors='replace') as ratingsFile:
+                yield list(parseRatingsPartition(line.rstrip(u'\n') for line in ratingsFile
+                                                 if line.strip()))
+        if not newFiles:
+            if pollSeconds is None:
+                return
+            time.sleep(pollSeconds)
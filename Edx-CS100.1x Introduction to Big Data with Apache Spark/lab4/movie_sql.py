@@ -0,0 +1,147 @@
+""" DataFrame and Spark SQL version of lab4 part 1, over Parquet copies of the MovieLens files.
+
+Part 1 builds ``movieLimitedAndSortedByRatingRDD`` with a chain of pair-RDD lambdas: every step
+pickles Python tuples, the whole ``ratingsRDD`` is grouped with ``groupByKey``, and the count
+filter runs after the join. Here the same result comes from built-in aggregates that Catalyst
+plans and runs in the JVM: ratings are counted and averaged per movie, movies with too few ratings
+are dropped before the join, and the small movies table is broadcast. Ratings and movies are read
+from Parquet with a declared schema, so there is neither text parsing nor schema inference.
+
+    session = SparkSession.builder.getOrCreate()      # or SQLContext(sc) on Spark 1.x
+    writeParquet(session, ratingsFilename, moviesFilename, 'lab4-parquet')
+    ratingsDF, moviesDF = loadParquet(session, 'lab4-parquet')
+    topRatedMovies(ratingsDF, moviesDF).take(20)
+"""
+import os
+
+from pyspark.sql import functions as F
+from pyspark.sql.types import (DoubleType, IntegerType, LongType, StringType, StructField,
+                               StructType)
+
+from ratings_parser import parseMoviesPartition, parseRatingsBlocks
+
+RATINGS_SCHEMA = StructType([StructField('userID', IntegerType(), False),
+                             StructField('movieID', IntegerType(), False),
+                             StructField('rating', DoubleType(), False),
+                             StructField('timestamp', LongType(), False)])
+
+MOVIES_SCHEMA = StructType([StructField('movieID', IntegerType(), False),
+                            StructField('title', StringType(), False)])
+
+# The lab sorts by '%.3f' % average, which rounds half to even. ROUND rounds half up, so ties
+# sort with BROUND (Spark 2.0+), also half to even. Spark rounds the shortest decimal form of the
+# double rather than its exact binary value, so an average printed as x.xxx5 that is not exactly
+# representable can still round the other way than '%.3f'.
+_roundHalfEven = getattr(F, 'bround', F.round)
+
+# Same query in SQL, for sessions where ratings and movies are registered as tables
+TOP_RATED_SQL = """
+SELECT /*+ BROADCAST(m) */ r.average, m.title, r.count
+FROM (SELECT movieID, AVG(rating) AS average, COUNT(rating) AS count
+      FROM ratings GROUP BY movieID HAVING COUNT(rating) > {minCount}) r
+JOIN movies m ON r.movieID = m.movieID
+ORDER BY BROUND(r.average, 3) DESC, m.title DESC
+"""
+
+
+def _parseRatingsWithTimestamps(iterator):
+    """ Parse UserID::MovieID::Rating::Timestamp lines into tuples matching RATINGS_SCHEMA """
+    for block in parseRatingsBlocks(iterator):
+        for row in zip(block.userIDs.tolist(), block.movieIDs.tolist(), block.ratings.tolist(),
+                       block.timestamps.tolist()):
+            yield row
+
+
+def writeParquet(session, ratingsFilename, moviesFilename, outputDir, numPartitions=None):
+    """ Convert the MovieLens text files into Parquet once
+    Args:
+        session: SparkSession (or SQLContext)
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        outputDir (str): directory receiving ratings.parquet and movies.parquet
+        numPartitions (int): partitions of the ratings, planned by partition_planner if None
+    """
+    from partition_planner import readTextFile
+
+    sc = session.sparkContext if hasattr(session, 'sparkContext') else session._sc
+    ratingsRDD = (readTextFile(sc, ratingsFilename, numPartitions)
+                  .mapPartitions(_parseRatingsWithTimestamps))
+    moviesRDD = readTextFile(sc, moviesFilename, coalesce=True).mapPartitions(parseMoviesPartition)
+    (session.createDataFrame(ratingsRDD, RATINGS_SCHEMA)
+     .write.mode('overwrite').parquet(os.path.join(outputDir, 'ratings.parquet')))
+    (session.createDataFrame(moviesRDD, MOVIES_SCHEMA)
+     .write.mode('overwrite').parquet(os.path.join(outputDir, 'movies.parquet')))
+
+
+def loadParquet(session, outputDir):
+    """ Read the Parquet copies written by writeParquet() with the declared schemas
+    Args:
+        session: SparkSession (or SQLContext)
+        outputDir (str): directory given to writeParquet()
+    Returns:
+        tuple: (ratingsDF, moviesDF)
+    """
+    ratingsDF = session.read.schema(RATINGS_SCHEMA).parquet(os.path.join(outputDir,
+                                                                         'ratings.parquet'))
+    moviesDF = session.read.schema(MOVIES_SCHEMA).parquet(os.path.join(outputDir,
+                                                                       'movies.parquet'))
+    return ratingsDF, moviesDF
+
+
+def movieCountsAndAverages(ratingsDF):
+    """ ``movieIDsWithAvgRatingsRDD`` as a DataFrame
+    Args:
+        ratingsDF: DataFrame with movieID and rating columns
+    Returns:
+        DataFrame: movieID, count and average columns
+    """
+    return ratingsDF.groupBy('movieID').agg(F.count('rating').alias('count'),
+                                            F.avg('rating').alias('average'))
+
+
+def topRatedMovies(ratingsDF, moviesDF, minCount=500):
+    """ ``movieLimitedAndSortedByRatingRDD`` as a DataFrame
+    Args:
+        ratingsDF: DataFrame with movieID and rating columns
+        moviesDF: DataFrame with movieID and title columns
+        minCount (int): keep movies with more than minCount ratings
+    Returns:
+        DataFrame: average, title and count columns, ordered like ``sortBy(sortFunction, False)``
+                   (by the average rounded half to even to three decimals, then by title, both
+                   descending)
+    """
+    statsDF = movieCountsAndAverages(ratingsDF).filter(F.col('count') > minCount)
+    return (statsDF
+            .join(F.broadcast(moviesDF.select('movieID', 'title')), 'movieID')
+            .select('average', 'title', 'count')
+            .orderBy(_roundHalfEven('average', 3).desc(), F.col('title').desc()))
+
+
+def topRatedMoviesSQL(session, ratingsDF, moviesDF, minCount=500):
+    """ topRatedMovies() written in SQL
+    Args:
+        session: SparkSession (or SQLContext)
+        ratingsDF: DataFrame with movieID and rating columns
+        moviesDF: DataFrame with movieID and title columns
+        minCount (int): keep movies with more than minCount ratings
+    Returns:
+        DataFrame: average, title and count columns
+    """
+    for name, frame in (('ratings', ratingsDF), ('movies', moviesDF)):
+        if hasattr(frame, 'createOrReplaceTempView'):
+            frame.createOrReplaceTempView(name)
+        else:
+            frame.registerTempTable(name)
+    return session.sql(TOP_RATED_SQL.format(minCount=int(minCount)))
+
+
+def asTuples(frame, n=None):
+    """ Rows as the (average rating, movie name, number of ratings) tuples of the lab
+    Args:
+        frame: DataFrame from topRatedMovies() or topRatedMoviesSQL()
+        n (int): number of rows, all if None
+    Returns:
+        list: tuples
+    """
+    rows = frame.collect() if n is None else frame.take(n)
+    return [(row.average, row.title, row['count']) for row in rows]
@@ -0,0 +1,123 @@
+""" Per-movie rating statistics computed with map-side combining.
+
+``groupByKey`` ships every individual rating through the shuffle and materializes all the ratings
+of a movie in one task before ``getCountsAndAverages`` looks at them. The functions here fold the
+ratings into a small fixed-size state on the map side with ``aggregateByKey``, so only one state
+per movie and partition is shuffled.
+"""
+from collections import namedtuple
+
+# Half-star buckets: 0.5, 1.0, ..., 5.0
+HISTOGRAM_BINS = 10
+
+MovieStats = namedtuple('MovieStats', ['count', 'mean', 'variance', 'min', 'max', 'histogram'])
+
+_COUNT, _SUM, _SUM_SQUARES, _MIN, _MAX, _HISTOGRAM = range(6)
+
+
+def _ratingBucket(rating):
+    """ Histogram bucket of a rating
+    Args:
+        rating (float): a rating between 0.5 and 5.0
+    Returns:
+        int: bucket index, 0 for half a star up to HISTOGRAM_BINS - 1 for five stars
+    """
+    return min(max(int(rating * 2 + 0.5) - 1, 0), HISTOGRAM_BINS - 1)
+
+
+def _emptyState():
+    """ Statistics state of a movie with no ratings
+    Returns:
+        list: [count, sum, sum of squares, min, max, histogram]
+    """
+    return [0, 0.0, 0.0, float('inf'), float('-inf'), [0] * HISTOGRAM_BINS]
+
+
+def _addRating(state, rating):
+    """ Fold one rating into a statistics state (mutates and returns the state)
+    Args:
+        state (list): statistics state
+        rating (float): the rating to add
+    Returns:
+        list: the updated state
+    """
+    state[_COUNT] += 1
+    state[_SUM] += rating
+    state[_SUM_SQUARES] += rating * rating
+    if rating < state[_MIN]:
+        state[_MIN] = rating
+    if rating > state[_MAX]:
+        state[_MAX] = rating
+    state[_HISTOGRAM][_ratingBucket(rating)] += 1
+    return state
+
+
+def _mergeStates(left, right):
+    """ Merge two statistics states of the same movie (mutates and returns left)
+    Args:
+        left (list): statistics state
+        right (list): statistics state
+    Returns:
+        list: the merged state
+    """
+    left[_COUNT] += right[_COUNT]
+    left[_SUM] += right[_SUM]
+    left[_SUM_SQUARES] += right[_SUM_SQUARES]
+    left[_MIN] = min(left[_MIN], right[_MIN])
+    left[_MAX] = max(left[_MAX], right[_MAX])
+    left[_HISTOGRAM] = [a + b for a, b in zip(left[_HISTOGRAM], right[_HISTOGRAM])]
+    return left
+
+
+def _finalizeState(state):
+    """ Turn a statistics state into a MovieStats record
+    Args:
+        state (list): statistics state of a movie with at least one rating
+    Returns:
+        MovieStats: count, mean, population variance, min, max and histogram
+    """
+    count = state[_COUNT]
+    mean = state[_SUM] / float(count)
+    variance = max(state[_SUM_SQUARES] / float(count) - mean * mean, 0.0)
+    return MovieStats(count, mean, variance, state[_MIN], state[_MAX], tuple(state[_HISTOGRAM]))
+
+
+def movieStatistics(ratingsRDD, numPartitions=None):
+    """ Compute rating statistics for every movie in a single pass
+    Args:
+        ratingsRDD: RDD of (UserID, MovieID, Rating) tuples
+        numPartitions (int): number of partitions of the result, defaults to Spark's default
+    Returns:
+        RDD: (MovieID, MovieStats) pairs
+    """
+    return (ratingsRDD
+            .map(lambda x: (x[1], x[2]))
+            .aggregateByKey(_emptyState(), _addRating, _mergeStates, numPartitions)
+            .mapValues(_finalizeState))
+
+
+def countsAndAverages(movieStatsRDD):
+    """ Reduce per-movie statistics to the shape produced by ``getCountsAndAverages``
+    Args:
+        movieStatsRDD: RDD of (MovieID, MovieStats) pairs
+    Returns:
+        RDD: (MovieID, (number of ratings, average rating)) pairs
+    """
+    return movieStatsRDD.mapValues(lambda stats: (stats.count, stats.mean))
+
+
+def movieCountsAndAverages(ratingsRDD, numPartitions=None):
+    """ Compute (number of ratings, average rating) per movie with map-side combining
+
+    A lighter alternative to ``movieStatistics`` when only the count and average are needed, as
+    for ``movieIDsWithAvgRatingsRDD``.
+    Args:
+        ratingsRDD: RDD of (UserID, MovieID, Rating) tuples
+        numPartitions (int): number of partitions of the result, defaults to Spark's default
+    Returns:
+        RDD: (MovieID, (number of ratings, average rating)) pairs
+    """
+    return (ratingsRDD
+            .map(lambda x: (x[1], (1, x[2])))
+            .reduceByKey(lambda a, b: (a[0] + b[0], a[1] + b[1]), numPartitions)
+            .mapValues(lambda x: (x[0], x[1] / float(x[0]))))
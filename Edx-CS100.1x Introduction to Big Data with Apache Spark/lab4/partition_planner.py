@@ -0,0 +1,126 @@
+""" Partition counts derived from the input size and the cluster instead of hard-coded constants.
+
+lab4 reads the ratings with ``sc.textFile(ratingsFilename).repartition(2)``: the repartition
+shuffles the whole file, and every later stage runs at most two tasks however many cores there
+are (lab3's ``textFile(filename, 4, 0)`` has the same problem). ``planPartitions`` picks
+enough partitions to keep every core busy (a few tasks per core) while keeping each partition
+near ``targetBytes``, and never so many that partitions become tiny. ``readTextFile`` applies the
+plan at read time when the file can be split, so no shuffle is needed, and otherwise repartitions
+or (with ``coalesce=True``) coalesces:
+
+    rawRatings = readTextFile(sc, ratingsFilename)
+    lab3RDD = readTextFile(sc, filename, useUnicode=False)  # instead of textFile(filename, 4, 0)
+"""
+import glob
+import math
+import os
+
+# Partitions of about this many (uncompressed) bytes keep task overhead negligible
+TARGET_PARTITION_BYTES = 64 * 1024 * 1024
+# ...but partitions smaller than this are not worth a task of their own
+MIN_PARTITION_BYTES = 1024 * 1024
+TASKS_PER_CORE = 3
+# Rough size ratio of the text files of the labs to their gzipped form
+GZIP_EXPANSION = 4.0
+
+# Compressed formats Hadoop reads as one split per file (bzip2 is splittable)
+_UNSPLITTABLE_SUFFIXES = ('.gz', '.zip', '.snappy', '.lz4', '.deflate')
+
+
+def _localPaths(path):
+    """ Local files matched by a path, a glob or a directory; empty for non-local URIs """
+    if '://' in path and not path.startswith('file://'):
+        return []
+    path = path[len('file://'):] if path.startswith('file://') else path
+    paths = []
+    for match in glob.glob(path):
+        if os.path.isdir(match):
+            paths.extend(os.path.join(match, name) for name in os.listdir(match)
+                         if not name.startswith(('.', '_')))
+        else:
+            paths.append(match)
+    return paths
+
+
+def isSplittable(path):
+    """ Whether Hadoop can split a text file into several partitions (compressed files cannot) """
+    return not path.endswith(_UNSPLITTABLE_SUFFIXES)
+
+
+def inputSize(path):
+    """ Estimated uncompressed size of a path
+    Args:
+        path (str): file, directory, glob or comma-separated list of them, as for sc.textFile
+    Returns:
+        int: size in bytes, or None if the path is not on the local filesystem
+    """
+    total = 0
+    for part in path.split(','):
+        paths = _localPaths(part)
+        if not paths:
+            return None
+        for filename in paths:
+            size = os.path.getsize(filename)
+            total += int(size * GZIP_EXPANSION) if not isSplittable(filename) else size
+    return total
+
+
+def planPartitions(sc, inputBytes=None, targetBytes=TARGET_PARTITION_BYTES,
+                   tasksPerCore=TASKS_PER_CORE, minBytes=MIN_PARTITION_BYTES):
+    """ Number of partitions for an input
+    Args:
+        sc (SparkContext): the Spark context; its defaultParallelism is the number of cores
+        inputBytes (int): (uncompressed) input size; None plans from the cores alone
+        targetBytes (int): preferred upper bound of the bytes per partition
+        tasksPerCore (int): partitions per core, so that a slow task does not idle the others
+        minBytes (int): smallest partition worth a task
+    Returns:
+        int: the number of partitions, at least 1
+    """
+    cores = max(1, sc.defaultParallelism)
+    numPartitions = cores * tasksPerCore
+    if inputBytes is not None:
+        numPartitions = max(numPartitions, int(math.ceil(inputBytes / float(targetBytes))))
+        numPartitions = min(numPartitions, max(1, int(inputBytes // minBytes)))
+    return max(1, numPartitions)
+
+
+def fitPartitions(rdd, numPartitions, coalesce=False):
+    """ Bring an RDD to a number of partitions with as little data movement as allowed
+    Args:
+        rdd: the RDD
+        numPartitions (int): wanted number of partitions
+        coalesce (bool): never shuffle; fewer partitions are merged with coalesce() and missing
+                         ones are accepted, keeping the partitions the RDD has
+    Returns:
+        RDD: the RDD, coalesced or repartitioned if needed
+    """
+    current = rdd.getNumPartitions()
+    if current == numPartitions:
+        return rdd
+    if current > numPartitions:
+        return rdd.coalesce(numPartitions)
+    return rdd if coalesce else rdd.repartition(numPartitions)
+
+
+def readTextFile(sc, path, numPartitions=None, coalesce=False,
+                 targetBytes=TARGET_PARTITION_BYTES, useUnicode=True):
+    """ ``sc.textFile`` with a planned number of partitions
+    Args:
+        sc (SparkContext): the Spark context
+        path (str): file, directory, glob or comma-separated list of them
+        numPartitions (int): partitions wanted; planned from the size of path and the cores if None
+        coalesce (bool): never shuffle, see fitPartitions()
+        targetBytes (int): preferred upper bound of the bytes per partition
+        useUnicode (bool): passed to ``sc.textFile``; False yields byte strings
+    Returns:
+        RDD: the lines of the files
+    """
+    if numPartitions is None:
+        numPartitions = planPartitions(sc, inputSize(path), targetBytes)
+    if all(isSplittable(part) for part in path.split(',')):
+        # Split at read time: Hadoop input splits cost no shuffle
+        linesRDD = sc.textFile(path, numPartitions, useUnicode)
+    else:
+        linesRDD = sc.textFile(path, use_unicode=useUnicode)
+    return fitPartitions(linesRDD, numPartitions, coalesce)
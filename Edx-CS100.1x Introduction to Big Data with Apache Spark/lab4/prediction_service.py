@@ -0,0 +1,278 @@
+""" Asyncio HTTP service answering lab4 predictions from exported factors (Python 3 only).
+
+Serves a directory written by ``factor_store.exportFactors``:
+
+    GET /predict?user=<UserID>&movie=<MovieID>   -> {"user", "movie", "rating"}
+    GET /recommend?user=<UserID>&n=<count>       -> {"user", "recommendations": [...]}
+    GET /stats                                   -> cache and batching counters
+
+Results are kept in an LRU cache. Requests that miss the cache are not scored one by one: they
+wait up to ``maxDelay`` seconds (or until ``maxBatch`` of them are pending) and are then scored
+together, /predict with one gather-and-multiply and /recommend with one blocked matrix multiply.
+
+    python3 prediction_service.py --factors factors/ --port 8080 --min-count 20
+"""
+import argparse
+import asyncio
+import json
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+from factor_store import FactorStore
+
+MAX_RECOMMENDATIONS = 1000
+
+
+class LRUCache(object):
+    """ Mapping that keeps at most maxSize entries, evicting the least recently used """
+
+    def __init__(self, maxSize=100000):
+        """ Create an empty cache
+        Args:
+            maxSize (int): largest number of entries; 0 disables the cache
+        """
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Cached value of key, or None """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Cache a value, evicting the least recently used entry if the cache is full """
+        if self.maxSize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+
+class Batcher(object):
+    """ Collect concurrent requests and score them with one call """
+
+    def __init__(self, scoreBatch, maxBatch=256, maxDelay=0.001):
+        """ Create a batcher
+        Args:
+            scoreBatch (function): list of requests -> list of results, in the same order
+            maxBatch (int): a batch is scored as soon as this many requests are pending
+            maxDelay (float): seconds the first request of a batch waits for others
+        """
+        self.scoreBatch = scoreBatch
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+        self.pending = []
+        self.timer = None
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, request):
+        """ Queue a request
+        Args:
+            request: one request, as passed to scoreBatch
+        Returns:
+            Future: resolved with the result of the request
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((request, future))
+        if len(self.pending) >= self.maxBatch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.maxDelay, self.flush)
+        return future
+
+    def flush(self):
+        """ Score every pending request """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        self.batches += 1
+        self.requests += len(pending)
+        try:
+            results = self.scoreBatch([request for request, _ in pending])
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class PredictionService(object):
+    """ Request handlers over a FactorStore """
+
+    def __init__(self, store, cacheSize=100000, maxBatch=256, maxDelay=0.001):
+        """ Create the service
+        Args:
+            store (FactorStore): the exported factors
+            cacheSize (int): number of cached results
+            maxBatch (int): largest batch of cache misses scored together
+            maxDelay (float): seconds a cache miss waits for others to batch with
+        """
+        self.store = store
+        self.cache = LRUCache(cacheSize)
+        self.predictBatcher = Batcher(self._predictBatch, maxBatch, maxDelay)
+        self.recommendBatcher = Batcher(self._recommendBatch, maxBatch, maxDelay)
+
+    def _predictBatch(self, pairs):
+        """ Score (UserID, MovieID) pairs, None for unknown users or movies """
+        known, scores = self.store.predictPairs([pair[0] for pair in pairs],
+                                                [pair[1] for pair in pairs])
+        scores = iter(scores.tolist())
+        return [next(scores) if isKnown else None for isKnown in known.tolist()]
+
+    def _recommendBatch(self, requests):
+        """ Recommend to (UserID, n) requests with one scoring pass at the largest n """
+        largest = max(n for _, n in requests)
+        recommendations = self.store.recommendBatch([user for user, _ in requests], largest)
+        return [None if movies is None else movies[:n]
+                for (_, n), movies in zip(requests, recommendations)]
+
+    async def predict(self, user, movie):
+        """ Body of a /predict response, None if the user or the movie is unknown """
+        key = ('predict', user, movie)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        rating = await self.predictBatcher.submit((user, movie))
+        if rating is None:
+            return None
+        body = {'user': user, 'movie': movie, 'rating': rating}
+        self.cache.put(key, body)
+        return body
+
+    async def recommend(self, user, n):
+        """ Body of a /recommend response, None if the user is unknown """
+        key = ('recommend', user, n)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        movies = await self.recommendBatcher.submit((user, n))
+        if movies is None:
+            return None
+        body = {'user': user,
+                'recommendations': [{'movie': movie, 'rating': rating, 'title': title,
+                                     'count': count}
+                                    for movie, rating, title, count in movies]}
+        self.cache.put(key, body)
+        return body
+
+    def stats(self):
+        """ Body of a /stats response """
+        return {'cacheEntries': len(self.cache.entries), 'cacheHits': self.cache.hits,
+                'cacheMisses': self.cache.misses,
+                'predictBatches': self.predictBatcher.batches,
+                'predictRequests': self.predictBatcher.requests,
+                'recommendBatches': self.recommendBatcher.batches,
+                'recommendRequests': self.recommendBatcher.requests}
+
+    async def route(self, target):
+        """ Answer one request target
+        Args:
+            target (str): path and query string, e.g. '/predict?user=1&movie=2'
+        Returns:
+            tuple: (HTTP status, JSON-serializable body)
+        """
+        url = urlsplit(target)
+        query = dict((name, values[0]) for name, values in parse_qs(url.query).items())
+        try:
+            if url.path == '/predict':
+                body = await self.predict(int(query['user']), int(query['movie']))
+            elif url.path == '/recommend':
+                n = int(query.get('n', 10))
+                if not 0 < n <= MAX_RECOMMENDATIONS:
+                    return 400, {'error': 'n must be between 1 and %d' % MAX_RECOMMENDATIONS}
+                body = await self.recommend(int(query['user']), n)
+            elif url.path == '/stats':
+                body = self.stats()
+            else:
+                return 404, {'error': 'unknown path %s' % url.path}
+        except (KeyError, ValueError):
+            return 400, {'error': 'missing or invalid parameter'}
+        if body is None:
+            return 404, {'error': 'unknown user or movie'}
+        return 200, body
+
+    async def handleConnection(self, reader, writer):
+        """ Serve HTTP/1.1 GET requests on one keep-alive connection """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = requestLine.decode('latin-1').split()
+                if len(parts) != 3 or parts[0] != 'GET':
+                    status, body = 405, {'error': 'only GET is supported'}
+                else:
+                    status, body = await self.route(parts[1])
+                keepAlive = headers.get('connection', '').lower() != 'close'
+                payload = json.dumps(body).encode('utf-8')
+                writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\nConnection: %s\r\n\r\n'
+                             % (status, b'OK' if status == 200 else b'Error', len(payload),
+                                b'keep-alive' if keepAlive else b'close') + payload)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8080):
+    """ Run the HTTP server until cancelled
+    Args:
+        service (PredictionService): the request handlers
+        host (str): address to listen on
+        port (int): port to listen on
+    """
+    server = await asyncio.start_server(service.handleConnection, host, port)
+    print('Serving on http://%s:%d' % (host, port))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--factors', required=True, help='directory written by exportFactors')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--min-count', type=int, default=0,
+                        help='only recommend movies with more than this many ratings')
+    parser.add_argument('--cache-size', type=int, default=100000)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    store = FactorStore(args.factors, args.min_count)
+    service = PredictionService(store, args.cache_size, args.max_batch, args.max_delay_ms / 1000.0)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+""" Numeric sort keys and bounded top-k selection for (rating, title, ...) tuples.
+
+lab4's ``sortFunction`` formats every rating as a unicode string (``'%.3f'``) and concatenates the
+title, and ``movieLimitedAndSortedByRatingRDD`` runs a full distributed ``sortBy`` on those
+strings only to ``take(20)``. ``ratingTitleKey`` orders exactly like ``sortFunction`` with a tuple
+key instead of a new string per record, and ``topByRating`` keeps a bounded heap per partition
+and merges the heaps on the driver instead of sorting everything.
+"""
+import heapq
+
+
+def ratingThousandths(rating):
+    """ A non-negative rating rounded to three decimals exactly like ``'%.3f' % rating``
+    Args:
+        rating (float): the rating
+    Returns:
+        int: the rounded rating in thousandths, e.g. 4512 for 4.512893982808023
+    """
+    scaled = rating * 1000.0
+    whole = int(scaled)
+    fraction = scaled - whole
+    if abs(fraction - 0.5) < 1e-6:
+        # At (or within float error of) a tie: let the formatting decide, it rounds half to even
+        return int(('%.3f' % rating).replace('.', ''))
+    return whole + (fraction > 0.5)
+
+
+def ratingTitleKey(ratingTuple):
+    """ Sort key equivalent to lab4's ``sortFunction``
+    Args:
+        ratingTuple: (rating, MovieName, ...) tuple
+    Returns:
+        tuple: (rating in thousandths, MovieName)
+    """
+    return ratingThousandths(ratingTuple[0]), ratingTuple[1]
+
+
+def _partitionTop(k, key, largest):
+    """ Build a mapPartitions function that keeps the k best records of a partition
+    Args:
+        k (int): number of records to keep
+        key (function): sort key
+        largest (bool): keep the largest keys rather than the smallest
+    Returns:
+        function: iterator of records -> list of at most k records, best first
+    """
+    select = heapq.nlargest if largest else heapq.nsmallest
+
+    def topOfPartition(records):
+        return select(k, records, key=key)
+    return topOfPartition
+
+
+def topByKey(rdd, k, key, largest=True):
+    """ The first k records of ``rdd.sortBy(key, not largest)``, without a distributed sort
+    Args:
+        rdd: RDD of records
+        k (int): number of records
+        key (function): sort key
+        largest (bool): True for descending order (like ``sortBy(key, False)``)
+    Returns:
+        list: at most k records, in sorted order
+    """
+    select = heapq.nlargest if largest else heapq.nsmallest
+    candidates = rdd.mapPartitions(_partitionTop(k, key, largest)).collect()
+    return select(k, candidates, key=key)
+
+
+def topByRating(rdd, k, largest=True):
+    """ The first k (rating, MovieName, ...) tuples, ordered like ``sortBy(sortFunction, False)``
+    Args:
+        rdd: RDD of (rating, MovieName, ...) tuples
+        k (int): number of tuples
+        largest (bool): True for the highest ratings first
+    Returns:
+        list: at most k tuples, in sorted order
+    """
+    return topByKey(rdd, k, ratingTitleKey, largest)
+
+
+def sortByRating(rdd, ascending=False, numPartitions=None):
+    """ Full sort with the numeric key, for when every record is needed in order
+    Args:
+        rdd: RDD of (rating, MovieName, ...) tuples
+        ascending (bool): sort order
+        numPartitions (int): partitions of the sorted RDD
+    Returns:
+        RDD: the sorted tuples
+    """
+    return rdd.sortBy(ratingTitleKey, ascending, numPartitions)
@@ -0,0 +1,172 @@
+""" Deterministic, materialized train/validation/test splits of ``ratingsRDD``.
+
+``ratingsRDD.randomSplit([6, 2, 2], seed=0L)`` returns three RDDs that each re-run the parse and
+sampling lineage whenever they are computed, and the membership of a rating depends on the
+partitioning of its input. Here every rating is assigned to a split by a hash of
+(UserID, MovieID, seed), so membership never changes with the partition count. The input is scanned
+once, into a persisted copy tagged with the split index that the splits filter (and that can
+optionally be written as pickle files), and their sizes are returned so the lab does not need to
+count them again.
+"""
+import json
+import os
+import shutil
+from bisect import bisect_right
+
+from pyspark import StorageLevel
+
+from ratings_cache import sourceSignature
+
+SPLIT_NAMES = ('training', 'validation', 'test')
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value):
+    """ SplitMix64 finalizer: a well-distributed 64-bit hash of a 64-bit integer
+    Args:
+        value (int): non-negative integer below 2**64
+    Returns:
+        int: hashed value below 2**64
+    """
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return value ^ (value >> 31)
+
+
+def _boundaries(weights):
+    """ Cumulative split boundaries in [0, 2**64) for a list of weights
+    Args:
+        weights (list): relative sizes of the splits
+    Returns:
+        list: upper boundary of every split but the last
+    """
+    total = float(sum(weights))
+    boundaries, cumulative = [], 0.0
+    for weight in weights[:-1]:
+        cumulative += weight
+        boundaries.append(int(cumulative / total * (1 << 64)))
+    return boundaries
+
+
+def splitOf(user, movie, seed, boundaries):
+    """ Index of the split a rating belongs to
+    Args:
+        user (int): UserID
+        movie (int): MovieID
+        seed (int): split seed
+        boundaries (list): boundaries from _boundaries()
+    Returns:
+        int: split index
+    """
+    key = _mix64(((user & 0xffffffff) << 32 | (movie & 0xffffffff)) ^ _mix64(seed & _MASK64))
+    return bisect_right(boundaries, key)
+
+
+def hashSplit(ratingsRDD, weights=(6, 2, 2), seed=0,
+              storageLevel=StorageLevel.MEMORY_ONLY):
+    """ Split ratings by a hash of (UserID, MovieID, seed) in one pass over the input
+
+    The ratings are tagged with their split index and persisted once; the splits are filters of
+    that persisted copy, so none of them re-reads the input and the sizes come from the single
+    ``countByKey`` that fills it.
+    Args:
+        ratingsRDD: RDD of (UserID, MovieID, Rating) tuples
+        weights (tuple): relative sizes of the splits
+        seed (int): split seed
+        storageLevel (StorageLevel): how the tagged ratings are persisted
+    Returns:
+        tuple: (list of split RDDs, list of their sizes)
+    """
+    boundaries = _boundaries(list(weights))
+    taggedRDD = (ratingsRDD
+                 .map(lambda x: (splitOf(x[0], x[1], seed, boundaries), x))
+                 .persist(storageLevel))
+    # The only scan of the input: later passes read the persisted tagged ratings
+    sizesByIndex = taggedRDD.countByKey()
+    splits = [taggedRDD.filter(lambda x, index=index: x[0] == index).values()
+              for index in range(len(weights))]
+    return splits, [sizesByIndex.get(index, 0) for index in range(len(weights))]
+
+
+def _manifestPath(outputDir):
+    """ Path of the file recording the parameters and sizes of saved splits """
+    return os.path.join(outputDir, 'splits.json')
+
+
+def saveSplits(splits, sizes, outputDir, sourceFilename, weights, seed, names=SPLIT_NAMES):
+    """ Write splits as pickle files, with their sizes and parameters, for later sessions
+    Args:
+        splits (list): split RDDs
+        sizes (list): number of ratings in each split
+        outputDir (str): directory receiving one sub-directory per split
+        sourceFilename (str): ratings file the splits were made from, None if unknown
+        weights (tuple): relative sizes the splits were made with
+        seed (int): seed the splits were made with
+        names (tuple): name of each split
+    """
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    for name, splitRDD in zip(names, splits):
+        splitRDD.saveAsPickleFile(os.path.join(outputDir, name))
+    source = sourceSignature(sourceFilename) if sourceFilename is not None else None
+    manifest = {'source': source, 'weights': list(weights), 'seed': seed,
+                'sizes': dict(zip(names, sizes))}
+    with open(_manifestPath(outputDir), 'w') as manifestFile:
+        json.dump(manifest, manifestFile, indent=2, sort_keys=True)
+
+
+def loadSplits(sc, outputDir, names=SPLIT_NAMES):
+    """ Reload splits written by saveSplits()
+    Args:
+        sc (SparkContext): the Spark context
+        outputDir (str): directory the splits were written to
+        names (tuple): name of each split
+    Returns:
+        tuple: (list of split RDDs, list of their sizes)
+    """
+    with open(_manifestPath(outputDir)) as manifestFile:
+        sizes = json.load(manifestFile)['sizes']
+    splits = [sc.pickleFile(os.path.join(outputDir, name)) for name in names]
+    return splits, [sizes[name] for name in names]
+
+
+def _savedWith(outputDir, sourceFilename, weights, seed, names):
+    """ Whether outputDir holds splits made from the current version of sourceFilename with
+    these weights, seed and names
+    """
+    try:
+        with open(_manifestPath(outputDir)) as manifestFile:
+            manifest = json.load(manifestFile)
+    except (IOError, OSError, ValueError):
+        return False
+    recorded, current = manifest.get('source') or {}, sourceSignature(sourceFilename)
+    sameSource = all(recorded.get(key) == current[key] for key in ('path', 'size', 'mtime'))
+    return (sameSource and manifest.get('weights') == list(weights) and
+            manifest.get('seed') == seed and sorted(manifest.get('sizes', {})) == sorted(names))
+
+
+def materializeSplits(ratingsRDD, weights=(6, 2, 2), seed=0, outputDir=None,
+                      sourceFilename=None, names=SPLIT_NAMES):
+    """ Load the splits from outputDir if they were written before, else compute (and write) them
+    Args:
+        ratingsRDD: RDD of (UserID, MovieID, Rating) tuples
+        weights (tuple): relative sizes of the splits
+        seed (int): split seed
+        outputDir (str): where the splits are stored; None keeps them in memory only
+        sourceFilename (str): ratings file ratingsRDD was read from. Saved splits are reused only
+                              if they were made from this file, with the same size and mtime, and
+                              with the same weights and seed; without it they are always rebuilt
+        names (tuple): name of each split
+    Returns:
+        tuple: (list of split RDDs, list of their sizes)
+    """
+    if (outputDir is not None and sourceFilename is not None and
+            _savedWith(outputDir, sourceFilename, weights, seed, names)):
+        return loadSplits(ratingsRDD.context, outputDir, names)
+    splits, sizes = hashSplit(ratingsRDD, weights, seed)
+    if outputDir is not None:
+        if os.path.isdir(outputDir):
+            shutil.rmtree(outputDir)
+        saveSplits(splits, sizes, outputDir, sourceFilename, weights, seed, names)
+    return splits, sizes
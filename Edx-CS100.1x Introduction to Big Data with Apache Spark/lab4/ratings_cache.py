@@ -0,0 +1,254 @@
+""" Binary columnar cache for the lab4 MovieLens ratings and movies files.
+
+The text files are converted once into NumPy ``.npy`` columns (int32 ids, float32 ratings,
+int64 timestamps) which can be memory-mapped by every executor, so building ``ratingsRDD`` and
+``moviesRDD`` does not gunzip or split a single line. The cache is rebuilt only when the size or
+modification time of a source file changes.
+"""
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+
+from ratings_parser import parseRatingsBlocks
+
+CACHE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+RATINGS_COLUMNS = (('user_ids', np.int32),
+                   ('movie_ids', np.int32),
+                   ('ratings', np.float32),
+                   ('timestamps', np.int64))
+
+
+def _openText(filename):
+    """ Open a (possibly gzipped) MovieLens file for reading text
+    Args:
+        filename (str): path to a ``.dat`` or ``.dat.gz`` file
+    Returns:
+        file: text stream decoded as UTF-8, invalid bytes replaced like ``sc.textFile`` does
+    """
+    if filename.endswith('.gz'):
+        raw = gzip.open(filename, 'rb')
+    else:
+        raw = io.open(filename, 'rb')
+    return io.TextIOWrapper(raw, encoding='utf-8', errors='replace')
+
+
+def sourceSignature(filename):
+    """ Describe a source file by the attributes that invalidate the cache
+    Args:
+        filename (str): path to the source file
+    Returns:
+        dict: absolute path, size in bytes and modification time
+    """
+    stat = os.stat(filename)
+    return {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _readManifest(cacheDir):
+    """ Load the cache manifest
+    Args:
+        cacheDir (str): cache directory
+    Returns:
+        dict: the manifest, or None if the cache does not exist or is unreadable
+    """
+    try:
+        with open(os.path.join(cacheDir, MANIFEST_NAME)) as manifestFile:
+            return json.load(manifestFile)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def ratingsCacheIsFresh(ratingsFilename, moviesFilename, cacheDir):
+    """ Check whether the cache was built from the current versions of the source files
+    Args:
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        cacheDir (str): cache directory
+    Returns:
+        bool: True if the cache exists and both sources still have the recorded size and mtime
+    """
+    manifest = _readManifest(cacheDir)
+    if manifest is None or manifest.get('version') != CACHE_VERSION:
+        return False
+    sources = manifest['sources']
+    for name, filename in (('ratings', ratingsFilename), ('movies', moviesFilename)):
+        current = sourceSignature(filename)
+        recorded = sources[name]
+        if current['size'] != recorded['size'] or current['mtime'] != recorded['mtime']:
+            return False
+    return True
+
+
+def _convertRatings(ratingsFilename, outputDir):
+    """ Convert UserID::MovieID::Rating::Timestamp lines into one .npy file per column
+    Args:
+        ratingsFilename (str): path to ratings.dat(.gz)
+        outputDir (str): directory receiving the column files
+    Returns:
+        int: number of ratings written
+    """
+    blocks = []
+    with _openText(ratingsFilename) as ratingsFile:
+        for block in parseRatingsBlocks(line.rstrip(u'\n') for line in ratingsFile):
+            blocks.append(block)
+    for index, (name, dtype) in enumerate(RATINGS_COLUMNS):
+        if blocks:
+            column = np.concatenate([block[index] for block in blocks]).astype(dtype)
+        else:
+            column = np.zeros(0, dtype=dtype)
+        np.save(os.path.join(outputDir, name + '.npy'), column)
+    return sum(len(block.userIDs) for block in blocks)
+
+
+def _convertMovies(moviesFilename, outputDir):
+    """ Convert MovieID::Title::Genres lines into an id column and a packed UTF-8 title blob
+    Args:
+        moviesFilename (str): path to movies.dat
+        outputDir (str): directory receiving movie_ids.npy, title_offsets.npy and titles.bin
+    Returns:
+        int: number of movies written
+    """
+    movieIDs = array('i')
+    offsets = [0]
+    encodedTitles = []
+    with _openText(moviesFilename) as moviesFile:
+        for line in moviesFile:
+            items = line.split('::')
+            if len(items) < 2:
+                continue
+            movieIDs.append(int(items[0]))
+            encoded = items[1].encode('utf-8')
+            encodedTitles.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    np.save(os.path.join(outputDir, 'movie_ids.npy'), np.asarray(movieIDs, dtype=np.int32))
+    np.save(os.path.join(outputDir, 'title_offsets.npy'), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(outputDir, 'titles.bin'), 'wb') as titlesFile:
+        titlesFile.write(b''.join(encodedTitles))
+    return len(movieIDs)
+
+
+def buildRatingsCache(ratingsFilename, moviesFilename, cacheDir):
+    """ Convert the ratings and movies files into the columnar cache, replacing any old cache
+    Args:
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        cacheDir (str): cache directory to (re)create
+    Returns:
+        dict: the manifest that was written
+    """
+    parentDir = os.path.dirname(os.path.abspath(cacheDir))
+    if not os.path.isdir(parentDir):
+        os.makedirs(parentDir)
+    # Build next to the final location and swap directories so readers never see a partial cache
+    stagingDir = tempfile.mkdtemp(prefix='.ratings-cache-', dir=parentDir)
+    try:
+        manifest = {
+            'version': CACHE_VERSION,
+            'sources': {'ratings': sourceSignature(ratingsFilename),
+                        'movies': sourceSignature(moviesFilename)},
+            'ratingsCount': _convertRatings(ratingsFilename, stagingDir),
+            'moviesCount': _convertMovies(moviesFilename, stagingDir),
+        }
+        with open(os.path.join(stagingDir, MANIFEST_NAME), 'w') as manifestFile:
+            json.dump(manifest, manifestFile, indent=2, sort_keys=True)
+        if os.path.isdir(cacheDir):
+            shutil.rmtree(cacheDir)
+        os.rename(stagingDir, cacheDir)
+    except Exception:
+        shutil.rmtree(stagingDir, ignore_errors=True)
+        raise
+    return manifest
+
+
+def ensureRatingsCache(ratingsFilename, moviesFilename, cacheDir):
+    """ Build the cache if it is missing or stale
+    Args:
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        cacheDir (str): cache directory
+    Returns:
+        dict: manifest of the (possibly rebuilt) cache
+    """
+    if not ratingsCacheIsFresh(ratingsFilename, moviesFilename, cacheDir):
+        return buildRatingsCache(ratingsFilename, moviesFilename, cacheDir)
+    return _readManifest(cacheDir)
+
+
+def openRatingsColumns(cacheDir):
+    """ Memory-map the ratings columns
+    Args:
+        cacheDir (str): cache directory
+    Returns:
+        tuple: (user_ids, movie_ids, ratings, timestamps) read-only NumPy arrays
+    """
+    return tuple(np.load(os.path.join(cacheDir, name + '.npy'), mmap_mode='r')
+                 for name, _ in RATINGS_COLUMNS)
+
+
+def readMovies(cacheDir):
+    """ Read the cached movie ids and titles
+    Args:
+        cacheDir (str): cache directory
+    Returns:
+        list: (MovieID, Title) tuples in file order
+    """
+    movieIDs = np.load(os.path.join(cacheDir, 'movie_ids.npy')).tolist()
+    offsets = np.load(os.path.join(cacheDir, 'title_offsets.npy')).tolist()
+    with open(os.path.join(cacheDir, 'titles.bin'), 'rb') as titlesFile:
+        blob = titlesFile.read()
+    titles = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(movieIDs))]
+    return list(zip(movieIDs, titles))
+
+
+def _partitionBounds(count, numPartitions):
+    """ Split [0, count) into contiguous, nearly equal ranges
+    Args:
+        count (int): number of rows
+        numPartitions (int): number of ranges
+    Returns:
+        list: (start, stop) pairs, one per partition
+    """
+    edges = [count * i // numPartitions for i in range(numPartitions + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def loadRatingsCache(sc, ratingsFilename, moviesFilename, cacheDir, numPartitions=None):
+    """ Build ``ratingsRDD`` and ``moviesRDD`` from the columnar cache, refreshing it if needed
+    Args:
+        sc (SparkContext): the Spark context
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        cacheDir (str): cache directory; must be readable from every executor
+        numPartitions (int): number of partitions of the ratings RDD, planned from the size of
+                             the ratings file and the cores if None
+    Returns:
+        tuple: (ratingsRDD of (UserID, MovieID, Rating), moviesRDD of (MovieID, Title))
+    """
+    from partition_planner import inputSize, planPartitions
+
+    manifest = ensureRatingsCache(ratingsFilename, moviesFilename, cacheDir)
+    if numPartitions is None:
+        # Slices of the cache cost no shuffle whatever their number, so only the plan matters
+        numPartitions = planPartitions(sc, inputSize(ratingsFilename))
+    bounds = _partitionBounds(manifest['ratingsCount'], numPartitions)
+    cachePath = os.path.abspath(cacheDir)
+
+    def readSlice(index, _):
+        start, stop = bounds[index]
+        userIDs, movieIDs, ratings, _timestamps = openRatingsColumns(cachePath)
+        return iter(zip(userIDs[start:stop].tolist(),
+                        movieIDs[start:stop].tolist(),
+                        ratings[start:stop].tolist()))
+
+    ratingsRDD = (sc
+                  .parallelize(range(numPartitions), numPartitions)
+                  .mapPartitionsWithIndex(readSlice))
+    moviesRDD = sc.parallelize(readMovies(cachePath))
+    return ratingsRDD, moviesRDD
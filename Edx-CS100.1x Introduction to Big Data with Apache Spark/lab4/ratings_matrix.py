@@ -0,0 +1,230 @@
+""" A ratings matrix built once and shared by the baselines, statistics and evaluation of lab4.
+
+``trainingAvgRating``, the per-movie averages, ``computeError`` and the "not yet rated" filter of
+the recommendations each rescan (and mostly reshuffle) a tuple RDD. ``RatingsMatrix`` holds the
+ratings once, as compressed sparse rows by user (CSR) and columns by movie (CSC) over densely
+remapped ids, and answers all of these with vectorized NumPy operations.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+SparseRatings = namedtuple('SparseRatings', ['indptr', 'indices', 'values'])
+
+
+def ratingsColumns(ratings):
+    """ Turn ratings into three NumPy columns
+    Args:
+        ratings: (UserID, MovieID, Rating) tuples as a list, an iterator or an RDD
+    Returns:
+        tuple: (user ids, movie ids, ratings) arrays
+    """
+    if hasattr(ratings, 'collect'):
+        ratings = ratings.collect()
+    ratings = list(ratings)
+    return (np.array([r[0] for r in ratings], dtype=np.int64),
+            np.array([r[1] for r in ratings], dtype=np.int64),
+            np.array([r[2] for r in ratings], dtype=np.float64))
+
+
+def compressRows(rowIndex, colIndex, values, numRows):
+    """ Sort (row, column, value) triples into compressed sparse row arrays
+    Args:
+        rowIndex (ndarray): dense row index of each entry
+        colIndex (ndarray): dense column index of each entry
+        values (ndarray): value of each entry
+        numRows (int): number of rows
+    Returns:
+        SparseRatings: indptr (numRows + 1), column indices and values, grouped by row
+    """
+    order = np.argsort(rowIndex, kind='mergesort')
+    indptr = np.zeros(numRows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rowIndex, minlength=numRows), out=indptr[1:])
+    return SparseRatings(indptr, colIndex[order], values[order])
+
+
+def denseIndex(knownIDs, ids):
+    """ Dense indices of ids in a sorted array of known ids
+    Args:
+        knownIDs (ndarray): sorted ids
+        ids: ids to look up
+    Returns:
+        ndarray: index of every id in knownIDs, -1 where the id is unknown
+    """
+    ids = np.asarray(ids)
+    if len(knownIDs) == 0:
+        return np.full(ids.shape, -1, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(knownIDs, ids), len(knownIDs) - 1)
+    return np.where(knownIDs[rows] == ids, rows, -1)
+
+
+class RatingsMatrix(object):
+    """ Ratings as CSR (by user) and CSC (by movie) arrays over dense user and movie indices
+
+    Users and movies are numbered 0..numUsers-1 and 0..numMovies-1 in increasing id order;
+    ``userIDs`` and ``movieIDs`` map the dense indices back to the ids. The ratings themselves are
+    ordered by user, then as given, which is the order of ``entries()`` and of the predictions
+    passed to ``rmse()``.
+    """
+
+    def __init__(self, userIDs, movieIDs, byUser, byMovie):
+        """ Wrap prepared arrays; use fromRatings() or fromColumns() to build a matrix
+        Args:
+            userIDs (ndarray): sorted UserIDs
+            movieIDs (ndarray): sorted MovieIDs
+            byUser (SparseRatings): rows = users, indices = dense movie indices
+            byMovie (SparseRatings): rows = movies, indices = dense user indices
+        """
+        self.userIDs = userIDs
+        self.movieIDs = movieIDs
+        self.byUser = byUser
+        self.byMovie = byMovie
+
+    @classmethod
+    def fromColumns(cls, users, movies, ratings):
+        """ Build a matrix from aligned columns
+        Args:
+            users (ndarray): UserID of each rating
+            movies (ndarray): MovieID of each rating
+            ratings (ndarray): the ratings
+        Returns:
+            RatingsMatrix: the matrix
+        """
+        userIDs, userIndex = np.unique(np.asarray(users, dtype=np.int64), return_inverse=True)
+        movieIDs, movieIndex = np.unique(np.asarray(movies, dtype=np.int64), return_inverse=True)
+        values = np.asarray(ratings, dtype=np.float64)
+        return cls(userIDs, movieIDs,
+                   compressRows(userIndex, movieIndex, values, len(userIDs)),
+                   compressRows(movieIndex, userIndex, values, len(movieIDs)))
+
+    @classmethod
+    def fromRatings(cls, ratings):
+        """ Build a matrix from (UserID, MovieID, Rating) tuples
+        Args:
+            ratings: tuples as a list, an iterator or an RDD (collected once)
+        Returns:
+            RatingsMatrix: the matrix
+        """
+        return cls.fromColumns(*ratingsColumns(ratings))
+
+    @property
+    def numUsers(self):
+        """ Number of distinct users """
+        return len(self.userIDs)
+
+    @property
+    def numMovies(self):
+        """ Number of distinct movies """
+        return len(self.movieIDs)
+
+    @property
+    def numRatings(self):
+        """ Number of ratings """
+        return len(self.byUser.values)
+
+    def userIndex(self, users):
+        """ Dense indices of UserIDs, -1 for unknown users """
+        return denseIndex(self.userIDs, users)
+
+    def movieIndex(self, movies):
+        """ Dense indices of MovieIDs, -1 for unknown movies """
+        return denseIndex(self.movieIDs, movies)
+
+    def entries(self):
+        """ The ratings in CSR order
+        Returns:
+            tuple: (dense user indices, dense movie indices, ratings) arrays
+        """
+        userRows = np.repeat(np.arange(self.numUsers), np.diff(self.byUser.indptr))
+        return userRows, self.byUser.indices, self.byUser.values
+
+    def globalMean(self):
+        """ Average of all ratings, lab4's ``trainingAvgRating`` """
+        return float(self.byUser.values.mean())
+
+    def userCounts(self):
+        """ Number of ratings of every user, in dense user order """
+        return np.diff(self.byUser.indptr)
+
+    def movieCounts(self):
+        """ Number of ratings of every movie, in dense movie order """
+        return np.diff(self.byMovie.indptr)
+
+    def userMeans(self):
+        """ Average rating given by every user, in dense user order """
+        return np.add.reduceat(self.byUser.values, self.byUser.indptr[:-1]) / self.userCounts()
+
+    def movieMeans(self):
+        """ Average rating of every movie, in dense movie order """
+        return np.add.reduceat(self.byMovie.values, self.byMovie.indptr[:-1]) / self.movieCounts()
+
+    def movieCountsAndAverages(self):
+        """ Per-movie statistics in the shape of ``movieIDsWithAvgRatingsRDD``
+        Returns:
+            dict: MovieID -> (number of ratings, average rating)
+        """
+        return dict(zip(self.movieIDs.tolist(),
+                        zip(self.movieCounts().tolist(), self.movieMeans().tolist())))
+
+    def ratedMovies(self, user):
+        """ MovieIDs rated by a user (empty for unknown users) """
+        row = int(self.userIndex([user])[0])
+        if row < 0:
+            return np.zeros(0, dtype=np.int64)
+        return self.movieIDs[self.byUser.indices[self.byUser.indptr[row]:
+                                                 self.byUser.indptr[row + 1]]]
+
+    def ratedMask(self, user):
+        """ Boolean mask over the dense movie order of the movies a user rated
+        Args:
+            user (int): UserID
+        Returns:
+            ndarray: True where the user rated the movie, e.g. to drop them from recommendations
+        """
+        mask = np.zeros(self.numMovies, dtype=bool)
+        row = int(self.userIndex([user])[0])
+        if row >= 0:
+            mask[self.byUser.indices[self.byUser.indptr[row]:self.byUser.indptr[row + 1]]] = True
+        return mask
+
+    def rmse(self, predictions):
+        """ Root mean squared error of predictions of every rating
+        Args:
+            predictions (ndarray): one prediction per rating, in entries() order, or a scalar
+                                   (e.g. globalMean() of a training matrix for the lab4 baseline)
+        Returns:
+            float: RMSE
+        """
+        errors = self.byUser.values - predictions
+        return float(np.sqrt(np.mean(errors * errors)))
+
+    def predictFactors(self, userIDs, userMatrix, productIDs, productMatrix):
+        """ Predict every rating of the matrix from ALS factors
+        Args:
+            userIDs (ndarray): sorted UserIDs, one per row of userMatrix
+            userMatrix (ndarray): user factors
+            productIDs (ndarray): sorted MovieIDs, one per row of productMatrix
+            productMatrix (ndarray): movie factors
+        Returns:
+            tuple: (mask of the ratings whose user and movie have factors, their predictions),
+                   both in entries() order
+        """
+        userRows, movieColumns, _ = self.entries()
+        users = denseIndex(np.asarray(userIDs), self.userIDs)[userRows]
+        movies = denseIndex(np.asarray(productIDs), self.movieIDs)[movieColumns]
+        known = (users >= 0) & (movies >= 0)
+        return known, np.einsum('ij,ij->i', userMatrix[users[known]],
+                                productMatrix[movies[known]])
+
+    def modelRMSE(self, model):
+        """ RMSE of a model with local factors (e.g. LocalMatrixFactorizationModel) on the
+        ratings it can predict, like lab4's ``computeError`` on ``predictAll``
+        Args:
+            model: model with userIDs, userMatrix, productIDs and productMatrix attributes
+        Returns:
+            float: RMSE
+        """
+        known, predictions = self.predictFactors(model.userIDs, model.userMatrix,
+                                                 model.productIDs, model.productMatrix)
+        errors = self.byUser.values[known] - predictions
+        return float(np.sqrt(np.mean(errors * errors)))
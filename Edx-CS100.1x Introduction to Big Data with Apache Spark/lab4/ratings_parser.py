@@ -0,0 +1,217 @@
+""" Block-at-a-time parsers for the lab4 MovieLens files.
+
+``get_ratings_tuple`` splits every ``UserID::MovieID::Rating::Timestamp`` line in Python and
+converts three fields one by one. The functions here take a whole partition (through
+``mapPartitions``), decode blocks of lines into NumPy columns with a handful of array operations and
+only then hand out the same ``(UserID, MovieID, Rating)`` tuples, or the column arrays themselves.
+"""
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+RATINGS_BLOCK_LINES = 65536
+
+# Exact in float64 up to 10**15, far beyond MovieLens ids and timestamps
+_POWERS_OF_TEN = 10.0 ** np.arange(16)
+
+# Ids are stored as int32 and timestamps as int64; lines with values out of range are skipped
+_INT32_RANGE = (-2 ** 31, 2 ** 31 - 1)
+_INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+RatingsBlock = namedtuple('RatingsBlock', ['userIDs', 'movieIDs', 'ratings', 'timestamps'])
+
+
+def _parseRatingsBlockSlow(lines):
+    """ Parse a block line by line, skipping lines that are not valid ratings or whose ids or
+    timestamp do not fit in the column types
+    Args:
+        lines (list): lines of the form UserID::MovieID::Rating::Timestamp
+    Returns:
+        RatingsBlock: the columns of the lines that could be parsed
+    """
+    rows = []
+    for line in lines:
+        items = line.split('::')
+        try:
+            row = (int(items[0]), int(items[1]), float(items[2]), int(items[3]))
+        except (IndexError, ValueError):
+            continue
+        if (_INT32_RANGE[0] <= row[0] <= _INT32_RANGE[1] and
+                _INT32_RANGE[0] <= row[1] <= _INT32_RANGE[1] and
+                _INT64_RANGE[0] <= row[3] <= _INT64_RANGE[1]):
+            rows.append(row)
+    return RatingsBlock(np.array([r[0] for r in rows], dtype=np.int32),
+                        np.array([r[1] for r in rows], dtype=np.int32),
+                        np.array([r[2] for r in rows], dtype=np.float64),
+                        np.array([r[3] for r in rows], dtype=np.int64))
+
+
+def _decodeField(buf, starts, stops, allowDecimal):
+    """ Decode one numeric field of every line of a block
+
+    The field bytes of all lines are gathered right-aligned into a small 2-D array, so each digit
+    can be scaled by the power of ten given by the number of digits to its right.
+    Args:
+        buf (ndarray): uint8 view of the block
+        starts (ndarray): index of the first byte of the field on each line
+        stops (ndarray): index one past the last byte of the field on each line
+        allowDecimal (bool): whether the field may contain a single decimal point
+    Returns:
+        ndarray: float64 field values, or None if a field is empty or not a plain number
+    """
+    lengths = stops - starts
+    width = int(lengths.max())
+    if lengths.min() < 1 or width >= len(_POWERS_OF_TEN):
+        return None
+    columns = np.arange(width)
+    chars = buf[stops[:, None] - width + columns]
+    inField = columns >= width - lengths[:, None]
+    digits = np.where(inField, chars - np.uint8(48), np.uint8(0))
+    isDigit = inField & (digits <= 9)
+    if isDigit.all() or np.array_equal(isDigit, inField):
+        # Plain integers: the exponent of a digit only depends on its column
+        return digits.dot(_POWERS_OF_TEN[width - 1::-1])
+    isDot = inField & (chars == 46)
+    if (not allowDecimal or not np.array_equal(isDigit | isDot, inField) or
+            isDot.sum(axis=1).max() > 1):
+        return None
+    if not isDigit.any(axis=1).all():
+        # A lone '.' is not a number for float(); let the per-line parser reject it
+        return None
+    # Number of digits to the right of each position, within the field
+    digitsAfter = np.cumsum(isDigit[:, ::-1], axis=1)[:, ::-1] - isDigit
+    digits[isDot] = 0
+    values = (digits * _POWERS_OF_TEN[digitsAfter]).sum(axis=1)
+    return values / _POWERS_OF_TEN[(digitsAfter * isDot).sum(axis=1)]
+
+
+def _decodeNumbers(data, numLines):
+    """ Decode the four numeric fields of a block of ratings lines without splitting any string
+    Args:
+        data (bytes): the lines of the block, each terminated by a newline
+        numLines (int): number of lines in the block
+    Returns:
+        ndarray: float64 array of shape (numLines, 4), or None if the block is not made of
+                 lines with exactly four '::' separated numbers
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    colons = np.flatnonzero(buf == 58)
+    newlines = np.flatnonzero(buf == 10)
+    if colons.size != 6 * numLines or newlines.size != numLines:
+        return None
+    colons = colons.reshape(numLines, 6)
+    lineStarts = np.empty(numLines, dtype=newlines.dtype)
+    lineStarts[0] = 0
+    lineStarts[1:] = newlines[:-1] + 1
+    # Each line must read <field>::<field>::<field>::<field>\n
+    if (np.any(colons[:, 1::2] != colons[:, ::2] + 1) or np.any(colons[:, 0] < lineStarts) or
+            np.any(colons[:, 5] >= newlines)):
+        return None
+    starts = np.column_stack([lineStarts, colons[:, 1::2] + 1])
+    stops = np.column_stack([colons[:, ::2], newlines])
+    fields = []
+    for index in range(4):
+        values = _decodeField(buf, starts[:, index], stops[:, index], allowDecimal=index == 2)
+        if values is None:
+            return None
+        fields.append(values)
+    return np.column_stack(fields)
+
+
+def parseRatingsBlock(lines):
+    """ Decode a block of ratings lines into NumPy columns
+    Args:
+        lines (list): lines of the form UserID::MovieID::Rating::Timestamp
+    Returns:
+        RatingsBlock: int32 user and movie ids, float64 ratings and int64 timestamps
+    """
+    if not lines:
+        return _parseRatingsBlockSlow(lines)
+    data = (u'\n'.join(lines) + u'\n').encode('ascii', 'replace')
+    values = _decodeNumbers(data, len(lines))
+    if values is None or values[:, :2].max() > _INT32_RANGE[1]:
+        # Blank, malformed or out-of-range lines in this block: fall back to the per-line parser
+        # for it only, which skips them
+        return _parseRatingsBlockSlow(lines)
+    return RatingsBlock(values[:, 0].astype(np.int32),
+                        values[:, 1].astype(np.int32),
+                        values[:, 2],
+                        values[:, 3].astype(np.int64))
+
+
+def _blocks(iterator, blockLines):
+    """ Group an iterator of lines into lists of at most blockLines lines
+    Args:
+        iterator: iterator over lines
+        blockLines (int): maximum number of lines per block
+    Returns:
+        generator: lists of lines
+    """
+    while True:
+        block = list(islice(iterator, blockLines))
+        if not block:
+            return
+        yield block
+
+
+def parseRatingsBlocks(iterator, blockLines=RATINGS_BLOCK_LINES):
+    """ Parse a partition of ratings lines into column blocks, for use with ``mapPartitions``
+    Args:
+        iterator: iterator over lines of the form UserID::MovieID::Rating::Timestamp
+        blockLines (int): number of lines decoded per NumPy call
+    Returns:
+        generator: RatingsBlock objects
+    """
+    for block in _blocks(iter(iterator), blockLines):
+        yield parseRatingsBlock(block)
+
+
+def parseRatingsPartition(iterator, blockLines=RATINGS_BLOCK_LINES):
+    """ Drop-in partition version of ``get_ratings_tuple``, for use with ``mapPartitions``
+    Args:
+        iterator: iterator over lines of the form UserID::MovieID::Rating::Timestamp
+        blockLines (int): number of lines decoded per NumPy call
+    Returns:
+        generator: (UserID, MovieID, Rating) tuples, identical to ``get_ratings_tuple``'s
+    """
+    for block in parseRatingsBlocks(iterator, blockLines):
+        for ratingTuple in zip(block.userIDs.tolist(), block.movieIDs.tolist(),
+                               block.ratings.tolist()):
+            yield ratingTuple
+
+
+def parseMoviesPartition(iterator):
+    """ Partition version of ``get_movie_tuple``, for use with ``mapPartitions``
+
+    Titles are free text, so there is nothing to vectorize; this only avoids the per-record
+    function call and the full split of the genres field.
+    Args:
+        iterator: iterator over lines of the form MovieID::Title::Genres
+    Returns:
+        generator: (MovieID, Title) tuples, identical to ``get_movie_tuple``'s
+    """
+    for line in iterator:
+        items = line.split('::', 2)
+        yield int(items[0]), items[1]
+
+
+def loadRatingsAndMovies(sc, ratingsFilename, moviesFilename, numPartitions=None, coalesce=False):
+    """ Build ``ratingsRDD`` and ``moviesRDD`` from the text files with the partition parsers
+    Args:
+        sc (SparkContext): the Spark context
+        ratingsFilename (str): path to ratings.dat(.gz)
+        moviesFilename (str): path to movies.dat
+        numPartitions (int): number of partitions of the ratings RDD, planned from the file size
+                             and the cores if None
+        coalesce (bool): never shuffle the raw lines, see partition_planner.fitPartitions()
+    Returns:
+        tuple: (ratingsRDD of (UserID, MovieID, Rating), moviesRDD of (MovieID, Title))
+    """
+    # Imported here: only the driver plans partitions, executors need not import the planner
+    from partition_planner import readTextFile
+
+    ratingsRDD = (readTextFile(sc, ratingsFilename, numPartitions, coalesce)
+                  .mapPartitions(parseRatingsPartition))
+    moviesRDD = readTextFile(sc, moviesFilename, coalesce=True).mapPartitions(parseMoviesPartition)
+    return ratingsRDD, moviesRDD
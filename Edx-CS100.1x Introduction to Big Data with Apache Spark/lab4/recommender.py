@@ -0,0 +1,153 @@
+""" Top-N recommendations computed locally from exported ALS factors.
+
+Recommending movies to one user in lab4 runs ``predictAll`` over every (user, movie) pair, two
+shuffle joins to attach counts and titles, a filter and ``takeOrdered``. ``TopNRecommender``
+collects the product factors into a NumPy matrix once, precomputes which movies have enough
+ratings, and then scores a user with one matrix-vector product and ``argpartition``; batches of
+users are scored with one blocked matrix multiply.
+"""
+import numpy as np
+
+
+def userVector(model, user):
+    """ Factor vector of one user
+    Args:
+        model: MatrixFactorizationModel, FoldInModel or LocalMatrixFactorizationModel
+        user (int): UserID
+    Returns:
+        ndarray: the user's factors
+    """
+    folded = getattr(model, 'userFactors', None)
+    if isinstance(folded, dict) and user in folded:
+        return np.asarray(folded[user], dtype=np.float64)
+    features = model.userFeatures()
+    if hasattr(features, 'lookup'):
+        return np.asarray(features.lookup(user)[0], dtype=np.float64)
+    # LocalMatrixFactorizationModel lists its factors instead of returning an RDD
+    for featureID, factors in features:
+        if featureID == user:
+            return np.asarray(factors, dtype=np.float64)
+    raise KeyError(user)
+
+
+def _topColumns(scores, n):
+    """ Column indices of the n largest scores of each row, best first
+    Args:
+        scores (ndarray): 2-D array of scores, -inf for excluded columns
+        n (int): number of columns to keep
+    Returns:
+        ndarray: int array of shape (rows, min(n, columns))
+    """
+    n = min(n, scores.shape[1])
+    rows = np.arange(scores.shape[0])[:, None]
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    order = np.argsort(-scores[rows, top], axis=1, kind='mergesort')
+    return top[rows, order]
+
+
+class TopNRecommender(object):
+    """ Score users against an in-memory copy of the product factors """
+
+    def __init__(self, productIDs, productMatrix, movieCounts=None, minCount=0, titles=None):
+        """ Index the product factors and precompute the eligibility mask
+        Args:
+            productIDs (list): MovieIDs, in the row order of productMatrix
+            productMatrix (ndarray): product factors, one row per movie
+            movieCounts (dict): MovieID -> number of ratings; movies without a count are only
+                                eligible when minCount is 0
+            minCount (int): only recommend movies with more than minCount ratings
+            titles (dict): MovieID -> title, used by recommendWithTitles()
+        """
+        self.productIDs = np.asarray(productIDs)
+        self.productMatrix = np.asarray(productMatrix, dtype=np.float64)
+        self.productIndex = dict((productID, row) for row, productID in enumerate(productIDs))
+        self.titles = titles or {}
+        self.counts = np.array([(movieCounts or {}).get(productID, 0) for productID in productIDs])
+        if movieCounts is None or minCount <= 0:
+            self.eligible = np.ones(len(productIDs), dtype=bool)
+        else:
+            self.eligible = self.counts > minCount
+
+    @classmethod
+    def fromModel(cls, model, movieCountsRDD=None, minCount=0, moviesRDD=None):
+        """ Build a recommender from a trained model and the lab4 side tables
+        Args:
+            model: MatrixFactorizationModel, FoldInModel or LocalMatrixFactorizationModel
+            movieCountsRDD: RDD of (MovieID, number of ratings) pairs
+            minCount (int): only recommend movies with more than minCount ratings
+            moviesRDD: RDD of (MovieID, Title) pairs
+        Returns:
+            TopNRecommender: the recommender
+        """
+        # Imported here so recommenders over exported factors work without pyspark
+        from fold_in import productFactors
+
+        productIDs, productMatrix = productFactors(model)
+        movieCounts = movieCountsRDD.collectAsMap() if movieCountsRDD is not None else None
+        titles = moviesRDD.collectAsMap() if moviesRDD is not None else None
+        return cls(productIDs, productMatrix, movieCounts, minCount, titles)
+
+    def _mask(self, scores, ratedMovies):
+        """ Set the scores of ineligible and already rated movies to -inf (in place)
+        Args:
+            scores (ndarray): 1-D scores of one user
+            ratedMovies: MovieIDs the user already rated
+        Returns:
+            ndarray: the masked scores
+        """
+        scores[~self.eligible] = -np.inf
+        rows = [self.productIndex[movie] for movie in ratedMovies if movie in self.productIndex]
+        scores[rows] = -np.inf
+        return scores
+
+    def recommend(self, userFactors, n, ratedMovies=()):
+        """ Recommend the n movies with the highest predicted rating
+        Args:
+            userFactors (ndarray): factor vector of the user, e.g. from userVector()
+            n (int): number of movies
+            ratedMovies: MovieIDs to leave out because the user already rated them
+        Returns:
+            list: (MovieID, predicted rating) tuples, highest rating first
+        """
+        scores = self._mask(self.productMatrix.dot(userFactors), ratedMovies)
+        top = _topColumns(scores[None, :], n)[0]
+        return [(self.productIDs[row].item(), float(scores[row]))
+                for row in top if scores[row] > -np.inf]
+
+    def recommendWithTitles(self, userFactors, n, ratedMovies=()):
+        """ Recommend movies in the shape of lab4's ``predictedHighestRatedMovies``
+        Args:
+            userFactors (ndarray): factor vector of the user
+            n (int): number of movies
+            ratedMovies: MovieIDs to leave out because the user already rated them
+        Returns:
+            list: (predicted rating, movie title, number of ratings) tuples
+        """
+        return [(score, self.titles.get(movie), int(self.counts[self.productIndex[movie]]))
+                for movie, score in self.recommend(userFactors, n, ratedMovies)]
+
+    def recommendBatch(self, userMatrix, n, ratedMovies=None, blockSize=1024):
+        """ Recommend movies to many users with blocked matrix multiplies
+        Args:
+            userMatrix (ndarray): user factors, one row per user
+            n (int): number of movies per user
+            ratedMovies (list): for each user, the MovieIDs to leave out (or None)
+            blockSize (int): number of users scored per matrix multiply, bounding memory to
+                             blockSize x number of movies scores
+        Returns:
+            list: for each user, (MovieID, predicted rating) tuples, highest rating first
+        """
+        userMatrix = np.asarray(userMatrix, dtype=np.float64)
+        recommendations = []
+        for start in range(0, userMatrix.shape[0], blockSize):
+            scores = userMatrix[start:start + blockSize].dot(self.productMatrix.T)
+            scores[:, ~self.eligible] = -np.inf
+            if ratedMovies is not None:
+                for offset, rated in enumerate(ratedMovies[start:start + blockSize]):
+                    rows = [self.productIndex[m] for m in rated or () if m in self.productIndex]
+                    scores[offset, rows] = -np.inf
+            top = _topColumns(scores, n)
+            for offset in range(scores.shape[0]):
+                recommendations.append([(self.productIDs[row].item(), float(scores[offset, row]))
+                                        for row in top[offset] if scores[offset, row] > -np.inf])
+        return recommendations
@@ -0,0 +1,104 @@
+""" Synthetic MovieLens-style ratings and movies files at any scale.
+
+Movie popularity and user activity follow Zipf distributions, as in the real MovieLens data where
+a few blockbusters and heavy raters account for most of the ratings. Each movie has a latent
+quality around which its ratings are drawn, so per-movie averages and ALS models behave roughly
+like on the real data. Files use the ``UserID::MovieID::Rating::Timestamp`` and
+``MovieID::Title::Genres`` formats of the lab.
+"""
+import gzip
+import io
+
+import numpy as np
+
+GENRES = ['Action', 'Adventure', 'Animation', "Children's", 'Comedy', 'Crime', 'Documentary',
+          'Drama', 'Fantasy', 'Film-Noir', 'Horror', 'Musical', 'Mystery', 'Romance', 'Sci-Fi',
+          'Thriller', 'War', 'Western']
+
+CHUNK_RATINGS = 1000000
+
+
+def zipfProbabilities(numItems, exponent):
+    """ Zipf probabilities of items ranked 1..numItems
+    Args:
+        numItems (int): number of items
+        exponent (float): Zipf exponent, larger is more skewed
+    Returns:
+        ndarray: probabilities summing to one
+    """
+    weights = 1.0 / np.arange(1, numItems + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _open(filename):
+    """ Open an output text file, gzipped if the name ends in .gz """
+    if filename.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(filename, 'wb'), encoding='utf-8')
+    return io.open(filename, 'w', encoding='utf-8')
+
+
+def writeMovies(filename, numMovies, seed=0):
+    """ Write a movies file
+    Args:
+        filename (str): output path
+        numMovies (int): number of movies, with MovieIDs 1..numMovies
+        seed (int): random seed
+    """
+    random = np.random.RandomState(seed)
+    years = random.randint(1920, 2016, size=numMovies)
+    with _open(filename) as output:
+        for movieID in range(1, numMovies + 1):
+            genres = random.choice(GENRES, size=random.randint(1, 4), replace=False)
+            output.write(u'%d::Movie %d (%d)::%s\n' % (movieID, movieID, years[movieID - 1],
+                                                       u'|'.join(genres)))
+
+
+def writeRatings(filename, numRatings, numUsers, numMovies, movieExponent=1.0,
+                 userExponent=0.7, halfStars=True, seed=0):
+    """ Write a ratings file with Zipfian movie popularity and user activity
+    Args:
+        filename (str): output path, gzipped if it ends in .gz
+        numRatings (int): number of ratings
+        numUsers (int): number of users, with UserIDs 1..numUsers
+        numMovies (int): number of movies, with MovieIDs 1..numMovies
+        movieExponent (float): Zipf exponent of movie popularity
+        userExponent (float): Zipf exponent of user activity
+        halfStars (bool): allow half-star ratings, as in MovieLens 10M and later
+        seed (int): random seed
+    """
+    random = np.random.RandomState(seed)
+    # Popularity rank -> id, so popular movies and heavy users are spread over the id range
+    movieOfRank = random.permutation(numMovies) + 1
+    userOfRank = random.permutation(numUsers) + 1
+    movieProbabilities = zipfProbabilities(numMovies, movieExponent)
+    userProbabilities = zipfProbabilities(numUsers, userExponent)
+    quality = np.clip(random.normal(3.5, 0.5, size=numMovies + 1), 1.0, 5.0)
+    step = 0.5 if halfStars else 1.0
+    with _open(filename) as output:
+        for start in range(0, numRatings, CHUNK_RATINGS):
+            size = min(CHUNK_RATINGS, numRatings - start)
+            movies = movieOfRank[random.choice(numMovies, size=size, p=movieProbabilities)]
+            users = userOfRank[random.choice(numUsers, size=size, p=userProbabilities)]
+            noisy = quality[movies] + random.normal(0, 0.9, size)
+            ratings = np.clip(np.round(noisy / step) * step, step, 5.0)
+            timestamps = random.randint(789652009, 1427784002, size=size)
+            output.write(u''.join(u'%d::%d::%g::%d\n' % row for row in
+                                  zip(users.tolist(), movies.tolist(), ratings.tolist(),
+                                      timestamps.tolist())))
+
+
+def writeDataset(ratingsFilename, moviesFilename, numRatings, numUsers=None, numMovies=None,
+                 seed=0):
+    """ Write a ratings file and its movies file, sizing users and movies like MovieLens
+    Args:
+        ratingsFilename (str): ratings output path
+        moviesFilename (str): movies output path
+        numRatings (int): number of ratings
+        numUsers (int): number of users, by default about one per 140 ratings
+        numMovies (int): number of movies, by default about one per 370 ratings (at least 1000)
+        seed (int): random seed
+    """
+    numUsers = numUsers or max(100, numRatings // 140)
+    numMovies = numMovies or max(1000, numRatings // 370)
+    writeMovies(moviesFilename, numMovies, seed)
+    writeRatings(ratingsFilename, numRatings, numUsers, numMovies, seed=seed)
@@ -0,0 +1,256 @@
+""" Per-step Spark metrics for the lab pipelines.
+
+When a lab cell is slow it is not obvious whether the time goes into parsing, a shuffle join or a
+lineage that is recomputed because it was not cached. ``PipelineMetrics`` wraps pipeline steps
+(``computeError``, ``parseLogs``, ``idfs``, ...) with a context manager or a decorator and records,
+for each step, the wall time, the number of Spark jobs, stages and tasks it ran, the executor time
+of those tasks, the records and bytes read, shuffled and written, and the size of the cached RDDs
+when the step ends:
+
+    metrics = PipelineMetrics(sc)
+    with metrics.step('parse'):
+        parsed_logs, access_logs, failed_logs = parseLogs()
+    idfs = metrics.instrument('idfs')(idfs)
+    metrics.printTable()
+    metrics.writeJSON('metrics.json')
+
+Every step runs in its own job group, so its jobs are found in the status tracker. Stage metrics
+and storage sizes come from the REST API of the Spark UI, with one request per stage the step ran
+and one for the storage after each step, so the overhead does not grow with the size of the data or
+the length of the application. Without the UI (``spark.ui.enabled=false``) only the job, stage and
+task counts are recorded.
+"""
+from __future__ import print_function
+
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+# REST stage fields, their names in the step record, and how the values of the stages of a step
+# are combined: counts add up, peaks do not
+STAGE_FIELDS = (('executorRunTime', 'taskMillis', sum),
+                ('inputBytes', 'inputBytes', sum),
+                ('inputRecords', 'inputRecords', sum),
+                ('outputBytes', 'outputBytes', sum),
+                ('outputRecords', 'outputRecords', sum),
+                ('shuffleReadBytes', 'shuffleReadBytes', sum),
+                ('shuffleReadRecords', 'shuffleReadRecords', sum),
+                ('shuffleWriteBytes', 'shuffleWriteBytes', sum),
+                ('shuffleWriteRecords', 'shuffleWriteRecords', sum),
+                ('memoryBytesSpilled', 'memoryBytesSpilled', sum),
+                ('diskBytesSpilled', 'diskBytesSpilled', sum),
+                ('peakExecutionMemory', 'peakExecutionMemory', max))
+
+# (title, width, step record key, format); byte counts are formatted by formatBytes()
+TABLE_COLUMNS = (('step', 24, 'name', '%s'),
+                 ('seconds', 9, 'seconds', '%.2f'),
+                 ('jobs', 5, 'jobs', '%d'),
+                 ('stages', 6, 'stages', '%d'),
+                 ('tasks', 6, 'tasks', '%d'),
+                 ('task s', 8, 'taskSeconds', '%.1f'),
+                 ('in rec', 11, 'inputRecords', '%d'),
+                 ('out rec', 11, 'outputRecords', '%d'),
+                 ('shuf read', 10, 'shuffleReadBytes', None),
+                 ('shuf write', 10, 'shuffleWriteBytes', None),
+                 ('cached', 10, 'cachedBytes', None))
+
+# Local properties of the job group of a step
+JOB_GROUP_PROPERTIES = ('spark.jobGroup.id', 'spark.job.description', 'spark.job.interruptOnCancel')
+
+
+def formatBytes(size):
+    """ A byte count as a short human-readable string, e.g. '12.3 MB' """
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            return ('%d %s' if unit == 'B' else '%.1f %s') % (size, unit)
+        size /= 1024.0
+
+
+class PipelineMetrics(object):
+    """ Record Spark metrics for named pipeline steps """
+
+    def __init__(self, sc, restUrl=None, settleSeconds=0):
+        """ Create a recorder for a Spark context
+        Args:
+            sc (SparkContext): the Spark context running the steps
+            restUrl (str): base URL of the application in the REST API, found from the Spark UI
+                           address by default
+            settleSeconds (float): how long to wait for the REST API to report the last stages
+                                   of a step as finished; the listener bus may lag behind the
+                                   status tracker, so without waiting the metrics of those
+                                   stages can be partial
+        """
+        self.sc = sc
+        self.settleSeconds = settleSeconds
+        self.steps = []
+        self._open = []
+        self._groups = 0
+        if restUrl is None:
+            uiWebUrl = getattr(sc, 'uiWebUrl', None)
+            if not uiWebUrl:
+                uiWebUrl = 'http://localhost:%s' % sc.getConf().get('spark.ui.port', '4040')
+            restUrl = '%s/api/v1/applications/%s' % (uiWebUrl.rstrip('/'), sc.applicationId)
+        self.restUrl = restUrl
+
+    def _getJSON(self, path):
+        """ GET a REST API resource, None if the UI cannot be reached """
+        try:
+            return json.loads(urlopen(self.restUrl + path, timeout=10).read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _stageIds(self, jobIds):
+        """ Ids of the stages of some jobs, and their total number of tasks """
+        tracker = self.sc.statusTracker()
+        stageIds, tasks = set(), 0
+        for jobId in jobIds:
+            jobInfo = tracker.getJobInfo(jobId)
+            if jobInfo is None:
+                continue
+            for stageId in jobInfo.stageIds:
+                stageInfo = tracker.getStageInfo(stageId)
+                # Stages skipped because their shuffle output was reused ran no task
+                if stageInfo is not None and stageInfo.numCompletedTasks > 0:
+                    stageIds.add(stageId)
+                    tasks += stageInfo.numCompletedTasks
+        return stageIds, tasks
+
+    def _stageAttempts(self, stageIds):
+        """ REST data of every attempt of some stages, None if the REST API cannot be reached """
+        attempts = []
+        for stageId in sorted(stageIds):
+            # Without details the API leaves out the data of every task
+            stage = self._getJSON('/stages/%d?details=false' % stageId)
+            if stage is None:
+                return None
+            attempts.extend(stage)
+        return attempts
+
+    def _stageMetrics(self, stageIds):
+        """ Combine the REST metrics of some stages
+        Args:
+            stageIds (set): stage ids
+        Returns:
+            dict: the STAGE_FIELDS totals and peaks, or None values if the REST API cannot be
+                  reached
+        """
+        totals = dict((name, None) for _, name, _ in STAGE_FIELDS)
+        deadline = time.time() + self.settleSeconds
+        while True:
+            attempts = self._stageAttempts(stageIds)
+            if attempts is None:
+                return totals
+            if (time.time() >= deadline or
+                    all(attempt['status'] != 'ACTIVE' for attempt in attempts)):
+                break
+            time.sleep(0.05)
+        for field, name, combine in STAGE_FIELDS:
+            totals[name] = combine([attempt.get(field, 0) for attempt in attempts] or [0])
+        return totals
+
+    def _cachedBytes(self):
+        """ Memory plus disk size of every cached RDD, None if the REST API cannot be reached """
+        storage = self._getJSON('/storage/rdd')
+        if storage is None:
+            return None
+        return sum(rdd.get('memoryUsed', 0) + rdd.get('diskUsed', 0) for rdd in storage)
+
+    @contextmanager
+    def step(self, name, records=None):
+        """ Record a pipeline step around a block of code
+
+        The block receives a dict in which it can set 'records' (the number of records the step
+        processed, for the throughput) or any other value to keep with the step. Steps can be
+        nested; the jobs of an inner step also count for the outer one.
+        Args:
+            name (str): name of the step
+            records (int): number of records processed, if already known
+        """
+        result = {'records': records}
+        jobIds = []
+        self._open.append(jobIds)
+        # A job group of its own, so repeated or nested steps of the same name stay apart
+        self._groups += 1
+        group = '%s-%d' % (name, self._groups)
+        # setJobGroup() sets these three properties; they are restored when the step ends
+        previous = dict((key, self.sc.getLocalProperty(key)) for key in JOB_GROUP_PROPERTIES)
+        self.sc.setJobGroup(group, 'pipeline step %s' % name)
+        start = time.time()
+        try:
+            yield result
+        finally:
+            seconds = time.time() - start
+            jobIds.extend(self.sc.statusTracker().getJobIdsForGroup(group))
+            self._open.pop()
+            if self._open:
+                self._open[-1].extend(jobIds)
+            for key, value in previous.items():
+                self.sc.setLocalProperty(key, value)
+        stageIds, tasks = self._stageIds(set(jobIds))
+        record = {'name': name, 'seconds': seconds, 'jobs': len(set(jobIds)),
+                  'stages': len(stageIds), 'tasks': tasks}
+        record.update(self._stageMetrics(stageIds))
+        record['taskSeconds'] = (record['taskMillis'] / 1000.0
+                                 if record['taskMillis'] is not None else None)
+        record['cachedBytes'] = self._cachedBytes()
+        record.update(result)
+        record['throughput'] = (record['records'] / seconds
+                                if record['records'] and seconds else None)
+        self.steps.append(record)
+
+    def instrument(self, name=None):
+        """ Decorator recording every call of a function as a step
+        Args:
+            name (str): name of the step, the function name by default
+        Returns:
+            function: the decorator
+        """
+        def decorate(function):
+            @wraps(function)
+            def instrumented(*args, **kwargs):
+                with self.step(name or function.__name__):
+                    return function(*args, **kwargs)
+            return instrumented
+        return decorate
+
+    def table(self):
+        """ The recorded steps as a text table
+        Returns:
+            str: one header line and one line per step
+        """
+        lines = []
+        for record in [None] + self.steps:
+            cells = []
+            for title, width, key, fmt in TABLE_COLUMNS:
+                if record is None:
+                    cell = title
+                elif fmt is None:
+                    cell = formatBytes(record.get(key))
+                else:
+                    cell = '-' if record.get(key) is None else fmt % record[key]
+                cells.append(cell.ljust(width) if key == 'name' else cell.rjust(width))
+            lines.append(' '.join(cells))
+        return '\n'.join(lines)
+
+    def printTable(self):
+        """ Print the recorded steps as a table """
+        print(self.table())
+
+    def writeJSON(self, filename, **metadata):
+        """ Write the recorded steps as JSON
+        Args:
+            filename (str): output path
+            metadata: extra top-level values of the document, e.g. commit='abc1234'
+        """
+        document = dict(metadata)
+        document['steps'] = self.steps
+        with open(filename, 'w') as outputFile:
+            json.dump(document, outputFile, indent=2, sort_keys=True)